@@ -0,0 +1,122 @@
+# Аналитика продаж velomagazin: запросы к сводкам, которые триггеры миграции 3 пополняют
+# при каждом заказе. Отчёты за любой период читают сводки, а не строки заказов.
+# Даты - строки 'YYYY-MM-DD', месяцы - 'YYYY-MM'; границы периода включительно, None - без ограничения.
+# Выручка - в копейках.
+import sqlite3
+from typing import NamedTuple
+
+from velomagazin import ROLLUP_REBUILD_SQL
+
+DAILY_SQL = "SELECT day, orders, units, revenue FROM ПродажиПоДням WHERE day BETWEEN ? AND ? ORDER BY day"
+
+MONTHLY_SQL = '''
+    SELECT substr(day, 1, 7), sum(orders), sum(units), sum(revenue)
+    FROM ПродажиПоДням WHERE day BETWEEN ? AND ?
+    GROUP BY 1 ORDER BY 1
+'''
+
+TOTALS_SQL = '''
+    SELECT coalesce(sum(orders), 0), coalesce(sum(units), 0), coalesce(sum(revenue), 0)
+    FROM ПродажиПоДням WHERE day BETWEEN ? AND ?
+'''
+
+# {by} - revenue или units
+TOP_ITEMS_SQL = '''
+    SELECT item_type, item_id, sum(units) AS units, sum(revenue) AS revenue
+    FROM ПродажиТоваровПоМесяцам WHERE month BETWEEN ? AND ?
+    GROUP BY item_type, item_id
+    ORDER BY {by} DESC LIMIT ?
+'''
+
+TOP_CUSTOMERS_SQL = '''
+    SELECT user_id, sum(orders), sum(units), sum(revenue) AS revenue
+    FROM ПокупкиПоМесяцам WHERE month BETWEEN ? AND ?
+    GROUP BY user_id
+    ORDER BY revenue DESC LIMIT ?
+'''
+
+CUSTOMER_TOTALS_SQL = '''
+    SELECT ?, coalesce(sum(orders), 0), coalesce(sum(units), 0), coalesce(sum(revenue), 0)
+    FROM ПокупкиПоМесяцам WHERE month BETWEEN ? AND ? AND user_id = ?
+'''
+
+# Запросы отчётов для check_query_plans (python bench.py plans)
+ANALYTICS_QUERIES = [DAILY_SQL, MONTHLY_SQL, TOTALS_SQL, TOP_ITEMS_SQL.format(by='revenue'), TOP_CUSTOMERS_SQL,
+                     CUSTOMER_TOTALS_SQL]
+
+
+class SalesPeriod(NamedTuple):
+    period: str
+    orders: int
+    units: int
+    revenue: int
+
+
+class ItemSales(NamedTuple):
+    item_type: str
+    item_id: int
+    units: int
+    revenue: int
+
+
+class CustomerSales(NamedTuple):
+    user_id: int
+    orders: int
+    units: int
+    revenue: int
+
+
+class SalesAnalytics:
+    def __init__(self, shop):
+        # shop - экземпляр velomagazin (ядро), чьё соединение используется для запросов
+        self.conn = shop.conn
+
+    def daily(self, start=None, end=None):
+        # Выручка, заказы и штуки по дням
+        cursor = self.conn.cursor()
+        cursor.execute(DAILY_SQL, (start or '', end or '9999'))
+        return [SalesPeriod(*row) for row in cursor.fetchall()]
+
+    def monthly(self, start=None, end=None):
+        # То же по месяцам start..end ('YYYY-MM'): не больше 31 строки дневной сводки на месяц
+        cursor = self.conn.cursor()
+        cursor.execute(MONTHLY_SQL, (start or '', (end or '9999') + '-99'))
+        return [SalesPeriod(*row) for row in cursor.fetchall()]
+
+    def totals(self, start=None, end=None):
+        # Итог за период по дням start..end одной строкой
+        cursor = self.conn.cursor()
+        cursor.execute(TOTALS_SQL, (start or '', end or '9999'))
+        return SalesPeriod(f"{start or '...'} - {end or '...'}", *cursor.fetchone())
+
+    def top_items(self, start=None, end=None, limit=10, by='revenue'):
+        # Самые продаваемые товары за месяцы start..end по выручке или штукам
+        if by not in ('revenue', 'units'):
+            raise ValueError(f"Неизвестный показатель: {by}")
+        cursor = self.conn.cursor()
+        cursor.execute(TOP_ITEMS_SQL.format(by=by), (start or '', end or '9999', limit))
+        return [ItemSales(*row) for row in cursor.fetchall()]
+
+    def top_customers(self, start=None, end=None, limit=10):
+        # Покупатели с наибольшей суммой покупок за месяцы start..end
+        cursor = self.conn.cursor()
+        cursor.execute(TOP_CUSTOMERS_SQL, (start or '', end or '9999', limit))
+        return [CustomerSales(*row) for row in cursor.fetchall()]
+
+    def customer_totals(self, user_id, start=None, end=None):
+        # Итог покупок одного пользователя за месяцы start..end
+        cursor = self.conn.cursor()
+        cursor.execute(CUSTOMER_TOTALS_SQL, (user_id, start or '', end or '9999', user_id))
+        return CustomerSales(*cursor.fetchone())
+
+    def rebuild(self):
+        # Полный пересчёт сводок по истории заказов (после ручной правки Заказы/ДеталиЗаказа)
+        cursor = self.conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            for statement in ROLLUP_REBUILD_SQL:
+                cursor.execute(statement)
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
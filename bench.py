@@ -0,0 +1,927 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import subprocess
+import sqlite3
+import sys
+import threading
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from analytics import ANALYTICS_QUERIES, SalesAnalytics
+from ledger import LEDGER_QUERIES, LedgerReconciler
+from replenishment import ReplenishmentReport
+from velomagazin import (ITEM_TYPE_CODES, LOOKUP_QUERIES, ORDER_LINE_INSERT_SQL, PRAGMA_PROFILES, AsyncVelomagazin, AuthenticationError,
+                         Authenticator, ConnectionPool, HoldExpiryScheduler, PasswordHasher, QueryMetrics, RateLimitError,
+                         SessionStore, ShopService, format_rubles, velomagazin)
+
+
+def make_shop(tmpdir, bikes=1000, parts=5000, stock=10**9):
+    # Создание временной базы с каталогом для замеров
+    shop = velomagazin(os.path.join(tmpdir, 'bench.db'))
+    with shop.conn:
+        shop.conn.executemany("INSERT INTO Велосипеды (model, brand, price, quantity) VALUES (?, ?, ?, ?)",
+                              [(f'Модель {i}', f'Бренд {i % 50}', 10000 + i, stock) for i in range(bikes)])
+        shop.conn.executemany("INSERT INTO Запчасти (name, category, price, quantity) VALUES (?, ?, ?, ?)",
+                              [(f'Запчасть {i}', f'Категория {i % 40}', 100 + i, stock) for i in range(parts)])
+    return shop
+
+
+def random_orders(count, bikes=1000, parts=5000, lines=5, seed=1):
+    # Генерация заказов из нескольких случайных позиций
+    rnd = random.Random(seed)
+    orders = []
+    for _ in range(count):
+        items = []
+        for _ in range(lines):
+            if rnd.random() < 0.2:
+                items.append((rnd.randint(1, bikes), 'Велосипед', 1))
+            else:
+                items.append((rnd.randint(1, parts), 'Запчасть', rnd.randint(1, 3)))
+        orders.append(items)
+    return orders
+
+
+def legacy_complete_order(shop, user_id, items):
+    # Прежний путь оформления: SELECT и UPDATE на каждую позицию в отдельных транзакциях
+    order_total = 0
+    for item_id, item_type, quantity in items:
+        inventory_type = 'Велосипеды' if item_type == 'Велосипед' else 'Запчасти'
+        id_column = 'bike_id' if item_type == 'Велосипед' else 'part_id'
+        with shop.conn:
+            cursor = shop.conn.cursor()
+            cursor.execute(f"SELECT price, quantity FROM {inventory_type} WHERE {id_column}=?", (item_id,))
+            result = cursor.fetchone()
+        if result:
+            item_price, available_quantity = result
+            order_total += item_price * quantity
+            with shop.conn:
+                cursor = shop.conn.cursor()
+                cursor.execute(f"UPDATE {inventory_type} SET quantity=? WHERE {id_column}=?",
+                               (available_quantity - quantity, item_id))
+    with shop.conn:
+        cursor = shop.conn.cursor()
+        cursor.execute("INSERT INTO Заказы (user_id, order_date) VALUES (?, ?)",
+                       (user_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        order_id = cursor.lastrowid
+        for item_id, item_type, quantity in items:
+            cursor.execute("INSERT INTO ДеталиЗаказа (order_id, item_id, item_type, quantity) VALUES (?, ?, ?, ?)",
+                           (order_id, item_id, item_type, quantity))
+    return order_id
+
+
+def bench_checkout(orders=2000, lines=5):
+    # Заказов в секунду: прежний путь против атомарного checkout
+    results = {}
+    for name in ('legacy', 'checkout'):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shop = make_shop(tmpdir)
+            batch = random_orders(orders, lines=lines)
+            started = time.perf_counter()
+            for items in batch:
+                if name == 'legacy':
+                    legacy_complete_order(shop, 1, items)
+                else:
+                    shop.checkout(1, items)
+            elapsed = time.perf_counter() - started
+            shop.close_connection()
+        results[name] = orders / elapsed
+        print(f"{name:10} {orders / elapsed:10.1f} заказов/с")
+    return results
+
+
+def bench_import(rows=200000, chunk_size=5000):
+    # Строк в секунду: add_bike_part по одной строке против import_parts и загрузки CSV
+    catalogue = [(f'Запчасть {i}', f'Категория {i % 40}', 100 + i % 900, i % 50) for i in range(rows)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shop = velomagazin(os.path.join(tmpdir, 'single.db'))
+        sample = catalogue[:min(rows, 2000)]
+        started = time.perf_counter()
+        for name, category, price, quantity in sample:
+            shop.save_part_to_database(name, category, price, quantity)
+        results['single'] = len(sample) / (time.perf_counter() - started)
+        shop.close_connection()
+
+        shop = velomagazin(os.path.join(tmpdir, 'bulk.db'))
+        started = time.perf_counter()
+        shop.import_parts(catalogue, chunk_size=chunk_size)
+        results['import'] = rows / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        shop.import_parts(catalogue, chunk_size=chunk_size, upsert=True)
+        results['upsert'] = rows / (time.perf_counter() - started)
+        shop.close_connection()
+
+        path = os.path.join(tmpdir, 'parts.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(('name', 'category', 'price', 'quantity'))
+            # В файле цены в рублях, как в выгрузках каталога
+            writer.writerows((name, category, format_rubles(price), quantity) for name, category, price, quantity in catalogue)
+        shop = velomagazin(os.path.join(tmpdir, 'csv.db'))
+        started = time.perf_counter()
+        shop.import_catalogue_file(path, 'Запчасть', chunk_size=chunk_size)
+        results['csv'] = rows / (time.perf_counter() - started)
+        shop.close_connection()
+
+    for name, rate in results.items():
+        print(f"{name:10} {rate:12.1f} строк/с")
+    return results
+
+
+def percentile(samples, fraction):
+    # Перцентиль по отсортированной выборке (ближайший ранг)
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_profiles(commits=500, seconds=2.0, readers=3):
+    # Задержка commit и параллельная работа читателей и писателя для каждого профиля соединения
+    results = {}
+    for profile in PRAGMA_PROFILES:
+        # Реплика только читает, писатель для неё работает в профиле fast
+        writer_profile = 'fast' if profile == 'readonly-replica' else profile
+        with tempfile.TemporaryDirectory() as tmpdir:
+            make_shop(tmpdir).close_connection()
+            path = os.path.join(tmpdir, 'bench.db')
+
+            shop = velomagazin(path, profile=writer_profile)
+            latencies = []
+            for i in range(commits):
+                started = time.perf_counter()
+                shop.save_part_to_database(f'Замер {i}', 'Замер', 1, 1)
+                latencies.append(time.perf_counter() - started)
+            shop.close_connection()
+
+            counters = {'reads': 0, 'writes': 0, 'errors': 0}
+            lock = threading.Lock()
+            deadline = time.perf_counter() + seconds
+
+            def reader():
+                replica = velomagazin(path, profile=profile)
+                rnd = random.Random()
+                done = 0
+                while time.perf_counter() < deadline:
+                    replica.conn.execute("SELECT price, quantity FROM Запчасти WHERE part_id=?",
+                                         (rnd.randint(1, 5000),)).fetchone()
+                    done += 1
+                replica.close_connection()
+                with lock:
+                    counters['reads'] += done
+
+            def writer():
+                primary = velomagazin(path, profile=writer_profile)
+                rnd = random.Random()
+                done = errors = 0
+                while time.perf_counter() < deadline:
+                    try:
+                        primary.checkout(1, [(rnd.randint(1, 5000), 'Запчасть', 1)])
+                        done += 1
+                    except sqlite3.OperationalError:
+                        errors += 1
+                primary.close_connection()
+                with lock:
+                    counters['writes'] += done
+                    counters['errors'] += errors
+
+            threads = [threading.Thread(target=reader) for _ in range(readers)] + [threading.Thread(target=writer)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        results[profile] = {
+            'commit_p50_ms': percentile(latencies, 0.5) * 1000,
+            'commit_p99_ms': percentile(latencies, 0.99) * 1000,
+            'reads_per_sec': counters['reads'] / seconds,
+            'writes_per_sec': counters['writes'] / seconds,
+            'errors': counters['errors'],
+        }
+        print(f"{profile:17} commit p50 {results[profile]['commit_p50_ms']:7.3f} мс, "
+              f"p99 {results[profile]['commit_p99_ms']:7.3f} мс, "
+              f"чтений {results[profile]['reads_per_sec']:10.1f}/с, "
+              f"заказов {results[profile]['writes_per_sec']:8.1f}/с, ошибок {counters['errors']}")
+    return results
+
+
+def bench_cashiers(cashiers=8, orders_per_cashier=200):
+    # Нагрузочный тест: N кассиров в ThreadPoolExecutor поверх пула соединений и ShopService
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_shop(tmpdir).close_connection()
+        pool = ConnectionPool(os.path.join(tmpdir, 'bench.db'))
+        service = ShopService(pool)
+        terms = ['Модель 1', 'Бренд', 'Запчасть 4', 'Категория 3']
+        # Каждый кассир работает в своём сеансе; регистрация и вход (KDF) - до замера
+        sessions = {}
+        for number in range(1, cashiers + 1):
+            service.register_user(f'кассир{number}', 'пароль')
+            sessions[number] = service.login_user(f'кассир{number}', 'пароль')
+
+        def cashier(number):
+            rnd = random.Random(number)
+            session = sessions[number]
+            latencies = []
+            for items in random_orders(orders_per_cashier, seed=number):
+                started = time.perf_counter()
+                service.search_items(rnd.choice(terms))
+                service.view_bikes(page_size=20)
+                order_id, order_total, failures = service.complete_order(session.token, items)
+                if order_id is not None:
+                    service.add_transaction(session.user_id, order_total)
+                latencies.append(time.perf_counter() - started)
+            return latencies
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=cashiers) as executor:
+            latencies = [latency for result in executor.map(cashier, range(1, cashiers + 1)) for latency in result]
+        elapsed = time.perf_counter() - started
+        cache_stats = pool.cache.stats()
+        pool.close()
+
+    result = {
+        'cashiers': cashiers,
+        'orders_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'cache_hit_rate': cache_stats['hit_rate'],
+    }
+    print(f"{cashiers} кассиров: {result['orders_per_sec']:.1f} заказов/с, "
+          f"p50 {result['p50_ms']:.2f} мс, p99 {result['p99_ms']:.2f} мс, "
+          f"попаданий в кэш {result['cache_hit_rate']:.0%}")
+    return result
+
+
+def bench_async(clients=200, requests_per_client=10, max_workers=8):
+    # Локальный генератор нагрузки: сотни асинхронных клиентов на одном цикле событий, p50/p99 задержки
+    async def client(shop, number, token, latencies):
+        rnd = random.Random(number)
+        for items in random_orders(requests_per_client, lines=2, seed=number):
+            started = time.perf_counter()
+            if rnd.random() < 0.5:
+                await shop.search_items(rnd.choice(['Модель', 'Бренд 7', 'Запчасть 1']))
+            else:
+                order_id, order_total, _ = await shop.complete_order(token, items)
+                await shop.view_orders(token)
+            latencies.append(time.perf_counter() - started)
+
+    async def run(pool):
+        shop = AsyncVelomagazin(pool, max_workers=max_workers)
+        # Регистрация и вход (KDF на каждого клиента) - до замера, чтобы мерить только запросы
+        await asyncio.gather(*(shop.register_user(f'клиент{number}', 'пароль') for number in range(clients)))
+        sessions = await asyncio.gather(*(shop.login_user(f'клиент{number}', 'пароль') for number in range(clients)))
+        latencies = []
+        started = time.perf_counter()
+        await asyncio.gather(*(client(shop, number, session.token, latencies) for number, session in enumerate(sessions)))
+        elapsed = time.perf_counter() - started
+        shop.close()
+        return latencies, elapsed
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_shop(tmpdir).close_connection()
+        pool = ConnectionPool(os.path.join(tmpdir, 'bench.db'))
+        latencies, elapsed = asyncio.run(run(pool))
+        pool.close()
+
+    result = {
+        'clients': clients,
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+    print(f"{clients} клиентов: {result['requests_per_sec']:.1f} запросов/с, "
+          f"p50 {result['p50_ms']:.2f} мс, p99 {result['p99_ms']:.2f} мс")
+    return result
+
+
+def bench_startup(runs=20):
+    # Время импорта ядра и интерактивного модуля (в новом процессе) и создания velomagazin
+    results = {}
+    here = os.path.dirname(os.path.abspath(__file__))
+    for module in ('velomagazin', 'ночнойбредвелосепедиста'):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, '-c', f'import {module}'], cwd=here, check=True)
+            timings.append(time.perf_counter() - started)
+        baseline = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, '-c', 'pass'], cwd=here, check=True)
+            baseline.append(time.perf_counter() - started)
+        results[f'import_{module}_ms'] = (percentile(timings, 0.5) - percentile(baseline, 0.5)) * 1000
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        timings = []
+        for i in range(runs):
+            started = time.perf_counter()
+            velomagazin(os.path.join(tmpdir, f'new{i}.db')).close_connection()
+            timings.append(time.perf_counter() - started)
+        results['open_new_db_ms'] = percentile(timings, 0.5) * 1000
+
+        path = os.path.join(tmpdir, 'new0.db')
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            velomagazin(path).close_connection()
+            timings.append(time.perf_counter() - started)
+        results['open_existing_db_ms'] = percentile(timings, 0.5) * 1000
+
+    for name, value in results.items():
+        print(f"{name:45} {value:8.2f}")
+    return results
+
+
+def bench_loader(rows=1000000):
+    # Время и пиковая память загрузки каталога: словари на строку против записей со __slots__ и столбцов
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shop = make_shop(tmpdir, bikes=0, parts=rows, stock=10)
+
+        def load_dicts():
+            cursor = shop.conn.cursor()
+            cursor.execute("SELECT * FROM Запчасти")
+            return {row[0]: {'name': row[1], 'category': row[2], 'price': row[3], 'quantity': row[4]}
+                    for row in cursor.fetchall()}
+
+        loaders = {
+            'dicts': load_dicts,
+            'slots': lambda: dict(shop.load_from_database('Запчасти')),
+            'columns': lambda: shop.load_columns('Запчасти', ('price', 'quantity')),
+        }
+        for name, loader in loaders.items():
+            # Время и память меряются в разных прогонах: tracemalloc сам замедляет выделения
+            started = time.perf_counter()
+            loaded = loader()
+            elapsed = time.perf_counter() - started
+            del loaded
+            tracemalloc.start()
+            loaded = loader()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            del loaded
+            results[name] = (elapsed, peak)
+            print(f"{name:10} {elapsed:8.2f} с  {peak / 2**20:10.1f} МиБ пик")
+        shop.close_connection()
+    return results
+
+
+def make_history(shop, orders, lines=3, days=3 * 365, ledger=False):
+    # История заказов за days дней в хронологическом порядке (и проводки по ним, если ledger)
+    rnd = random.Random(1)
+    first_day = datetime(2022, 1, 1).toordinal()
+    order_days = sorted(rnd.randrange(days) for _ in range(orders))
+    started = time.perf_counter()
+    with shop.conn:
+        for order_id, (items, day) in enumerate(zip(random_orders(orders, lines=lines), order_days), 1):
+            user_id = rnd.randint(1, 5000)
+            order_date = datetime.fromordinal(first_day + day).strftime("%Y-%m-%d 12:00:00")
+            shop.conn.execute("INSERT INTO Заказы (order_id, user_id, order_date) VALUES (?, ?, ?)",
+                              (order_id, user_id, order_date))
+            shop.conn.executemany("INSERT INTO ДеталиЗаказа (order_id, item_id, item_type, quantity, unit_price) "
+                                  "VALUES (?, ?, ?, ?, ?)",
+                                  [(order_id, item_id, item_type, quantity, 10000) for item_id, item_type, quantity in items])
+            if ledger:
+                shop.conn.execute("INSERT INTO Транзакции (user_id, amount, transaction_date, order_id) VALUES (?, ?, ?, ?)",
+                                  (user_id, 10000 * sum(quantity for _, _, quantity in items), order_date, order_id))
+    print(f"загрузка истории {time.perf_counter() - started:8.2f} с ({orders} заказов)")
+
+
+def bench_analytics(orders=200000, lines=3):
+    # Отчёт за всю историю: сканирование строк заказов против чтения сводок продаж
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shop = make_shop(tmpdir)
+        make_history(shop, orders, lines)
+
+        scans = {
+            'months': '''SELECT substr(o.order_date, 1, 7), count(DISTINCT o.order_id), sum(d.quantity), sum(d.quantity * d.unit_price)
+                         FROM Заказы o JOIN ДеталиЗаказа d ON d.order_id = o.order_id GROUP BY 1''',
+            'top_items': '''SELECT item_type, item_id, sum(quantity * unit_price) AS revenue FROM ДеталиЗаказа
+                            GROUP BY 1, 2 ORDER BY revenue DESC LIMIT 10''',
+            'top_customers': '''SELECT o.user_id, sum(d.quantity * d.unit_price) AS revenue
+                                FROM Заказы o JOIN ДеталиЗаказа d ON d.order_id = o.order_id
+                                GROUP BY 1 ORDER BY revenue DESC LIMIT 10''',
+        }
+        analytics = SalesAnalytics(shop)
+        rollups = {'months': analytics.monthly, 'top_items': analytics.top_items, 'top_customers': analytics.top_customers}
+        results = {}
+        for name, query in scans.items():
+            started = time.perf_counter()
+            shop.conn.execute(query).fetchall()
+            scanned = time.perf_counter() - started
+            started = time.perf_counter()
+            rollups[name]()
+            rolled = time.perf_counter() - started
+            results[name] = (scanned, rolled)
+            print(f"{name:14} скан {scanned * 1000:9.1f} мс   сводки {rolled * 1000:9.1f} мс")
+        shop.close_connection()
+    return results
+
+
+def bench_reconcile(orders=200000, lines=3):
+    # Сверка проводок: первый полный проход, повтор без изменений и повтор после правки одной проводки
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shop = make_shop(tmpdir)
+        make_history(shop, orders, lines, ledger=True)
+        reconciler = LedgerReconciler(shop)
+        for name in ('full', 'unchanged', 'one_edit'):
+            if name == 'one_edit':
+                shop.set_transaction_amount(orders // 2, 1)
+            started = time.perf_counter()
+            report = reconciler.reconcile()
+            results[name] = time.perf_counter() - started
+            print(f"{name:10} {results[name] * 1000:9.1f} мс  месяцев сверено {len(report.checked):3}, "
+                  f"заказов {report.orders:7}, расхождений {len(report.mismatches)}")
+        shop.close_connection()
+    return results
+
+
+def bench_logins(logins=50, users=20):
+    # Входов в секунду на одно ядро (один поток): KDF при каждом входе против кэша проверенных паролей,
+    # и сколько проверок KDF успевает сделать перебор паролей при ограничении попыток
+    hashers = {
+        'scrypt': PasswordHasher('scrypt'),
+        'pbkdf2': PasswordHasher('pbkdf2_sha256'),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, hasher in hashers.items():
+            shop = velomagazin(os.path.join(tmpdir, f'{name}.db'), auth=Authenticator(hasher))
+            for i in range(users):
+                shop.create_user(f'user{i}', f'пароль{i}')
+            started = time.perf_counter()
+            for i in range(logins):
+                shop.auth.credentials.forget(f'user{i % users}')
+                shop.authenticate(f'user{i % users}', f'пароль{i % users}')
+            results[f'{name} kdf'] = logins / (time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for i in range(logins * 200):
+                shop.authenticate(f'user{i % users}', f'пароль{i % users}')
+            results[f'{name} cached'] = logins * 200 / (time.perf_counter() - started)
+            shop.close_connection()
+
+        shop = velomagazin(os.path.join(tmpdir, 'bruteforce.db'))
+        shop.create_user('victim', 'верный пароль')
+        attempts = rejected = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < 1.0:
+            attempts += 1
+            try:
+                shop.authenticate('victim', f'подбор {attempts}')
+            except RateLimitError:
+                rejected += 1
+            except AuthenticationError:
+                pass
+        shop.close_connection()
+
+    for name, rate in results.items():
+        print(f"{name:14} {rate:12.1f} входов/с")
+    print(f"перебор за 1 с: попыток {attempts}, отклонено до KDF {rejected}, проверок KDF {attempts - rejected}")
+    return results
+
+
+def bench_sessions(sessions=100000, lookups=200000):
+    # Сеансы тысяч клиентов в одном процессе: открытие и проверка токена в памяти и с сохранением в SQLite
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, db_path in (('memory', None), ('sqlite', os.path.join(tmpdir, 'sessions.db'))):
+            store = SessionStore(maxsize=sessions, db_path=db_path)
+            started = time.perf_counter()
+            tokens = [store.create(user_id).token for user_id in range(sessions)]
+            created = sessions / (time.perf_counter() - started)
+            rnd = random.Random(1)
+            started = time.perf_counter()
+            for _ in range(lookups):
+                store.get(rnd.choice(tokens))
+            checked = lookups / (time.perf_counter() - started)
+            store.close()
+            results[name] = (created, checked)
+            print(f"{name:8} открытие {created:10.1f} сеансов/с   проверка {checked:10.1f} токенов/с")
+    return results
+
+
+def bench_holds(holds=200000, lookups=5000):
+    # Доступный остаток при большом числе броней: сумма по индексу против полного просмотра таблицы броней,
+    # и время фоновой очистки истёкших броней пачками
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shop = make_shop(tmpdir)
+        rnd = random.Random(1)
+        now = time.time()
+        with shop.conn:
+            shop.conn.executemany("INSERT INTO Брони (hold_id, item_type, item_id, quantity, expires_at) VALUES (?, ?, ?, ?, ?)",
+                                  [(f'корзина {i // 5}', 'Запчасть', rnd.randint(1, 5000), 1,
+                                    now + 600 if i % 2 else now - 1) for i in range(holds)])
+        ids = [rnd.randint(1, 5000) for _ in range(lookups)]
+
+        started = time.perf_counter()
+        for item_id in ids:
+            shop.available_quantities('Запчасть', [item_id])
+        results['indexed'] = lookups / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for item_id in ids[:lookups // 50]:
+            shop.conn.execute("SELECT coalesce(sum(quantity), 0) FROM Брони NOT INDEXED "
+                              "WHERE item_type = ? AND item_id = ? AND expires_at > ?", ('Запчасть', item_id, now)).fetchone()
+        results['scan'] = lookups // 50 / (time.perf_counter() - started)
+
+        scheduler = HoldExpiryScheduler(os.path.join(tmpdir, 'bench.db'))
+        started = time.perf_counter()
+        released = scheduler.run_once(shop)
+        results['expiry'] = released / (time.perf_counter() - started)
+        shop.close_connection()
+
+    print(f"остаток по индексу {results['indexed']:10.1f} запросов/с")
+    print(f"остаток просмотром {results['scan']:10.1f} запросов/с")
+    print(f"очистка броней     {results['expiry']:10.1f} строк/с ({released} истёкших)")
+    return results
+
+
+def bench_history(orders=5000, lines=3, page_size=20):
+    # История заказов покупателя с тысячами заказов: N+1 запросов (заказы, строки каждого заказа,
+    # название каждого товара) против order_history - два запроса на страницу
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shop = make_shop(tmpdir)
+        with shop.conn:
+            for order_id, items in enumerate(random_orders(orders, lines=lines), 1):
+                shop.conn.execute("INSERT INTO Заказы (order_id, user_id, order_date) VALUES (?, ?, ?)",
+                                  (order_id, 1, f"2024-{order_id % 12 + 1:02}-{order_id % 28 + 1:02} 12:{order_id % 60:02}:00"))
+                shop.conn.executemany("INSERT INTO ДеталиЗаказа (order_id, item_id, item_type, quantity, unit_price) "
+                                      "VALUES (?, ?, ?, ?, ?)",
+                                      [(order_id, item_id, item_type, quantity, 10000) for item_id, item_type, quantity in items])
+
+        def n_plus_one():
+            cursor = shop.conn.cursor()
+            history = []
+            for order_id, order_date in shop.list_orders(1):
+                cursor.execute("SELECT item_id, item_type, quantity, unit_price FROM ДеталиЗаказа WHERE order_id=?", (order_id,))
+                order_lines = []
+                for item_id, item_type, quantity, unit_price in cursor.fetchall():
+                    table, id_column = ('Велосипеды', 'bike_id') if item_type == 'Велосипед' else ('Запчасти', 'part_id')
+                    title_column = 'model' if item_type == 'Велосипед' else 'name'
+                    title = shop.conn.execute(f"SELECT {title_column} FROM {table} WHERE {id_column}=?", (item_id,)).fetchone()
+                    order_lines.append((item_type, item_id, title, quantity, unit_price))
+                history.append((order_id, order_date, order_lines))
+            return history
+
+        results = {}
+        started = time.perf_counter()
+        n_plus_one()
+        results['n+1 all'] = time.perf_counter() - started
+        started = time.perf_counter()
+        sum(len(page) for page in shop.iter_order_history(1, page_size=page_size))
+        results['history all'] = time.perf_counter() - started
+        started = time.perf_counter()
+        shop.order_history(1, limit=page_size)
+        results['history page'] = time.perf_counter() - started
+        started = time.perf_counter()
+        shop.order_history(1, '2024-03-01', '2024-03-31', limit=page_size)
+        results['history month'] = time.perf_counter() - started
+        shop.close_connection()
+
+    for name, elapsed in results.items():
+        print(f"{name:14} {elapsed * 1000:9.2f} мс")
+    return results
+
+
+def bench_write_behind(writers=4, writes_per_writer=500, max_batch=256, max_delay=0.01):
+    # Проводки в профиле durable: commit на каждую запись против очереди отложенной записи с групповым
+    # commit. Задержка - от вызова до фиксации на диске (для очереди - до колбэка)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        make_shop(tmpdir, bikes=10, parts=10).close_connection()
+        path = os.path.join(tmpdir, 'bench.db')
+        for mode in ('immediate', 'write-behind'):
+            latencies = []
+            lock = threading.Lock()
+            shared = velomagazin(path, profile='durable', check_same_thread=False)
+            if mode == 'write-behind':
+                queue = shared.enable_write_behind(max_batch, max_delay)
+
+            def writer():
+                if mode == 'immediate':
+                    shop = velomagazin(path, profile='durable')
+                    for i in range(writes_per_writer):
+                        started = time.perf_counter()
+                        shop.create_transaction(1, i)
+                        with lock:
+                            latencies.append(time.perf_counter() - started)
+                    shop.close_connection()
+                    return
+                for i in range(writes_per_writer):
+                    started = time.perf_counter()
+
+                    def durable(result, error, started=started):
+                        with lock:
+                            latencies.append(time.perf_counter() - started)
+                    shared.create_transaction(1, i, callback=durable)
+
+            started = time.perf_counter()
+            threads = [threading.Thread(target=writer) for _ in range(writers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            shared.close_connection()
+            elapsed = time.perf_counter() - started
+            results[mode] = {
+                'writes_per_sec': len(latencies) / elapsed,
+                'p50_ms': percentile(latencies, 0.5) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000,
+            }
+            print(f"{mode:13} {results[mode]['writes_per_sec']:9.1f} записей/с, "
+                  f"p50 {results[mode]['p50_ms']:8.3f} мс, p99 {results[mode]['p99_ms']:8.3f} мс"
+                  + (f", пачек {queue.batches}" if mode == 'write-behind' else ''))
+    return results
+
+
+def bench_batch(items=20000, legacy_items=50):
+    # Переоценка и снятие с продажи: прежний путь (выгрузка всей таблицы и перебор на каждый товар,
+    # затем UPDATE/DELETE в своей транзакции) против modify_items/delete_items одним executemany
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shop = make_shop(tmpdir, bikes=0, parts=items)
+        started = time.perf_counter()
+        for part_id in range(1, legacy_items + 1):
+            if any(item[0] == part_id for item in shop.load_from_database('Запчасти')):
+                shop.modify_part_in_database(part_id, f'Запчасть {part_id}', 'Распродажа', 5000, 10)
+        results['legacy modify'] = legacy_items / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        missing = shop.modify_items([{'item_type': 'Запчасть', 'item_id': part_id, 'price': 7500}
+                                     for part_id in range(1, items + 11)])
+        results['modify_items'] = items / (time.perf_counter() - started)
+        assert len(missing) == 10
+
+        started = time.perf_counter()
+        shop.delete_items([('Запчасть', part_id) for part_id in range(1, items + 1)])
+        results['delete_items'] = items / (time.perf_counter() - started)
+        shop.close_connection()
+
+    for name, rate in results.items():
+        print(f"{name:14} {rate:12.1f} товаров/с")
+    return results
+
+
+def bench_instrumentation(orders=2000, lines=5, lookups=20000):
+    # Цена метрик SQL: оформление заказов и точечные выборки без метрик, с метриками и с местами вызова
+    results = {}
+    for mode in ('off', 'metrics', 'sites'):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            shop = make_shop(tmpdir)
+            if mode != 'off':
+                shop.instrument(QueryMetrics(track_sites=mode == 'sites'))
+            batch = random_orders(orders, lines=lines)
+            started = time.perf_counter()
+            for items in batch:
+                shop.checkout(1, items)
+            checkout = orders / (time.perf_counter() - started)
+            rnd = random.Random(1)
+            started = time.perf_counter()
+            for _ in range(lookups):
+                shop.conn.execute("SELECT price, quantity FROM Запчасти WHERE part_id=?", (rnd.randint(1, 5000),)).fetchone()
+            lookup = lookups / (time.perf_counter() - started)
+            shop.close_connection()
+        results[mode] = {'orders_per_sec': checkout, 'lookups_per_sec': lookup}
+        print(f"{mode:8} {checkout:10.1f} заказов/с   {lookup:10.1f} выборок/с")
+    return results
+
+
+# Доли строк синтетической базы по таблицам; в среднем 2.5 строки на заказ и одна проводка на заказ
+DATASET_SHARES = {
+    'users': 0.05,
+    'bikes': 0.01,
+    'parts': 0.04,
+    'orders': 0.2,
+    'lines': 0.5,
+    'transactions': 0.2,
+}
+
+
+def generate_dataset(path, rows=100000, seed=1, days=3 * 365, chunk_size=20000):
+    # Синтетическая база на rows строк всего (10 тыс. - 10 млн): пользователи, каталог, заказы
+    # за days дней в хронологическом порядке со строками по ценам каталога и проводки на сумму заказа.
+    # Пишется порциями по chunk_size заказов, каждая порция - одна транзакция; возвращает число строк по таблицам
+    counts = {name: max(1, int(rows * share)) for name, share in DATASET_SHARES.items()}
+    rnd = random.Random(seed)
+    shop = velomagazin(path, profile='fast')
+    password = PasswordHasher('pbkdf2_sha256', iterations=1).hash('пароль')
+    bike_prices = [rnd.randrange(1500000, 30000000, 100) for _ in range(counts['bikes'])]
+    part_prices = [rnd.randrange(5000, 2000000, 10) for _ in range(counts['parts'])]
+    with shop.conn:
+        shop.conn.executemany("INSERT INTO Пользователи (username, password) VALUES (?, ?)",
+                              ((f'покупатель{i}', password) for i in range(counts['users'])))
+        shop.conn.executemany("INSERT INTO Велосипеды (model, brand, price, quantity, reorder_level) VALUES (?, ?, ?, ?, ?)",
+                              ((f'Модель {i}', f'Бренд {i % 50}', price, rnd.randrange(200), 5)
+                               for i, price in enumerate(bike_prices)))
+        shop.conn.executemany("INSERT INTO Запчасти (name, category, price, quantity, reorder_level) VALUES (?, ?, ?, ?, ?)",
+                              ((f'Запчасть {i} {("цепь", "седло", "шина", "педаль", "трос")[i % 5]}', f'Категория {i % 40}',
+                                price, rnd.randrange(1000), 20) for i, price in enumerate(part_prices)))
+
+    first_day = datetime(2022, 1, 1).toordinal()
+    orders = counts['orders']
+    lines_per_order = counts['lines'] / orders
+    order_days = sorted(rnd.randrange(days) for _ in range(orders))
+    counts['lines'] = 0
+    for start in range(0, orders, chunk_size):
+        order_rows, line_rows, posting_rows = [], [], []
+        for order_id in range(start + 1, min(orders, start + chunk_size) + 1):
+            user_id = rnd.randint(1, counts['users'])
+            order_date = datetime.fromordinal(first_day + order_days[order_id - 1]).strftime("%Y-%m-%d ") + \
+                f"{rnd.randrange(9, 21):02}:{rnd.randrange(60):02}:00"
+            total = 0
+            for _ in range(max(1, round(rnd.expovariate(1 / lines_per_order)))):
+                if rnd.random() < 0.2:
+                    item_type, item_id, quantity = 'Велосипед', rnd.randint(1, counts['bikes']), 1
+                    price = bike_prices[item_id - 1]
+                else:
+                    item_type, item_id, quantity = 'Запчасть', rnd.randint(1, counts['parts']), rnd.randint(1, 4)
+                    price = part_prices[item_id - 1]
+                line_rows.append((order_id, item_id, item_type, quantity, price, ITEM_TYPE_CODES[item_type], item_id))
+                total += price * quantity
+            order_rows.append((order_id, user_id, order_date))
+            posting_rows.append((user_id, total, order_date, order_id))
+        with shop.conn:
+            shop.conn.executemany("INSERT INTO Заказы (order_id, user_id, order_date) VALUES (?, ?, ?)", order_rows)
+            shop.conn.executemany(ORDER_LINE_INSERT_SQL, line_rows)
+            shop.conn.executemany("INSERT INTO Транзакции (user_id, amount, transaction_date, order_id) VALUES (?, ?, ?, ?)",
+                                  posting_rows)
+        counts['lines'] += len(line_rows)
+    shop.conn.execute('ANALYZE')
+    shop.close_connection()
+    return counts
+
+
+def timed(operations, run):
+    # Выполнение run(i) для i в range(operations); операций в секунду и перцентили задержки
+    latencies = []
+    started = time.perf_counter()
+    for i in range(operations):
+        call_started = time.perf_counter()
+        run(i)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    return {
+        'operations': operations,
+        'seconds': elapsed,
+        'ops_per_sec': operations / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def bench_scenarios(rows=100000, seed=1, operations=500):
+    # Сценарии на синтетической базе из generate_dataset: оформление заказа, поиск по каталогу,
+    # история заказов, пакетный импорт и отчёты бухгалтера - через методы velomagazin
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'scenarios.db')
+        started = time.perf_counter()
+        counts = generate_dataset(path, rows, seed)
+        results['dataset'] = dict(counts, rows=rows, seconds=time.perf_counter() - started,
+                                  bytes=os.path.getsize(path))
+        print(f"{'dataset':14} {results['dataset']['seconds']:9.2f} с  " +
+              ', '.join(f"{name} {count}" for name, count in counts.items()))
+
+        shop = velomagazin(path, profile='fast')
+        rnd = random.Random(seed)
+        bikes, parts, users = counts['bikes'], counts['parts'], counts['users']
+        terms = ['цепь', 'седло', 'шина', 'педаль', 'трос', 'Модель 1', 'Бренд 7', 'Категория 3']
+        scenarios = {
+            'checkout': lambda i: shop.checkout(
+                rnd.randint(1, users),
+                [(rnd.randint(1, parts), 'Запчасть', 1) for _ in range(rnd.randint(1, 4))] +
+                ([(rnd.randint(1, bikes), 'Велосипед', 1)] if rnd.random() < 0.2 else [])),
+            'search': lambda i: shop.search_catalogue(rnd.choice(terms)),
+            'history page': lambda i: shop.order_history(rnd.randint(1, users)),
+            'history month': lambda i: shop.order_history(rnd.randint(1, users), '2023-03-01', '2023-03-31'),
+            'item lookup': lambda i: shop.get_items('Запчасть', [rnd.randint(1, parts) for _ in range(10)]),
+        }
+        for name, run in scenarios.items():
+            results[name] = timed(operations, run)
+
+        catalogue = [(f'Импорт {i}', f'Категория {i % 40}', 10000 + i % 900, i % 50) for i in range(min(rows, 100000))]
+        results['import'] = timed(1, lambda i: shop.import_parts(catalogue, chunk_size=5000))
+        results['import']['rows_per_sec'] = len(catalogue) / results['import']['seconds']
+
+        analytics = SalesAnalytics(shop)
+        reports = {
+            'report monthly': analytics.monthly,
+            'report top items': analytics.top_items,
+            'report top customers': analytics.top_customers,
+            'report replenishment': lambda: sum(1 for _ in ReplenishmentReport(shop).lines()),
+            'report reconcile': lambda: LedgerReconciler(shop).reconcile(force=True),
+        }
+        for name, run in reports.items():
+            results[name] = timed(1, lambda i, run=run: run())
+        shop.close_connection()
+
+    for name, result in results.items():
+        if name != 'dataset':
+            print(f"{name:22} {result['ops_per_sec']:10.1f} оп/с, p50 {result['p50_ms']:9.3f} мс, "
+                  f"p99 {result['p99_ms']:9.3f} мс")
+    return results
+
+
+def compare_results(baseline, current, path=''):
+    # Изменение числовых показателей относительно прежнего запуска (JSON из --json): [(показатель, было, стало)]
+    changes = []
+    for key, value in current.items():
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        name = f"{path}.{key}" if path else key
+        if isinstance(value, dict):
+            changes += compare_results(old or {}, value, name)
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            changes.append((name, old, value))
+    return changes
+
+
+def check_plans():
+    # Проверка планов точечных запросов: код возврата 1, если хоть один сканирует таблицу
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shop = make_shop(tmpdir, bikes=100, parts=100)
+        shop.conn.execute('ANALYZE')
+        scans = shop.check_query_plans(LOOKUP_QUERIES + LEDGER_QUERIES + ANALYTICS_QUERIES)
+        shop.close_connection()
+    for query, detail in scans:
+        print(f"{detail}: {query}")
+    print("Планы запросов в порядке" if not scans else f"Сканирований таблиц: {len(scans)}")
+    return 1 if scans else 0
+
+
+BENCHMARKS = {
+    'checkout': bench_checkout,
+    'import': bench_import,
+    'profiles': bench_profiles,
+    'cashiers': bench_cashiers,
+    'async': bench_async,
+    'startup': bench_startup,
+    'loader': bench_loader,
+    'analytics': bench_analytics,
+    'reconcile': bench_reconcile,
+    'logins': bench_logins,
+    'sessions': bench_sessions,
+    'holds': bench_holds,
+    'history': bench_history,
+    'write-behind': bench_write_behind,
+    'batch': bench_batch,
+    'instrumentation': bench_instrumentation,
+    'scenarios': bench_scenarios,
+}
+
+
+def main(argv=None):
+    # python bench.py [замеры...] [--rows N] [--json файл] [--baseline файл]; без замеров - все,
+    # python bench.py plans - проверка планов запросов
+    parser = argparse.ArgumentParser(description='Замеры производительности velomagazin')
+    parser.add_argument('benchmarks', nargs='*', metavar='замер', help=f"plans или один из: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--rows', type=int, default=100000, help='строк синтетической базы для scenarios')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="записать результаты в JSON-файл ('-' - в stdout)")
+    parser.add_argument('--baseline', help='JSON прежнего запуска для сравнения')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS and args.benchmarks != ['plans']]
+    if unknown:
+        parser.error(f"неизвестные замеры: {', '.join(unknown)}")
+    if args.benchmarks == ['plans']:
+        return check_plans()
+
+    results = {}
+    # При --json - в stdout идёт только JSON, таблицы замеров и сравнение - в stderr
+    with redirect_stdout(sys.stderr if args.json == '-' else sys.stdout):
+        for name in args.benchmarks or BENCHMARKS:
+            print(f"== {name}", file=sys.stderr)
+            if name == 'scenarios':
+                results[name] = bench_scenarios(args.rows, args.seed)
+            else:
+                results[name] = BENCHMARKS[name]()
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+            for name, old, new in compare_results(baseline.get('results', {}), results):
+                print(f"{name:50} {old:14.3f} -> {new:14.3f} ({(new - old) / old * 100:+7.1f}%)")
+    report = {
+        'started_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'results': results,
+    }
+    if args.json == '-':
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
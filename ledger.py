@@ -0,0 +1,132 @@
+# Сверка заказов с бухгалтерскими проводками (Транзакции.order_id) по месяцам. Суммы - целые копейки
+# и сравниваются точно.
+# Заказы месяца и проводки из того же диапазона order_id читаются двумя курсорами в порядке
+# первичного ключа и сравниваются за один проход слиянием. Проводки, заказа которых нет вовсе
+# (удалён), находятся отдельным анти-соединением по дате проводки: у них нет заказа, по которому
+# их можно отнести к месяцу. Месяцы без расхождений отмечаются в СверкаПериодов; триггеры миграций
+# 4 и 11 снимают отметку при любом изменении месяца, поэтому повторная сверка проверяет только
+# изменившиеся периоды.
+import sqlite3
+from datetime import datetime
+from itertools import groupby
+from typing import NamedTuple
+
+# Суммы заказов месяца по строкам с ценой на момент продажи. Диапазон order_id месяца (ORDER_RANGE_SQL)
+# ведёт обход по первичному ключу: одна дата не даёт порядка по order_id без сортировки.
+# Параметры: первый и последний order_id, начало и конец месяца
+ORDER_TOTALS_SQL = '''
+    SELECT o.order_id, o.user_id, coalesce(sum(d.quantity * d.unit_price), 0)
+    FROM Заказы o LEFT JOIN ДеталиЗаказа d ON d.order_id = o.order_id
+    WHERE o.order_id BETWEEN ? AND ? AND o.order_date BETWEEN ? AND ?
+    GROUP BY o.order_id
+    ORDER BY o.order_id
+'''
+
+POSTINGS_SQL = '''
+    SELECT order_id, transaction_id, user_id, amount
+    FROM Транзакции WHERE order_id BETWEEN ? AND ?
+    ORDER BY order_id, transaction_id
+'''
+
+# Проводки месяца (по дате проводки), заказ которых не существует
+ORPHAN_POSTINGS_SQL = '''
+    SELECT t.order_id, t.transaction_id, t.amount
+    FROM Транзакции t
+    WHERE t.order_id IS NOT NULL AND t.transaction_date BETWEEN ? AND ?
+        AND NOT EXISTS (SELECT 1 FROM Заказы o WHERE o.order_id = t.order_id)
+    ORDER BY t.order_id, t.transaction_id
+'''
+
+# Границы order_id заказов месяца
+ORDER_RANGE_SQL = "SELECT min(order_id), max(order_id) FROM Заказы WHERE order_date BETWEEN ? AND ?"
+
+# Запросы сверки для check_query_plans (python bench.py plans)
+LEDGER_QUERIES = [ORDER_TOTALS_SQL, POSTINGS_SQL, ORPHAN_POSTINGS_SQL, ORDER_RANGE_SQL]
+
+
+class LedgerMismatch(NamedTuple):
+    period: str
+    order_id: int
+    transaction_id: int
+    expected: int
+    posted: int
+    reason: str
+
+
+class ReconciliationReport(NamedTuple):
+    checked: list
+    skipped: list
+    orders: int
+    mismatches: list
+
+
+class LedgerReconciler:
+    def __init__(self, shop):
+        # shop - экземпляр velomagazin (ядро); сверка пишет только отметки СверкаПериодов
+        self.conn = shop.conn
+
+    def periods(self):
+        # Месяцы, в которых есть заказы (по дневной сводке продаж, без обхода Заказы)
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT DISTINCT substr(day, 1, 7) FROM ПродажиПоДням ORDER BY 1")
+        return [row[0] for row in cursor.fetchall()]
+
+    def reconcile(self, periods=None, force=False):
+        # Сверка месяцев periods ('YYYY-MM', по умолчанию все); отмеченные чистыми пропускаются,
+        # если не указан force. Каждый месяц сверяется и отмечается в одной транзакции.
+        checkpoints = {row[0] for row in self.conn.execute("SELECT period FROM СверкаПериодов")}
+        checked, skipped, mismatches = [], [], []
+        orders = 0
+        cursor = self.conn.cursor()
+        for period in periods or self.periods():
+            if period in checkpoints and not force:
+                skipped.append(period)
+                continue
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                period_orders, period_mismatches = self._reconcile_period(period)
+                if period_mismatches:
+                    cursor.execute("DELETE FROM СверкаПериодов WHERE period=?", (period,))
+                else:
+                    cursor.execute("INSERT OR REPLACE INTO СверкаПериодов (period, orders, checked_at) VALUES (?, ?, ?)",
+                                   (period, period_orders, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+            checked.append(period)
+            orders += period_orders
+            mismatches += period_mismatches
+        return ReconciliationReport(checked, skipped, orders, mismatches)
+
+    def _reconcile_period(self, period):
+        # Слияние потока заказов месяца с потоком проводок по order_id; возвращает (число заказов, расхождения)
+        bounds = (period + '-00', period + '-99')
+        mismatches = [LedgerMismatch(period, order_id, transaction_id, None, amount, 'проводка без заказа')
+                      for order_id, transaction_id, amount in self.conn.execute(ORPHAN_POSTINGS_SQL, bounds)]
+        first_id, last_id = self.conn.execute(ORDER_RANGE_SQL, bounds).fetchone()
+        if first_id is None:
+            return 0, mismatches
+        postings = ((order_id, list(rows)) for order_id, rows
+                    in groupby(self.conn.execute(POSTINGS_SQL, (first_id, last_id)), key=lambda row: row[0]))
+        posting = next(postings, None)
+        orders = 0
+        for order_id, user_id, total in self.conn.execute(ORDER_TOTALS_SQL, (first_id, last_id, *bounds)):
+            orders += 1
+            # Проводки с меньшим order_id относятся к заказам других месяцев (сверяются там)
+            # или к удалённым заказам (их уже нашло анти-соединение)
+            while posting is not None and posting[0] < order_id:
+                posting = next(postings, None)
+            if posting is None or posting[0] != order_id:
+                mismatches.append(LedgerMismatch(period, order_id, None, total, None, 'нет проводки'))
+                continue
+            rows = posting[1]
+            posting = next(postings, None)
+            posted = sum(row[3] for row in rows)
+            if len(rows) > 1:
+                mismatches.append(LedgerMismatch(period, order_id, rows[-1][1], total, posted, f'проводок по заказу: {len(rows)}'))
+            elif posted != total:
+                mismatches.append(LedgerMismatch(period, order_id, rows[0][1], total, posted, 'сумма не совпадает'))
+            elif rows[0][2] != user_id:
+                mismatches.append(LedgerMismatch(period, order_id, rows[0][1], total, posted, 'проводка на другого пользователя'))
+        return orders, mismatches
@@ -0,0 +1,83 @@
+# Отчёт о пополнении склада: товары из списка дозаказа (НизкийОстаток, миграция 8), сгруппированные
+# по бренду велосипеда или категории запчасти, со скоростью продаж по строкам заказов за последние
+# window_days дней. Строки отчёта читаются курсором и пишутся в файл по одной, без списка в памяти.
+import csv
+import json
+import math
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+# Продажи за окно считаются один раз по заказам с order_date >= ? (индекс idx_Заказы_order_date),
+# список дозаказа соединяется с каталогом по первичному ключу
+REPLENISHMENT_SQL = '''
+    WITH sold AS (
+        SELECT d.item_type, d.item_id, sum(d.quantity) AS units
+        FROM Заказы o JOIN ДеталиЗаказа d ON d.order_id = o.order_id
+        WHERE o.order_date >= ?
+        GROUP BY d.item_type, d.item_id
+    )
+    SELECT l.item_type, l.item_id, b.brand, b.model, l.quantity, l.reorder_level, coalesce(s.units, 0)
+    FROM НизкийОстаток l
+    JOIN Велосипеды b ON b.bike_id = l.item_id
+    LEFT JOIN sold s ON s.item_type = l.item_type AND s.item_id = l.item_id
+    WHERE l.item_type = 'Велосипед'
+    UNION ALL
+    SELECT l.item_type, l.item_id, p.category, p.name, l.quantity, l.reorder_level, coalesce(s.units, 0)
+    FROM НизкийОстаток l
+    JOIN Запчасти p ON p.part_id = l.item_id
+    LEFT JOIN sold s ON s.item_type = l.item_type AND s.item_id = l.item_id
+    WHERE l.item_type = 'Запчасть'
+    ORDER BY 1, 3, 4
+'''
+
+
+class ReplenishmentLine(NamedTuple):
+    item_type: str
+    item_id: int
+    group: str
+    title: str
+    quantity: int
+    reorder_level: int
+    sold: int
+    velocity: float
+    days_left: float
+    suggested: int
+
+
+class ReplenishmentReport:
+    def __init__(self, shop):
+        # shop - экземпляр velomagazin (ядро); отчёт только читает
+        self.conn = shop.conn
+
+    def lines(self, window_days=30, lead_days=14):
+        # Строки отчёта: velocity - продано штук в день за окно, days_left - на сколько дней хватит
+        # остатка (None без продаж), suggested - сколько заказать, чтобы после lead_days дней поставки
+        # остаток был не ниже порога
+        since = (datetime.now() - timedelta(days=window_days)).strftime("%Y-%m-%d %H:%M:%S")
+        cursor = self.conn.cursor()
+        cursor.execute(REPLENISHMENT_SQL, (since,))
+        for item_type, item_id, group, title, quantity, reorder_level, sold in cursor:
+            velocity = sold / window_days
+            days_left = round(quantity / velocity, 1) if velocity else None
+            suggested = max(0, math.ceil(reorder_level + velocity * lead_days - quantity))
+            yield ReplenishmentLine(item_type, item_id, group, title, quantity, reorder_level,
+                                    sold, round(velocity, 3), days_left, suggested)
+
+    def export(self, path, file_format=None, window_days=30, lead_days=14):
+        # Запись отчёта в CSV (с заголовком) или JSONL построчно; возвращает число строк
+        if file_format is None:
+            file_format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+        if file_format not in ('csv', 'jsonl'):
+            raise ValueError(f"Неизвестный формат файла: {file_format}")
+        written = 0
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f) if file_format == 'csv' else None
+            if writer:
+                writer.writerow(ReplenishmentLine._fields)
+            for line in self.lines(window_days, lead_days):
+                if writer:
+                    writer.writerow(line)
+                else:
+                    f.write(json.dumps(line._asdict(), ensure_ascii=False) + '\n')
+                written += 1
+        return written
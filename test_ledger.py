@@ -0,0 +1,58 @@
+# Тесты сверки заказов с проводками: отметки месяцев снимаются при правке заказов,
+# проводки удалённых заказов находятся
+import pytest
+
+from ledger import LedgerReconciler
+from velomagazin import velomagazin
+
+
+@pytest.fixture
+def shop(tmp_path):
+    shop = velomagazin(str(tmp_path / 'shop.db'))
+    bike_id = shop.add_bike('Горный', 'Stels', 100000, 10)
+    buyer = shop.create_user('покупатель', 'пароль')
+    shop.create_user('другой', 'пароль')
+    for _ in range(2):
+        assert shop.checkout(buyer, [(bike_id, 'Велосипед', 1)]).order_id
+    yield shop
+    shop.close_connection()
+
+
+def reasons(report):
+    return sorted((mismatch.order_id, mismatch.reason) for mismatch in report.mismatches)
+
+
+def test_clean_month_is_checkpointed_and_skipped(shop):
+    reconciler = LedgerReconciler(shop)
+    first = reconciler.reconcile()
+    assert first.orders == 2 and first.mismatches == []
+    second = reconciler.reconcile()
+    assert second.checked == [] and second.skipped == first.checked
+
+
+def test_order_update_clears_checkpoint(shop):
+    reconciler = LedgerReconciler(shop)
+    reconciler.reconcile()
+    with shop.conn:
+        shop.conn.execute("UPDATE Заказы SET user_id = 2 WHERE order_id = 1")
+    report = reconciler.reconcile()
+    assert reasons(report) == [(1, 'проводка на другого пользователя')]
+
+
+def test_posting_of_deleted_order_is_reported(shop):
+    reconciler = LedgerReconciler(shop)
+    reconciler.reconcile()
+    with shop.conn:
+        shop.conn.execute("DELETE FROM ДеталиЗаказа WHERE order_id = 2")
+        shop.conn.execute("DELETE FROM Заказы WHERE order_id = 2")
+    assert reasons(reconciler.reconcile()) == [(2, 'проводка без заказа')]
+
+
+def test_posting_reported_when_month_has_no_orders_left(shop):
+    reconciler = LedgerReconciler(shop)
+    with shop.conn:
+        shop.conn.execute("DELETE FROM ДеталиЗаказа")
+        shop.conn.execute("DELETE FROM Заказы")
+    report = reconciler.reconcile(force=True)
+    assert report.orders == 0
+    assert reasons(report) == [(1, 'проводка без заказа'), (2, 'проводка без заказа')]
@@ -0,0 +1,147 @@
+# Тесты ядра: миграция базы старой схемы, единицы цен при импорте и вставке, отзыв сеансов
+import sqlite3
+
+import pytest
+
+from velomagazin import MIGRATIONS, AuthenticationError, SessionStore, ValidationError, velomagazin
+
+# Схема исходной версии программы: цены в рублях (REAL), без Транзакции, Сотрудники и миграций
+BASELINE_SCHEMA = '''
+    CREATE TABLE Пользователи (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        password TEXT
+    );
+    CREATE TABLE Велосипеды (
+        bike_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        model TEXT,
+        brand TEXT,
+        price REAL,
+        quantity INTEGER
+    );
+    CREATE TABLE Запчасти (
+        part_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT,
+        category TEXT,
+        price REAL,
+        quantity INTEGER
+    );
+    CREATE TABLE Заказы (
+        order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        order_date TEXT,
+        FOREIGN KEY (user_id) REFERENCES Пользователи(user_id)
+    );
+    CREATE TABLE ДеталиЗаказа (
+        order_detail_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER,
+        item_id INTEGER,
+        item_type TEXT,
+        quantity INTEGER,
+        FOREIGN KEY (order_id) REFERENCES Заказы(order_id)
+    );
+'''
+
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    path = str(tmp_path / 'baseline.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO Пользователи (username, password) VALUES ('старый', 'pa$s')")
+    conn.executemany("INSERT INTO Велосипеды (model, brand, price, quantity) VALUES (?, ?, ?, ?)",
+                     [('Горный', 'Stels', 1234.5, 3), ('Шоссейный', 'Merida', 99.99, 1), ('Детский', 'Forward', 10.0, 2)])
+    # Последний велосипед удалён: его id не должен выдаться заново
+    conn.execute("DELETE FROM Велосипеды WHERE bike_id = 3")
+    conn.execute("INSERT INTO Запчасти (name, category, price, quantity) VALUES ('Цепь', 'Трансмиссия', 15.25, 10)")
+    conn.execute("INSERT INTO Заказы (user_id, order_date) VALUES (1, '2024-01-15 10:00:00')")
+    conn.execute("INSERT INTO ДеталиЗаказа (order_id, item_id, item_type, quantity) VALUES (1, 1, 'Велосипед', 1)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def shop(tmp_path):
+    shop = velomagazin(str(tmp_path / 'shop.db'))
+    yield shop
+    shop.close_connection()
+
+
+def test_migrate_from_baseline_converts_money_to_kopecks(baseline_db):
+    shop = velomagazin(baseline_db)
+    try:
+        assert shop.conn.execute('PRAGMA user_version').fetchone()[0] == MIGRATIONS[-1][0]
+        assert shop.conn.execute("SELECT bike_id, price FROM Велосипеды ORDER BY bike_id").fetchall() == [(1, 123450),
+                                                                                                          (2, 9999)]
+        assert shop.conn.execute("SELECT price FROM Запчасти").fetchone()[0] == 1525
+        assert shop.conn.execute("SELECT typeof(price) FROM Велосипеды").fetchone()[0] == 'integer'
+        # Цена на момент продажи старых строк заказов - из каталога, тоже в копейках
+        assert shop.conn.execute("SELECT unit_price FROM ДеталиЗаказа").fetchone()[0] == 123450
+    finally:
+        shop.close_connection()
+
+
+def test_migrate_from_baseline_keeps_autoincrement_counter(baseline_db):
+    shop = velomagazin(baseline_db)
+    try:
+        assert shop.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'Велосипеды'").fetchone()[0] == 3
+        assert shop.add_bike('Новый', 'Stels', 100, 1) == 4
+    finally:
+        shop.close_connection()
+
+
+def test_migrate_from_baseline_keeps_legacy_login(baseline_db):
+    shop = velomagazin(baseline_db)
+    try:
+        assert shop.authenticate('старый', 'pa$s') == 1
+        assert shop.conn.execute("SELECT password FROM Пользователи").fetchone()[0].startswith('scrypt$')
+    finally:
+        shop.close_connection()
+
+
+def test_import_and_add_bike_take_the_same_units(shop, tmp_path):
+    shop.import_bikes([('Импорт', 'Stels', 100, 1)])
+    shop.add_bike('Вставка', 'Stels', 100, 1)
+    path = tmp_path / 'bikes.csv'
+    path.write_text('model,brand,price,quantity\nФайл,Stels,1.00,1\n', encoding='utf-8')
+    shop.import_catalogue_file(str(path), 'Велосипед')
+    assert dict(shop.conn.execute("SELECT model, price FROM Велосипеды")) == {'Импорт': 100, 'Вставка': 100, 'Файл': 100}
+
+
+def test_import_file_reports_malformed_row_number(shop, tmp_path):
+    path = tmp_path / 'parts.jsonl'
+    path.write_text('{"name": "Цепь", "category": "Трансмиссия", "price": "15.25", "quantity": 1}\n'
+                    '{"name": "Трос", "category": "Тормоза", "price": "5"}\n', encoding='utf-8')
+    with pytest.raises(ValidationError, match='Строка 2: нет поля quantity'):
+        shop.import_catalogue_file(str(path), 'Запчасть')
+
+
+def test_session_revoked_in_another_store(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    first, second = SessionStore(db_path=path, recheck=0), SessionStore(db_path=path, recheck=0)
+    try:
+        session = first.create(1)
+        assert second.get(session.token).user_id == 1
+        second.revoke(session.token)
+        with pytest.raises(AuthenticationError):
+            first.get(session.token)
+    finally:
+        first.close()
+        second.close()
+
+
+def test_session_refresh_fails_after_user_revoked_elsewhere(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    # Перечитывание отключено: отзыв виден только при продлении срока в таблице, которое
+    # происходит, когда новый срок ушёл от сохранённого больше чем на ttl/2
+    first, second = SessionStore(ttl=1.0, db_path=path, recheck=3600), SessionStore(db_path=path)
+    try:
+        session = first.create(1)
+        second.revoke_user(1)
+        first.ttl = 60.0
+        with pytest.raises(AuthenticationError):
+            first.get(session.token)
+    finally:
+        first.close()
+        second.close()
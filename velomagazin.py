@@ -0,0 +1,3224 @@
+# Ядро velomagazin: операции магазина без диалогов с пользователем.
+# Методы принимают аргументы, возвращают результаты (именованные кортежи ниже) и поднимают
+# исключения ShopError; интерактивные меню - в ночнойбредвелосепедиста.py.
+# Цены и суммы денег - целые копейки; рубли только на вводе и выводе (to_kopecks, format_rubles).
+import re
+import sqlite3
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import sys
+import threading
+import time
+import functools
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from decimal import ROUND_HALF_UP, Decimal
+from datetime import datetime
+from typing import NamedTuple
+
+# Тип товара -> (таблица, столбец первичного ключа)
+ITEM_TABLES = {
+    'Велосипед': ('Велосипеды', 'bike_id'),
+    'Запчасть': ('Запчасти', 'part_id'),
+}
+
+# Тип товара -> компактный код типа в едином пространстве SKU (Товары.type_code, миграция 10)
+ITEM_TYPE_CODES = {
+    'Велосипед': 1,
+    'Запчасть': 2,
+}
+TYPE_CODE_ITEM_TYPES = {code: item_type for item_type, code in ITEM_TYPE_CODES.items()}
+
+# Профили настроек соединения (PRAGMA). Любое значение можно переопределить аргументом velomagazin(...).
+#   durable          - WAL, fsync на каждый commit: ничего не теряется при отключении питания
+#   fast             - WAL, synchronous=NORMAL: fsync только на контрольных точках, последние commit'ы
+#                      могут пропасть при сбое ОС, но база не повреждается
+#   readonly-replica - соединение только для чтения (mode=ro), без создания и миграции схемы
+PRAGMA_PROFILES = {
+    'durable': {
+        'journal_mode': 'WAL', 'synchronous': 'FULL', 'busy_timeout': 5000,
+        'cache_size': -16000, 'mmap_size': 0, 'temp_store': 'MEMORY',
+    },
+    'fast': {
+        'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000,
+        'cache_size': -64000, 'mmap_size': 256 * 1024 * 1024, 'temp_store': 'MEMORY',
+    },
+    'readonly-replica': {
+        'query_only': 1, 'busy_timeout': 5000,
+        'cache_size': -64000, 'mmap_size': 256 * 1024 * 1024, 'temp_store': 'MEMORY',
+    },
+}
+
+# Таблица каталога -> тип товара
+TABLE_ITEM_TYPES = {table: item_type for item_type, (table, _) in ITEM_TABLES.items()}
+
+# Столбцы строки каталога в кэше: (id, модель/название, бренд/категория, цена, количество)
+CATALOGUE_ROW_COLUMNS = {
+    'Велосипеды': ('bike_id', 'model', 'brand', 'price', 'quantity'),
+    'Запчасти': ('part_id', 'name', 'category', 'price', 'quantity'),
+}
+
+# Таблица каталога -> (столбцы для импорта, естественный ключ)
+IMPORT_COLUMNS = {
+    'Велосипеды': (('model', 'brand', 'price', 'quantity'), ('brand', 'model')),
+    'Запчасти': (('name', 'category', 'price', 'quantity'), ('name', 'category')),
+}
+
+def fts_index_steps(table, id_column, columns, options):
+    # SQL для внешнего FTS5-индекса над таблицей и триггеров, поддерживающих его в актуальном состоянии
+    fts = f'{table}_fts'
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, "
+        f"content='{table}', content_rowid='{id_column}', {options})",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, {column_list}) VALUES (new.{id_column}, {new_values});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.{id_column}, {old_values});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.{id_column}, {old_values});
+                INSERT INTO {fts} (rowid, {column_list}) VALUES (new.{id_column}, {new_values});
+            END""",
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+def retype_columns_step(table, conversions):
+    # Шаг миграции: столбцы REAL таблицы становятся INTEGER с пересчётом значений. SQLite не меняет
+    # тип столбца, поэтому таблица пересоздаётся по своему CREATE TABLE, данные копируются,
+    # индексы и триггеры таблицы создаются заново. conversions: {столбец: SQL-выражение значения}
+    def step(cursor):
+        create_sql = cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                    (table,)).fetchone()[0]
+        dependents = [row[0] for row in cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table,))]
+        columns = [row[1] for row in cursor.execute(f'PRAGMA table_info("{table}")')]
+        # Счётчик AUTOINCREMENT: после пересоздания он стал бы равен max(id), и id удалённых
+        # последними строк (на которые ссылаются строки заказов и сводки) выдались бы заново
+        has_sequence = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone()
+        sequence = has_sequence and cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        for column in conversions:
+            create_sql = re.sub(rf'\b{column}\s+REAL\b', f'{column} INTEGER', create_sql)
+        cursor.execute(create_sql.replace(table, f'{table}_new', 1))
+        cursor.execute(f"INSERT INTO {table}_new ({', '.join(columns)}) "
+                       f"SELECT {', '.join(conversions.get(column, column) for column in columns)} FROM {table}")
+        # Триггеры других таблиц ссылаются на таблицу по имени: без legacy_alter_table RENAME
+        # отказывается работать, пока старая таблица удалена, а новая ещё не переименована
+        cursor.execute('PRAGMA legacy_alter_table = ON')
+        try:
+            cursor.execute(f'DROP TABLE {table}')
+            cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+        finally:
+            cursor.execute('PRAGMA legacy_alter_table = OFF')
+        if sequence:
+            cursor.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+            cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, sequence[0]))
+        for sql in dependents:
+            cursor.execute(sql)
+    return step
+
+
+def kopecks_sql(column):
+    return f'CAST(round({column} * 100) AS INTEGER)'
+
+
+def type_code_sql(item_type_column):
+    # Код типа товара (ITEM_TYPE_CODES) по текстовому типу
+    cases = ' '.join(f"WHEN '{item_type}' THEN {code}" for item_type, code in ITEM_TYPE_CODES.items())
+    return f'CASE {item_type_column} {cases} END'
+
+
+def catalogue_column_sql(position):
+    # Столбец position строки каталога (CATALOGUE_ROW_COLUMNS) для строки t таблицы Товары
+    cases = ' '.join(
+        f"WHEN {ITEM_TYPE_CODES[item_type]} THEN "
+        f"(SELECT {CATALOGUE_ROW_COLUMNS[table][position]} FROM {table} WHERE {id_column} = t.item_id)"
+        for item_type, (table, id_column) in ITEM_TABLES.items())
+    return f'CASE t.type_code {cases} END'
+
+
+# Пересчёт сводок продаж по истории заказов (миграция 3 и SalesAnalytics.rebuild).
+# Заказы без пользователя учитываются в сводке покупателей под user_id = 0.
+ROLLUP_REBUILD_SQL = [
+    'DELETE FROM ПродажиПоДням',
+    'DELETE FROM ПродажиТоваровПоМесяцам',
+    'DELETE FROM ПокупкиПоМесяцам',
+    '''
+        INSERT INTO ПродажиПоДням (day, orders, units, revenue)
+        SELECT substr(o.order_date, 1, 10), count(DISTINCT o.order_id),
+               coalesce(sum(d.quantity), 0), coalesce(sum(d.quantity * d.unit_price), 0)
+        FROM Заказы o LEFT JOIN ДеталиЗаказа d ON d.order_id = o.order_id
+        GROUP BY 1
+    ''',
+    '''
+        INSERT INTO ПродажиТоваровПоМесяцам (month, item_type, item_id, units, revenue)
+        SELECT substr(o.order_date, 1, 7), d.item_type, d.item_id, sum(d.quantity), coalesce(sum(d.quantity * d.unit_price), 0)
+        FROM Заказы o JOIN ДеталиЗаказа d ON d.order_id = o.order_id
+        GROUP BY 1, 2, 3
+    ''',
+    '''
+        INSERT INTO ПокупкиПоМесяцам (month, user_id, orders, units, revenue)
+        SELECT substr(o.order_date, 1, 7), coalesce(o.user_id, 0), count(DISTINCT o.order_id),
+               coalesce(sum(d.quantity), 0), coalesce(sum(d.quantity * d.unit_price), 0)
+        FROM Заказы o LEFT JOIN ДеталиЗаказа d ON d.order_id = o.order_id
+        GROUP BY 1, 2
+    ''',
+]
+
+# Таблица сохранённых сеансов (миграция 5; SessionStore создаёт её и в отдельном файле)
+SESSION_TABLE_SQL = [
+    '''
+        CREATE TABLE IF NOT EXISTS Сессии (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_Сессии_user_id ON Сессии (user_id)',
+    'CREATE INDEX IF NOT EXISTS idx_Сессии_expires_at ON Сессии (expires_at)',
+]
+
+# Миграции схемы: (версия, шаги). Номер применённой версии хранится в PRAGMA user_version,
+# шаг - SQL-строка или функция, принимающая курсор. Новые изменения схемы - только новой записью в конце.
+MIGRATIONS = [
+    (1, [
+        '''
+            CREATE TABLE IF NOT EXISTS Сотрудники (
+                staff_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                staff_name TEXT
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS Транзакции (
+                transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                amount REAL,
+                transaction_date TEXT,
+                FOREIGN KEY (user_id) REFERENCES Пользователи(user_id)
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_Заказы_user_id ON Заказы (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_ДеталиЗаказа_order_id ON ДеталиЗаказа (order_id)',
+        'CREATE INDEX IF NOT EXISTS idx_Транзакции_user_id ON Транзакции (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_Велосипеды_brand_model ON Велосипеды (brand, model)',
+        'CREATE INDEX IF NOT EXISTS idx_Велосипеды_model ON Велосипеды (model)',
+        'CREATE INDEX IF NOT EXISTS idx_Запчасти_name_category ON Запчасти (name, category)',
+        'CREATE INDEX IF NOT EXISTS idx_Запчасти_category ON Запчасти (category)',
+    ]),
+    # Полнотекстовый поиск: каталог по словам с префиксами (регистр и кириллица - через unicode61),
+    # пользователи по подстроке имени (trigram)
+    (2, fts_index_steps('Велосипеды', 'bike_id', ('model', 'brand'), "tokenize='unicode61 remove_diacritics 2', prefix='2 3'")
+        + fts_index_steps('Запчасти', 'part_id', ('name', 'category'), "tokenize='unicode61 remove_diacritics 2', prefix='2 3'")
+        + fts_index_steps('Пользователи', 'user_id', ('username',), "tokenize='trigram'")),
+    # Аналитика продаж: цена на момент продажи в строке заказа и сводки, которые триггеры
+    # пополняют в той же транзакции, что и сам заказ. Для старых строк цена берётся из текущего каталога.
+    (3, [
+        'ALTER TABLE ДеталиЗаказа ADD COLUMN unit_price REAL',
+        '''
+            UPDATE ДеталиЗаказа SET unit_price = CASE item_type
+                WHEN 'Велосипед' THEN (SELECT price FROM Велосипеды WHERE bike_id = item_id)
+                ELSE (SELECT price FROM Запчасти WHERE part_id = item_id)
+            END
+            WHERE unit_price IS NULL
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS ПродажиПоДням (
+                day TEXT PRIMARY KEY,
+                orders INTEGER NOT NULL,
+                units INTEGER NOT NULL,
+                revenue REAL NOT NULL
+            ) WITHOUT ROWID
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS ПродажиТоваровПоМесяцам (
+                month TEXT,
+                item_type TEXT,
+                item_id INTEGER,
+                units INTEGER NOT NULL,
+                revenue REAL NOT NULL,
+                PRIMARY KEY (month, item_type, item_id)
+            ) WITHOUT ROWID
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS ПокупкиПоМесяцам (
+                month TEXT,
+                user_id INTEGER,
+                orders INTEGER NOT NULL,
+                units INTEGER NOT NULL,
+                revenue REAL NOT NULL,
+                PRIMARY KEY (month, user_id)
+            ) WITHOUT ROWID
+        ''',
+    ] + ROLLUP_REBUILD_SQL + [
+        '''
+            CREATE TRIGGER IF NOT EXISTS Заказы_rollup_ai AFTER INSERT ON Заказы BEGIN
+                INSERT INTO ПродажиПоДням (day, orders, units, revenue)
+                VALUES (substr(new.order_date, 1, 10), 1, 0, 0)
+                ON CONFLICT (day) DO UPDATE SET orders = orders + 1;
+                INSERT INTO ПокупкиПоМесяцам (month, user_id, orders, units, revenue)
+                VALUES (substr(new.order_date, 1, 7), coalesce(new.user_id, 0), 1, 0, 0)
+                ON CONFLICT (month, user_id) DO UPDATE SET orders = orders + 1;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS ДеталиЗаказа_rollup_ai AFTER INSERT ON ДеталиЗаказа BEGIN
+                INSERT INTO ПродажиПоДням (day, orders, units, revenue)
+                SELECT substr(order_date, 1, 10), 0, new.quantity, new.quantity * coalesce(new.unit_price, 0)
+                FROM Заказы WHERE order_id = new.order_id
+                ON CONFLICT (day) DO UPDATE SET units = units + excluded.units, revenue = revenue + excluded.revenue;
+                INSERT INTO ПродажиТоваровПоМесяцам (month, item_type, item_id, units, revenue)
+                SELECT substr(order_date, 1, 7), new.item_type, new.item_id, new.quantity, new.quantity * coalesce(new.unit_price, 0)
+                FROM Заказы WHERE order_id = new.order_id
+                ON CONFLICT (month, item_type, item_id) DO UPDATE SET units = units + excluded.units, revenue = revenue + excluded.revenue;
+                INSERT INTO ПокупкиПоМесяцам (month, user_id, orders, units, revenue)
+                SELECT substr(order_date, 1, 7), coalesce(user_id, 0), 0, new.quantity, new.quantity * coalesce(new.unit_price, 0)
+                FROM Заказы WHERE order_id = new.order_id
+                ON CONFLICT (month, user_id) DO UPDATE SET units = units + excluded.units, revenue = revenue + excluded.revenue;
+            END
+        ''',
+    ]),
+    # Бухгалтерия: проводка по заказу ссылается на него через order_id (checkout создаёт её в той же
+    # транзакции), СверкаПериодов хранит месяцы, сверка которых прошла без расхождений. Любое изменение
+    # заказов, их строк или проводок месяца удаляет отметку, и следующая сверка проверит его заново.
+    (4, [
+        'ALTER TABLE Транзакции ADD COLUMN order_id INTEGER REFERENCES Заказы(order_id)',
+        'CREATE INDEX IF NOT EXISTS idx_Транзакции_order_id ON Транзакции (order_id)',
+        'CREATE INDEX IF NOT EXISTS idx_Заказы_order_date ON Заказы (order_date)',
+        '''
+            CREATE TABLE IF NOT EXISTS СверкаПериодов (
+                period TEXT PRIMARY KEY,
+                orders INTEGER NOT NULL,
+                checked_at TEXT NOT NULL
+            ) WITHOUT ROWID
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS Заказы_reconcile_ai AFTER INSERT ON Заказы BEGIN
+                DELETE FROM СверкаПериодов WHERE period = substr(new.order_date, 1, 7);
+            END
+        ''',
+    ] + [
+        f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_reconcile_{suffix} AFTER {event} ON {table} BEGIN
+                DELETE FROM СверкаПериодов WHERE period IN (
+                    SELECT substr(order_date, 1, 7) FROM Заказы WHERE order_id IN ({rows})
+                );
+            END
+        '''
+        for table in ('ДеталиЗаказа', 'Транзакции')
+        for suffix, event, rows in (('ai', 'INSERT', 'new.order_id'),
+                                    ('au', 'UPDATE', 'old.order_id, new.order_id'),
+                                    ('ad', 'DELETE', 'old.order_id'))
+    ]),
+    # Сеансы клиентов для SessionStore(db_path=...)
+    (5, SESSION_TABLE_SQL),
+    # Брони товара на время набора заказа кассиром: hold_id объединяет строки одной корзины,
+    # истёкшие брони не учитываются сразу, а удаляются фоновым HoldExpiryScheduler пачками.
+    # Индекс по товару покрывает сумму активных броней (HELD_QUANTITY_SQL) без чтения таблицы.
+    (6, [
+        '''
+            CREATE TABLE IF NOT EXISTS Брони (
+                reservation_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hold_id TEXT NOT NULL,
+                item_type TEXT NOT NULL,
+                item_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_Брони_item ON Брони (item_type, item_id, expires_at, quantity, hold_id)',
+        'CREATE INDEX IF NOT EXISTS idx_Брони_hold_id ON Брони (hold_id)',
+        'CREATE INDEX IF NOT EXISTS idx_Брони_expires_at ON Брони (expires_at)',
+    ]),
+    # История заказов: даты приводятся к виду 'YYYY-MM-DD HH:MM:SS', который сортируется как строка,
+    # индекс (user_id, order_date, order_id) обслуживает фильтр по пользователю и периоду и курсор
+    # страниц; индекс только по user_id - его префикс - больше не нужен.
+    (7, [
+        '''
+            UPDATE Заказы SET order_date = strftime('%Y-%m-%d %H:%M:%S', order_date)
+            WHERE strftime('%Y-%m-%d %H:%M:%S', order_date) IS NOT NULL
+              AND order_date != strftime('%Y-%m-%d %H:%M:%S', order_date)
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_Заказы_user_date ON Заказы (user_id, order_date, order_id)',
+        'DROP INDEX IF EXISTS idx_Заказы_user_id',
+    ]),
+    # Дозаказ: порог reorder_level у товара (NULL - не следить) и таблица НизкийОстаток, которую
+    # триггеры держат равной "товары с quantity <= reorder_level", так что список на дозаказ читается
+    # по первичному ключу, а не обходом каталога. since - когда товар попал в список.
+    (8, [
+        'ALTER TABLE Велосипеды ADD COLUMN reorder_level INTEGER',
+        'ALTER TABLE Запчасти ADD COLUMN reorder_level INTEGER',
+        '''
+            CREATE TABLE IF NOT EXISTS НизкийОстаток (
+                item_type TEXT,
+                item_id INTEGER,
+                quantity INTEGER NOT NULL,
+                reorder_level INTEGER NOT NULL,
+                since TEXT NOT NULL,
+                PRIMARY KEY (item_type, item_id)
+            ) WITHOUT ROWID
+        ''',
+    ] + [
+        statement
+        for item_type, (table, id_column) in ITEM_TABLES.items()
+        for statement in (
+            f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_low_stock_ai AFTER INSERT ON {table}
+                WHEN new.quantity <= new.reorder_level BEGIN
+                    INSERT INTO НизкийОстаток (item_type, item_id, quantity, reorder_level, since)
+                    VALUES ('{item_type}', new.{id_column}, new.quantity, new.reorder_level, datetime('now', 'localtime'));
+                END
+            ''',
+            f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_low_stock_au AFTER UPDATE OF quantity, reorder_level ON {table}
+                WHEN new.quantity <= new.reorder_level BEGIN
+                    INSERT INTO НизкийОстаток (item_type, item_id, quantity, reorder_level, since)
+                    VALUES ('{item_type}', new.{id_column}, new.quantity, new.reorder_level, datetime('now', 'localtime'))
+                    ON CONFLICT (item_type, item_id) DO UPDATE
+                    SET quantity = excluded.quantity, reorder_level = excluded.reorder_level;
+                END
+            ''',
+            # Удаление из списка - только когда товар в нём был: обычное списание остатка его не трогает
+            f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_low_stock_restocked AFTER UPDATE OF quantity, reorder_level ON {table}
+                WHEN old.quantity <= old.reorder_level AND coalesce(new.quantity <= new.reorder_level, 0) = 0 BEGIN
+                    DELETE FROM НизкийОстаток WHERE item_type = '{item_type}' AND item_id = old.{id_column};
+                END
+            ''',
+            f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_low_stock_ad AFTER DELETE ON {table}
+                WHEN old.quantity <= old.reorder_level BEGIN
+                    DELETE FROM НизкийОстаток WHERE item_type = '{item_type}' AND item_id = old.{id_column};
+                END
+            ''',
+        )
+    ]),
+    # Деньги в целых копейках: цены каталога и строк заказов, суммы проводок и выручка сводок.
+    # Суммы целых не накапливают ошибку округления, и сверка сравнивает их точно.
+    (9, [
+        retype_columns_step('Велосипеды', {'price': kopecks_sql('price')}),
+        retype_columns_step('Запчасти', {'price': kopecks_sql('price')}),
+        retype_columns_step('ДеталиЗаказа', {'unit_price': kopecks_sql('unit_price')}),
+        retype_columns_step('Транзакции', {'amount': kopecks_sql('amount')}),
+    ] + [
+        retype_columns_step(table, {'revenue': kopecks_sql('revenue')})
+        for table in ('ПродажиПоДням', 'ПродажиТоваровПоМесяцам', 'ПокупкиПоМесяцам')
+    ]),
+    # Единое пространство SKU: Товары выдаёт каждому товару любого типа sku_id (не переиспользуется;
+    # строка остаётся и после удаления товара - для истории заказов), представление Каталог даёт
+    # строку любого товара по sku_id. Строки заказов ссылаются на sku_id и соединяются с каталогом
+    # одним соединением по первичному ключу.
+    (10, [
+        '''
+            CREATE TABLE IF NOT EXISTS Товары (
+                sku_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type_code INTEGER NOT NULL,
+                item_id INTEGER NOT NULL,
+                UNIQUE (type_code, item_id)
+            )
+        ''',
+    ] + [
+        statement
+        for item_type, (table, id_column) in ITEM_TABLES.items()
+        for statement in (
+            f"INSERT OR IGNORE INTO Товары (type_code, item_id) "
+            f"SELECT {ITEM_TYPE_CODES[item_type]}, {id_column} FROM {table} ORDER BY {id_column}",
+            f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_sku_ai AFTER INSERT ON {table} BEGIN
+                    INSERT OR IGNORE INTO Товары (type_code, item_id) VALUES ({ITEM_TYPE_CODES[item_type]}, new.{id_column});
+                END
+            ''',
+        )
+    ] + [
+        # Столбцы - подзапросы по первичному ключу таблицы своего типа: представление из одной таблицы
+        # встраивается в запрос (в том числе справа от LEFT JOIN), и вычисляются только нужные столбцы
+        f'''
+            CREATE VIEW IF NOT EXISTS Каталог (sku_id, type_code, item_id, title, subtitle, price, quantity) AS
+            SELECT t.sku_id, t.type_code, t.item_id, {', '.join(catalogue_column_sql(position) for position in range(1, 5))}
+            FROM Товары t
+        ''',
+        'ALTER TABLE ДеталиЗаказа ADD COLUMN sku_id INTEGER REFERENCES Товары(sku_id)',
+        f'''
+            UPDATE ДеталиЗаказа SET sku_id = (
+                SELECT sku_id FROM Товары
+                WHERE type_code = {type_code_sql('ДеталиЗаказа.item_type')} AND item_id = ДеталиЗаказа.item_id
+            )
+        ''',
+        # Строки, вставленные без sku_id (checkout передаёт его сам), получают его по типу и id товара
+        f'''
+            CREATE TRIGGER IF NOT EXISTS ДеталиЗаказа_sku_ai AFTER INSERT ON ДеталиЗаказа
+            WHEN new.sku_id IS NULL BEGIN
+                UPDATE ДеталиЗаказа SET sku_id = (
+                    SELECT sku_id FROM Товары WHERE type_code = {type_code_sql('new.item_type')} AND item_id = new.item_id
+                ) WHERE order_detail_id = new.order_detail_id;
+            END
+        ''',
+    ]),
+    # Отметки сверки снимаются и при изменении или удалении самого заказа (месяц до и после правки),
+    # и по месяцу даты проводки: проводка удалённого заказа ищется сверкой по своей дате
+    (11, [
+        '''
+            CREATE TRIGGER IF NOT EXISTS Заказы_reconcile_au AFTER UPDATE ON Заказы BEGIN
+                DELETE FROM СверкаПериодов WHERE period IN (substr(old.order_date, 1, 7), substr(new.order_date, 1, 7));
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS Заказы_reconcile_ad AFTER DELETE ON Заказы BEGIN
+                DELETE FROM СверкаПериодов WHERE period = substr(old.order_date, 1, 7);
+            END
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_Транзакции_transaction_date ON Транзакции (transaction_date) WHERE order_id IS NOT NULL',
+    ] + [
+        statement
+        for suffix, event, rows, months in (
+            ('ai', 'INSERT', 'new.order_id', 'substr(new.transaction_date, 1, 7)'),
+            ('au', 'UPDATE', 'old.order_id, new.order_id',
+             'substr(old.transaction_date, 1, 7), substr(new.transaction_date, 1, 7)'),
+            ('ad', 'DELETE', 'old.order_id', 'substr(old.transaction_date, 1, 7)'),
+        )
+        for statement in (
+            f'DROP TRIGGER IF EXISTS Транзакции_reconcile_{suffix}',
+            f'''
+                CREATE TRIGGER Транзакции_reconcile_{suffix} AFTER {event} ON Транзакции BEGIN
+                    DELETE FROM СверкаПериодов WHERE period IN (
+                        SELECT substr(order_date, 1, 7) FROM Заказы WHERE order_id IN ({rows})
+                    ) OR period IN ({months});
+                END
+            ''',
+        )
+    ]),
+    # Поиск по точной цене (search_*_in_database) идёт по индексу, как и по остальным атрибутам, кроме
+    # остатка: индекс по quantity перестраивался бы при каждом списании
+    (12, [
+        'CREATE INDEX IF NOT EXISTS idx_Велосипеды_price ON Велосипеды (price)',
+        'CREATE INDEX IF NOT EXISTS idx_Запчасти_price ON Запчасти (price)',
+    ]),
+]
+
+# Срок брони по умолчанию, секунд
+HOLD_TTL = 600.0
+
+# Сумма активных броней товара кроме броней корзины hold_id (NULL - все брони).
+# Параметры: item_type, item_id, текущее время, hold_id
+HELD_QUANTITY_SQL = '''
+    SELECT coalesce(sum(quantity), 0) FROM Брони
+    WHERE item_type = ? AND item_id = ? AND expires_at > ? AND hold_id IS NOT ?
+'''
+
+# Инструкции по типу товара, собранные один раз: неизменный текст каждой инструкции sqlite3 находит
+# в кэше подготовленных инструкций соединения вместо разбора заново.
+#   decrement - условное списание, возвращает цену товара (quantity, item_id, item_type, item_id, время,
+#               hold_id, quantity)
+#   available - остаток за вычетом чужих броней (item_type, item_id, время, hold_id, item_id)
+#   reserve   - бронь при достаточном остатке (hold_id, item_type, item_id, quantity, срок, item_id,
+#               item_type, item_id, время, hold_id, quantity)
+#   sku       - sku_id товара (item_id)
+ITEM_STATEMENTS = {
+    item_type: {
+        'decrement': f"UPDATE {table} SET quantity = quantity - ? "
+                     f"WHERE {id_column} = ? AND quantity - ({HELD_QUANTITY_SQL}) >= ? RETURNING price",
+        'available': f"SELECT quantity - ({HELD_QUANTITY_SQL}) FROM {table} WHERE {id_column}=?",
+        'reserve': f"INSERT INTO Брони (hold_id, item_type, item_id, quantity, expires_at) "
+                   f"SELECT ?, ?, ?, ?, ? FROM {table} WHERE {id_column} = ? AND quantity - ({HELD_QUANTITY_SQL}) >= ?",
+        'sku': f"SELECT sku_id FROM Товары WHERE type_code = {ITEM_TYPE_CODES[item_type]} AND item_id=?",
+    }
+    for item_type, (table, id_column) in ITEM_TABLES.items()
+}
+
+# Строка заказа с ценой на момент продажи и sku_id товара.
+# Параметры: order_id, item_id, item_type, quantity, unit_price, код типа, item_id
+ORDER_LINE_INSERT_SQL = '''
+    INSERT INTO ДеталиЗаказа (order_id, item_id, item_type, quantity, unit_price, sku_id)
+    VALUES (?, ?, ?, ?, ?, (SELECT sku_id FROM Товары WHERE type_code = ? AND item_id = ?))
+'''
+
+# Поиск по каталогу: оба FTS-индекса, общий порядок по bm25
+CATALOGUE_SEARCH_SQL = '''
+    SELECT 'Велосипед', b.bike_id, b.model, b.brand, b.price, b.quantity, bm25(Велосипеды_fts) AS rank
+    FROM Велосипеды_fts JOIN Велосипеды b ON b.bike_id = Велосипеды_fts.rowid
+    WHERE Велосипеды_fts MATCH ?
+    UNION ALL
+    SELECT 'Запчасть', p.part_id, p.name, p.category, p.price, p.quantity, bm25(Запчасти_fts) AS rank
+    FROM Запчасти_fts JOIN Запчасти p ON p.part_id = Запчасти_fts.rowid
+    WHERE Запчасти_fts MATCH ?
+    ORDER BY rank
+    LIMIT ? OFFSET ?
+'''
+
+USER_SEARCH_SQL = '''
+    SELECT u.user_id, u.username
+    FROM Пользователи_fts JOIN Пользователи u ON u.user_id = Пользователи_fts.rowid
+    WHERE Пользователи_fts MATCH ?
+    ORDER BY u.user_id
+    LIMIT ? OFFSET ?
+'''
+
+# Короткие подстроки (меньше трёх символов) триграммный индекс не находит: полный просмотр по LIKE.
+# Встроенные LIKE и lower() сворачивают регистр только для ASCII, поэтому обе стороны приводятся
+# функцией casefold (см. velomagazin.__init__), а %, _ и \ в подстроке экранируются
+USER_SEARCH_SHORT_SQL = r'''
+    SELECT user_id, username
+    FROM Пользователи
+    WHERE casefold(username) LIKE ? ESCAPE '\'
+    ORDER BY user_id
+    LIMIT ? OFFSET ?
+'''
+
+def like_pattern(term):
+    # Шаблон LIKE "содержит подстроку" с экранированием спецсимволов (ESCAPE '\')
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def fts_prefix_query(term):
+    # Каждое слово запроса - фраза в кавычках с префиксным поиском, слова объединяются через AND
+    words = term.split()
+    return ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+
+
+def to_kopecks(rubles):
+    # Сумма в рублях (число или строка '1234.5') -> целые копейки, половина копейки округляется вверх
+    if isinstance(rubles, int):
+        return rubles * 100
+    try:
+        return int((Decimal(str(rubles).strip().replace(',', '.')) * 100).quantize(Decimal(1), ROUND_HALF_UP))
+    except ArithmeticError:
+        raise ValidationError(f"Некорректная сумма: {rubles}") from None
+
+
+def format_rubles(kopecks):
+    # Копейки -> '1234.50' для вывода
+    sign = '-' if kopecks < 0 else ''
+    return f"{sign}{abs(kopecks) // 100}.{abs(kopecks) % 100:02}"
+
+
+# Новая цена при переоценке: цена * basis_points / 10000 с округлением половины вверх плюс надбавка,
+# не ниже нуля; всё в целых числах. Параметры :basis_points, :markup и значение фильтра :value
+REPRICE_PRICE_SQL = 'max(0, (price * :basis_points + 5000) / 10000 + :markup)'
+
+# История заказов: страница заказов пользователя за период, новые первыми, после курсора (order_date, order_id).
+# Параметры: user_id, начало периода, конец периода, дата курсора (дважды), order_id курсора, размер страницы
+ORDER_HISTORY_SQL = '''
+    SELECT order_id, order_date FROM Заказы
+    WHERE user_id = ? AND order_date >= ? AND order_date < ?
+      AND (order_date < ? OR (order_date = ? AND order_id < ?))
+    ORDER BY order_date DESC, order_id DESC
+    LIMIT ?
+'''
+
+# Строки заказов страницы с названиями товаров из каталога по sku_id (удалённый товар - без названия)
+ORDER_LINES_SQL = '''
+    SELECT d.order_id, d.item_type, d.item_id, c.title, d.quantity, d.unit_price
+    FROM ДеталиЗаказа d LEFT JOIN Каталог c ON c.sku_id = d.sku_id
+    WHERE d.order_id IN ({placeholders})
+    ORDER BY d.order_id, d.order_detail_id
+'''
+
+# Инструкции пользователей, сотрудников, бухгалтерии, заказов, броней и сеансов - по одному тексту
+# на операцию: методы выполняют именно их, и тот же текст проверяет check_query_plans
+USER_STATEMENTS = {
+    'insert': "INSERT INTO Пользователи (username, password) VALUES (?, ?)",
+    'by_name': "SELECT user_id, password FROM Пользователи WHERE username=?",
+    'rehash': "UPDATE Пользователи SET password=? WHERE user_id=? AND password=?",
+    'get': "SELECT user_id, username FROM Пользователи WHERE user_id=?",
+    'update': "UPDATE Пользователи SET username=?, password=? WHERE user_id=?",
+    'delete': "DELETE FROM Пользователи WHERE user_id=?",
+}
+
+STAFF_STATEMENTS = {
+    'insert': "INSERT INTO Сотрудники (staff_name) VALUES (?)",
+    'get': "SELECT staff_id, staff_name FROM Сотрудники WHERE staff_id=?",
+    'rename': "UPDATE Сотрудники SET staff_name=? WHERE staff_id=?",
+    'delete': "DELETE FROM Сотрудники WHERE staff_id=?",
+}
+
+TRANSACTION_STATEMENTS = {
+    'insert': "INSERT INTO Транзакции (user_id, amount, transaction_date) VALUES (?, ?, ?)",
+    'posting': "INSERT INTO Транзакции (user_id, amount, transaction_date, order_id) VALUES (?, ?, ?, ?)",
+    'set_amount': "UPDATE Транзакции SET amount=? WHERE transaction_id=?",
+    'delete': "DELETE FROM Транзакции WHERE transaction_id=?",
+    'by_user': "SELECT transaction_id, user_id, amount, transaction_date FROM Транзакции WHERE user_id=?",
+}
+
+ORDER_STATEMENTS = {
+    'insert': "INSERT INTO Заказы (user_id, order_date) VALUES (?, ?)",
+    'by_user': "SELECT order_id, order_date FROM Заказы WHERE user_id=? ORDER BY order_date, order_id",
+}
+
+HOLD_STATEMENTS = {
+    'extend': "UPDATE Брони SET expires_at=? WHERE hold_id=?",
+    'release': "DELETE FROM Брони WHERE hold_id=?",
+    'expire': "DELETE FROM Брони WHERE reservation_id IN (SELECT reservation_id FROM Брони WHERE expires_at <= ? LIMIT ?)",
+}
+
+SESSION_STATEMENTS = {
+    'insert': "INSERT INTO Сессии (token_hash, user_id, expires_at) VALUES (?, ?, ?)",
+    'get': "SELECT expires_at, user_id FROM Сессии WHERE token_hash=?",
+    'refresh': "UPDATE Сессии SET expires_at=? WHERE token_hash=?",
+    'delete': "DELETE FROM Сессии WHERE token_hash=?",
+    'delete_user': "DELETE FROM Сессии WHERE user_id=?",
+    'purge': "DELETE FROM Сессии WHERE expires_at < ?",
+}
+
+# Активные брони нескольких товаров одного типа (кроме корзины hold_id); {placeholders} - список ? по item_id
+HELD_QUANTITIES_SQL = '''
+    SELECT item_id, sum(quantity) FROM Брони
+    WHERE item_type = ? AND item_id IN ({placeholders}) AND expires_at > ? AND hold_id IS NOT ?
+    GROUP BY item_id
+'''
+
+# Строки каталога любого типа по sku_id; {placeholders} - список ? по sku_id
+CATALOGUE_SKUS_SQL = '''
+    SELECT sku_id, type_code, item_id, title, subtitle, price, quantity FROM Каталог
+    WHERE sku_id IN ({placeholders})
+'''
+
+LOW_STOCK_SQL = "SELECT item_type, item_id, quantity, reorder_level, since FROM НизкийОстаток WHERE item_type=? ORDER BY item_id"
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_sql(operation, table, columns=(), keys=(), count=1):
+    # Текст SQL операции над уже проверенными именами таблицы и столбцов; keys - столбцы условия
+    # (для 'select-in' - один столбец и count значений в IN). Кэшируется по всем аргументам.
+    condition = ' AND '.join(f"{key}=?" for key in keys)
+    if operation == 'insert':
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+    if operation == 'update':
+        return f"UPDATE {table} SET {', '.join(f'{column}=?' for column in columns)} WHERE {condition}"
+    if operation == 'delete':
+        return f"DELETE FROM {table} WHERE {condition}"
+    if operation == 'select':
+        return f"SELECT {', '.join(columns)} FROM {table}" + (f" WHERE {condition}" if keys else '')
+    if operation == 'select-in':
+        return f"SELECT {', '.join(columns)} FROM {table} WHERE {keys[0]} IN ({', '.join('?' for _ in range(count))})"
+    if operation == 'scan':
+        return f"SELECT {', '.join(columns)} FROM {table} ORDER BY {', '.join(keys)}"
+    raise ValueError(f"Неизвестная операция: {operation}")
+
+
+def import_row_error(number, error):
+    # ValidationError для некорректной строки импорта с её номером
+    if isinstance(error, ShopError):
+        return ValidationError(f"Строка {number}: {error}")
+    if isinstance(error, KeyError):
+        return ValidationError(f"Строка {number}: нет поля {error.args[0]}")
+    if isinstance(error, json.JSONDecodeError):
+        return ValidationError(f"Строка {number}: некорректный JSON ({error.msg})")
+    return ValidationError(f"Строка {number}: некорректная запись ({error})")
+
+
+def import_sql(table, upsert):
+    # (вставка, обновление или None) для импорта каталога. При upsert строка с существующим
+    # естественным ключом обновляется, а вставка её пропускает
+    columns, natural_key = IMPORT_COLUMNS[table]
+    if not upsert:
+        return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})", None
+    other_columns = [column for column in columns if column not in natural_key]
+    key_condition = ' AND '.join(f"{column}=?" for column in natural_key)
+    update_sql = f"UPDATE {table} SET {', '.join(f'{column}=?' for column in other_columns)} WHERE {key_condition}"
+    insert_sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+                  f"SELECT {', '.join('?' for _ in columns)} "
+                  f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {key_condition})")
+    return insert_sql, update_sql
+
+
+def reprice_sql(table, filtered, dry_run=False):
+    # Переоценка таблицы каталога: UPDATE ... RETURNING id или (dry_run) SELECT id, название, цена, новая цена.
+    # filtered - только бренд/категория :value
+    id_column, title_column, group_column = CATALOGUE_ROW_COLUMNS[table][:3]
+    condition = f"{REPRICE_PRICE_SQL} != price" + (f" AND {group_column} = :value" if filtered else '')
+    if dry_run:
+        return (f"SELECT {id_column}, {title_column}, price, {REPRICE_PRICE_SQL} FROM {table} "
+                f"WHERE {condition} ORDER BY {id_column}")
+    return f"UPDATE {table} SET price = {REPRICE_PRICE_SQL} WHERE {condition} RETURNING {id_column}"
+
+
+# Точечные запросы класса, которые обязаны идти по индексу (проверяет check_query_plans). Список
+# собирается из тех же констант и построителей текста, что выполняют методы; запросы модулей
+# отчётов - в их списках (ledger.LEDGER_QUERIES, analytics.ANALYTICS_QUERIES).
+# Полные выборки для просмотра списков и переоценка без фильтра сюда не входят.
+LOOKUP_QUERIES = [
+    *(statement
+      for statements in (USER_STATEMENTS, STAFF_STATEMENTS, TRANSACTION_STATEMENTS, ORDER_STATEMENTS, HOLD_STATEMENTS,
+                         SESSION_STATEMENTS)
+      for statement in statements.values()),
+    *(statement for statements in ITEM_STATEMENTS.values() for statement in statements.values()),
+    HELD_QUANTITY_SQL,
+    HELD_QUANTITIES_SQL.format(placeholders='?, ?'),
+    ORDER_LINE_INSERT_SQL,
+    ORDER_HISTORY_SQL,
+    ORDER_LINES_SQL.format(placeholders='?, ?'),
+    CATALOGUE_SKUS_SQL.format(placeholders='?, ?'),
+    LOW_STOCK_SQL,
+    CATALOGUE_SEARCH_SQL,
+    USER_SEARCH_SQL,
+    # Общий слой над каталогом (TableRegistry): поиск по атрибуту строки, чтение и проверка
+    # существования по id, изменение строки и порога дозаказа, удаление. Поиск по точному остатку -
+    # не точечный запрос (у половины склада остаток может совпадать) и индекса не имеет
+    *(query
+      for table, columns in CATALOGUE_ROW_COLUMNS.items()
+      for query in (
+          *(compile_sql('select', table, columns, (column,)) for column in columns if column != 'quantity'),
+          compile_sql('select-in', table, columns, columns[:1], 2),
+          compile_sql('select-in', table, columns[:1], columns[:1], 2),
+          compile_sql('update', table, columns[1:], columns[:1]),
+          compile_sql('update', table, ('reorder_level',), columns[:1]),
+          compile_sql('delete', table, (), columns[:1]),
+      )),
+    *(query for table in IMPORT_COLUMNS for query in import_sql(table, upsert=True)),
+    *(reprice_sql(table, filtered=True, dry_run=dry_run) for table in CATALOGUE_ROW_COLUMNS for dry_run in (False, True)),
+]
+
+
+class ShopError(Exception):
+    # Базовая ошибка операций магазина; текст пригоден для показа пользователю
+    pass
+
+
+class ValidationError(ShopError):
+    pass
+
+
+class NotFoundError(ShopError):
+    pass
+
+
+class AlreadyExistsError(ShopError):
+    pass
+
+
+class AuthenticationError(ShopError):
+    pass
+
+
+class RateLimitError(AuthenticationError):
+    # retry_after - через сколько секунд можно повторить попытку
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OutOfStockError(ShopError):
+    # failures - список LineFailure по проблемным строкам заказа
+    def __init__(self, failures):
+        super().__init__("Заказ не оформлен: " + "; ".join(
+            f"{failure.item_type} {failure.item_id} x {failure.quantity}: {failure.reason}" for failure in failures))
+        self.failures = failures
+
+
+class SlotRecord:
+    # Компактная строка таблицы: значения в __slots__ без словаря на каждую строку.
+    # Доступ как к атрибутам, так и по имени столбца (record['price']); при выборке
+    # части столбцов незагруженные атрибуты отсутствуют.
+    __slots__ = ()
+
+    def __init__(self, columns, values):
+        for column, value in zip(columns, values):
+            setattr(self, column, value)
+
+    def __getitem__(self, column):
+        return getattr(self, column)
+
+    def __repr__(self):
+        values = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if hasattr(self, name))
+        return f"{type(self).__name__}({values})"
+
+
+class BikeRecord(SlotRecord):
+    __slots__ = ('bike_id', 'model', 'brand', 'price', 'quantity')
+
+
+class PartRecord(SlotRecord):
+    __slots__ = ('part_id', 'name', 'category', 'price', 'quantity')
+
+
+# Таблица каталога -> класс строки для load_from_database
+RECORD_CLASSES = {'Велосипеды': BikeRecord, 'Запчасти': PartRecord}
+
+
+@functools.lru_cache(maxsize=None)
+def record_builder(record_class, columns):
+    # Сборщик записи из строки выборки (id, *columns), сгенерированный под набор столбцов,
+    # как это делает namedtuple: без цикла и setattr на каждое значение
+    lines = [f"    record.{column} = row[{position}]" for position, column in enumerate(columns, 1)]
+    source = "def build(row):\n    record = new(cls)\n" + "\n".join(lines) + "\n    return record\n"
+    namespace = {'new': object.__new__, 'cls': record_class}
+    exec(source, namespace)
+    return namespace['build']
+
+
+class ColumnBatch:
+    # Столбцы выборки целиком: ids и числовые столбцы - array ('q' для INTEGER, 'd' для REAL),
+    # текстовые - списки. NULL в числовых столбцах хранится как 0 (INTEGER) или nan (REAL).
+    __slots__ = ('ids', 'columns')
+
+    def __init__(self, ids, columns):
+        self.ids = ids
+        self.columns = columns
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class CatalogueItem(NamedTuple):
+    item_id: int
+    title: str
+    subtitle: str
+    price: int
+    quantity: int
+
+
+class SkuItem(NamedTuple):
+    sku_id: int
+    item_type: str
+    item_id: int
+    title: str
+    subtitle: str
+    price: int
+    quantity: int
+
+
+class SearchHit(NamedTuple):
+    item_type: str
+    item_id: int
+    title: str
+    subtitle: str
+    price: int
+    quantity: int
+    rank: float
+
+
+class LineFailure(NamedTuple):
+    item_id: int
+    item_type: str
+    quantity: int
+    reason: str
+
+
+class OrderResult(NamedTuple):
+    order_id: int
+    total: int
+    failures: list
+
+
+class Order(NamedTuple):
+    order_id: int
+    order_date: str
+
+
+class OrderLine(NamedTuple):
+    item_type: str
+    item_id: int
+    title: str
+    quantity: int
+    unit_price: int
+
+
+class OrderSummary(NamedTuple):
+    order_id: int
+    order_date: str
+    total: int
+    lines: list
+
+
+class OrderHistoryPage(NamedTuple):
+    # next_cursor - (order_date, order_id) последнего заказа страницы или None, если страница последняя
+    orders: list
+    next_cursor: tuple
+
+
+class Transaction(NamedTuple):
+    transaction_id: int
+    user_id: int
+    amount: int
+    transaction_date: str
+
+
+class Session(NamedTuple):
+    token: str
+    user_id: int
+    expires_at: float
+
+
+class LowStockItem(NamedTuple):
+    item_type: str
+    item_id: int
+    quantity: int
+    reorder_level: int
+    since: str
+
+
+class PriceChange(NamedTuple):
+    item_type: str
+    item_id: int
+    title: str
+    old_price: int
+    new_price: int
+
+
+class User(NamedTuple):
+    user_id: int
+    username: str
+
+
+class Staff(NamedTuple):
+    staff_id: int
+    staff_name: str
+
+
+class TableMeta(NamedTuple):
+    table: str
+    columns: tuple
+    primary_key: str
+    types: dict
+
+
+# Таблицы общего слоя (TableRegistry): имя -> разрешена ли запись. Пользователи (хеширование пароля),
+# Сотрудники и Транзакции (проводки сверяет бухгалтерия) пишутся только своими методами; служебные
+# таблицы (Сессии, Брони, СверкаПериодов, сводки) общему слою недоступны вовсе.
+REGISTRY_TABLES = {
+    'Велосипеды': True,
+    'Запчасти': True,
+    'Пользователи': False,
+    'Сотрудники': False,
+    'Транзакции': False,
+}
+
+WRITE_OPERATIONS = ('insert', 'update', 'delete')
+
+
+class TableRegistry:
+    # Метаданные таблиц, прочитанные из схемы один раз на таблицу. Имена таблиц и столбцов
+    # проверяются по ним до подстановки в текст SQL, сам текст кэширует compile_sql.
+    def __init__(self, conn, tables=REGISTRY_TABLES):
+        self.conn = conn
+        self.allowed = tables
+        self._tables = {}
+
+    def table(self, table):
+        meta = self._tables.get(table)
+        if meta is None:
+            if table not in self.allowed:
+                raise ValueError(f"Неизвестная таблица: {table}")
+            known = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name=?",
+                                      (table,)).fetchone()
+            if not known:
+                raise ValueError(f"Неизвестная таблица: {table}")
+            rows = self.conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+            primary_key = next((row[1] for row in rows if row[5] == 1), 'rowid')
+            meta = TableMeta(table, tuple(row[1] for row in rows), primary_key, {row[1]: row[2].upper() for row in rows})
+            self._tables[table] = meta
+        return meta
+
+    def check(self, table, columns):
+        # Проверка столбцов таблицы; возвращает её TableMeta
+        meta = self.table(table)
+        for column in columns:
+            if column not in meta.columns and column != meta.primary_key:
+                raise ValueError(f"Неизвестный столбец {column} в таблице {table}")
+        return meta
+
+    def sql(self, operation, table, columns=(), keys=(), count=1):
+        columns, keys = tuple(columns), tuple(keys)
+        if operation in WRITE_OPERATIONS and not self.allowed.get(table):
+            raise ValueError(f"Таблица {table} недоступна для записи через общий слой")
+        self.check(table, columns + keys)
+        return compile_sql(operation, table, columns, keys, count)
+
+    def forget(self):
+        # Сброс метаданных после изменения схемы
+        self._tables.clear()
+
+
+class InventoryCache:
+    # Кэш строк каталога по ключу (item_type, item_id) с вытеснением LRU и сроком жизни записи.
+    # Один экземпляр может разделяться несколькими соединениями (см. ConnectionPool).
+    def __init__(self, maxsize=10000, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+        # Счётчик инвалидаций: значение, прочитанное из базы до инвалидации, в кэш не попадает
+        self.generation = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._rows.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._rows[key]
+                self.misses += 1
+                return None
+            self._rows.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, row, generation):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._rows[key] = (time.monotonic() + self.ttl, row)
+            self._rows.move_to_end(key)
+            while len(self._rows) > self.maxsize:
+                self._rows.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._rows.pop(key, None)
+
+    def invalidate_type(self, item_type):
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._rows if key[0] == item_type]:
+                del self._rows[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._rows.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._rows),
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class PasswordHasher:
+    # Солёное хеширование паролей через KDF из hashlib. Формат хранения (соль и ключ - hex):
+    #   scrypt$n$r$p$соль$ключ   или   pbkdf2_sha256$итерации$соль$ключ
+    # Остальные строки - прежние форматы: sha256 без соли (64 hex-символа) или открытый текст
+    # из старых админских путей (в том числе с '$'). Они проверяются, но помечаются на перехеширование.
+    # Пустой или NULL пароль в базе не совпадает ни с каким.
+    def __init__(self, algorithm='scrypt', n=2 ** 14, r=8, p=1, iterations=600000, salt_size=16):
+        if algorithm not in ('scrypt', 'pbkdf2_sha256'):
+            raise ValueError(f"Неизвестный алгоритм хеширования: {algorithm}")
+        self.algorithm = algorithm
+        self.salt_size = salt_size
+        if algorithm == 'scrypt':
+            self.params = (n, r, p)
+        else:
+            self.params = (iterations,)
+
+    def _derive(self, algorithm, params, password, salt):
+        if algorithm == 'scrypt':
+            n, r, p = params
+            return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * r * n + 2 ** 20, dklen=32)
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, params[0])
+
+    def hash(self, password):
+        salt = os.urandom(self.salt_size)
+        key = self._derive(self.algorithm, self.params, password, salt)
+        return '$'.join([self.algorithm, *map(str, self.params), salt.hex(), key.hex()])
+
+    def verify(self, password, stored):
+        # (пароль верен, хеш нужно пересчитать под текущие настройки)
+        if not stored:
+            # Старая схема допускает NULL и пустой пароль: с таким паролем войти нельзя
+            return False, False
+        kdf = self._parse(stored)
+        if kdf is not None:
+            algorithm, params, salt, key = kdf
+            derived = self._derive(algorithm, params, password, salt)
+            return hmac.compare_digest(derived, key), (algorithm, params) != (self.algorithm, self.params)
+        if len(stored) == 64 and all(c in '0123456789abcdef' for c in stored):
+            candidate = hashlib.sha256(password.encode()).hexdigest()
+        else:
+            candidate = password
+        return hmac.compare_digest(candidate.encode(), stored.encode()), True
+
+    def _parse(self, stored):
+        # (алгоритм, параметры, соль, ключ) для строки формата KDF, иначе None
+        algorithm, _, rest = stored.partition('$')
+        expected = {'scrypt': 3, 'pbkdf2_sha256': 1}.get(algorithm)
+        if expected is None:
+            return None
+        parts = rest.split('$')
+        if len(parts) != expected + 2:
+            return None
+        try:
+            return algorithm, tuple(map(int, parts[:expected])), bytes.fromhex(parts[-2]), bytes.fromhex(parts[-1])
+        except ValueError:
+            return None
+
+
+class CredentialCache:
+    # Кэш успешно проверенных паролей: повторный вход с тем же паролем не запускает KDF.
+    # Хранится HMAC пароля на случайном ключе процесса, а не сам пароль. Запись действительна,
+    # пока не истёк ttl и хеш в базе тот же, с которым пароль проверялся: смена пароля сбрасывает её.
+    def __init__(self, maxsize=10000, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, password):
+        return hmac.new(self._key, password.encode(), 'sha256').digest()
+
+    def check(self, username, password, stored):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] < time.monotonic() or entry[1] != stored:
+                return False
+            self._entries.move_to_end(username)
+        return hmac.compare_digest(entry[2], self._digest(password))
+
+    def remember(self, username, password, stored):
+        entry = (time.monotonic() + self.ttl, stored, self._digest(password))
+        with self._lock:
+            self._entries[username] = entry
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def forget(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+class LoginLimiter:
+    # Ограничение проверок пароля на имя пользователя: корзина на attempts попыток, которая
+    # пополняется на attempts попыток за window секунд. Исчерпанная корзина отклоняет вход до
+    # запуска KDF, так что перебор не тратит процессор. Успешный вход восстанавливает корзину.
+    def __init__(self, attempts=5, window=60.0, maxsize=100000):
+        self.attempts = attempts
+        self.rate = attempts / window
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, username):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(username, (self.attempts, now))
+            tokens = min(self.attempts, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[username] = (tokens, now)
+                retry_after = (1 - tokens) / self.rate
+                raise RateLimitError(f"Слишком много попыток входа, повторите через {retry_after:.0f} с", retry_after)
+            self._buckets[username] = (tokens - 1, now)
+            # Полные корзины неотличимы от отсутствующих, поэтому старейшие можно вытеснять
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+
+    def reset(self, username):
+        with self._lock:
+            self._buckets.pop(username, None)
+
+
+class SessionStore:
+    # Сеансы клиентов: непрозрачный токен -> user_id. Срок жизни ttl секунд продлевается при каждом
+    # обращении, при переполнении вытесняются давно не использовавшиеся сеансы. С db_path сеансы
+    # дублируются в таблицу Сессии (по хешу токена, не по самому токену) и переживают перезапуск;
+    # срок в таблице продлевается не чаще раза в ttl/2, чтобы чтение сеанса не было записью в базу.
+    # Таблица общая для всех хранилищ и процессов на этой базе: сеанс в памяти сверяется с ней не реже
+    # раза в recheck секунд, так что отзыв (revoke, удаление пользователя) в другом хранилище действует
+    # не позже чем через recheck.
+    def __init__(self, ttl=1800.0, maxsize=100000, db_path=None, recheck=5.0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.recheck = recheck
+        # токен -> (истекает, user_id, срок в таблице, когда сверен с таблицей)
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode = WAL')
+            self._conn.execute('PRAGMA busy_timeout = 5000')
+            with self._conn:
+                for statement in SESSION_TABLE_SQL:
+                    self._conn.execute(statement)
+
+    @staticmethod
+    def _token_hash(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def create(self, user_id):
+        token = secrets.token_urlsafe(32)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._sessions[token] = (expires_at, user_id, expires_at, time.time())
+            while len(self._sessions) > self.maxsize:
+                # Вытесняется только память: сохранённый сеанс подгрузится из таблицы при обращении
+                self._sessions.popitem(last=False)
+            if self._conn:
+                with self._conn:
+                    self._conn.execute(SESSION_STATEMENTS['insert'], (self._token_hash(token), user_id, expires_at))
+            self._created += 1
+            if self._created % 1024 == 0:
+                self._purge_expired(time.time())
+        return Session(token, user_id, expires_at)
+
+    def get(self, token):
+        # Действующий сеанс по токену (срок продлевается) или AuthenticationError
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(token)
+            if self._conn and (entry is None or now - entry[3] > self.recheck):
+                row = self._conn.execute(SESSION_STATEMENTS['get'], (self._token_hash(token),)).fetchone()
+                # Нет строки - сеанс отозван (возможно, другим хранилищем); срок мог продлить другой процесс
+                entry = (max(entry[0], row[0]) if entry else row[0], row[1], row[0], now) if row else None
+            if entry is None or entry[0] < now:
+                self._sessions.pop(token, None)
+                raise AuthenticationError("Сеанс истёк или не найден, войдите снова")
+            expires_at, user_id, stored_until, checked_at = now + self.ttl, entry[1], entry[2], entry[3]
+            if self._conn and expires_at - stored_until > self.ttl / 2:
+                with self._conn:
+                    updated = self._conn.execute(SESSION_STATEMENTS['refresh'], (expires_at, self._token_hash(token))).rowcount
+                if updated == 0:
+                    self._sessions.pop(token, None)
+                    raise AuthenticationError("Сеанс истёк или не найден, войдите снова")
+                stored_until, checked_at = expires_at, now
+            self._sessions[token] = (expires_at, user_id, stored_until, checked_at)
+            self._sessions.move_to_end(token)
+        return Session(token, user_id, expires_at)
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+            if self._conn:
+                with self._conn:
+                    self._conn.execute(SESSION_STATEMENTS['delete'], (self._token_hash(token),))
+
+    def revoke_user(self, user_id):
+        # Завершение всех сеансов пользователя (смена пароля, удаление)
+        with self._lock:
+            for token in [token for token, entry in self._sessions.items() if entry[1] == user_id]:
+                del self._sessions[token]
+            if self._conn:
+                with self._conn:
+                    self._conn.execute(SESSION_STATEMENTS['delete_user'], (user_id,))
+
+    def purge_expired(self):
+        with self._lock:
+            self._purge_expired(time.time())
+
+    def _purge_expired(self, now):
+        for token in [token for token, entry in self._sessions.items() if entry[0] < now]:
+            del self._sessions[token]
+        if self._conn:
+            with self._conn:
+                self._conn.execute(SESSION_STATEMENTS['purge'], (now,))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+
+
+class Authenticator:
+    # Проверка паролей и сеансы: хешер, кэш проверенных паролей, ограничитель попыток и хранилище сеансов.
+    # Один экземпляр разделяется соединениями пула (см. ConnectionPool).
+    def __init__(self, hasher=None, credentials=None, limiter=None, sessions=None):
+        self.hasher = hasher or PasswordHasher()
+        self.credentials = credentials or CredentialCache()
+        self.limiter = limiter or LoginLimiter()
+        self.sessions = sessions if sessions is not None else SessionStore()
+
+    def verify(self, username, password, row):
+        # row - (user_id, хеш) из базы или None; возвращает (user_id, новый хеш или None)
+        if row is not None and self.credentials.check(username, password, row[1]):
+            return row[0], None
+        self.limiter.acquire(username)
+        if row is None:
+            raise AuthenticationError("Неверное имя пользователя или пароль.")
+        valid, needs_rehash = self.hasher.verify(password, row[1])
+        if not valid:
+            raise AuthenticationError("Неверное имя пользователя или пароль.")
+        self.limiter.reset(username)
+        self.credentials.remember(username, password, row[1])
+        return row[0], self.hasher.hash(password) if needs_rehash else None
+
+
+# Границы корзин гистограммы задержек инструкций SQL, секунды (после последней - корзина +Inf)
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Журнал медленных инструкций (WARNING) и трассировки (DEBUG)
+sql_logger = logging.getLogger('velomagazin.sql')
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_sql(sql):
+    # Ключ инструкции в метриках: пробелы схлопнуты, списки (?, ?, ...) любой длины - один ключ
+    return re.sub(r'\(\?(?:, ?\?)+\)', '(?, ...)', ' '.join(sql.split()))
+
+
+def explain_params(query):
+    # Пустые параметры для EXPLAIN QUERY PLAN: словарь для именованных :param, иначе кортеж по числу '?'
+    named = re.findall(r'(?<![\w:]):(\w+)', query)
+    return dict.fromkeys(named) if named else (None,) * query.count('?')
+
+
+class SlowQuery(NamedTuple):
+    sql: str
+    seconds: float
+    rows: int
+    site: str
+    plan: list
+    at: str
+
+
+class StatementStats:
+    # Накопленные показатели одной инструкции (ключ - normalize_sql)
+    __slots__ = ('sql', 'calls', 'errors', 'slow', 'rows', 'seconds', 'fetch_seconds', 'max_seconds', 'buckets', 'sites')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.slow = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.fetch_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sites = {}
+
+    def quantile(self, fraction):
+        # Оценка квантиля задержки по гистограмме - верхняя граница корзины (для корзины +Inf - максимум)
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= fraction * self.calls:
+                return min(bound, self.max_seconds)
+        return self.max_seconds
+
+    def as_dict(self, sites=5):
+        return {
+            'sql': self.sql,
+            'calls': self.calls,
+            'errors': self.errors,
+            'slow': self.slow,
+            'rows': self.rows,
+            'seconds': self.seconds,
+            'fetch_seconds': self.fetch_seconds,
+            'max_seconds': self.max_seconds,
+            'p50_seconds': self.quantile(0.5),
+            'p95_seconds': self.quantile(0.95),
+            'p99_seconds': self.quantile(0.99),
+            'buckets': dict(zip([*map(str, LATENCY_BUCKETS), '+Inf'], self.buckets)),
+            'sites': dict(sorted(self.sites.items(), key=lambda site: -site[1])[:sites]),
+        }
+
+
+class QueryMetrics:
+    # Метрики инструкций SQL соединений velomagazin (включаются velomagazin.instrument): по каждой
+    # инструкции - гистограмма задержек, число строк, ошибок и места вызова в коде; журнал медленных
+    # инструкций с планом запроса. Задержка - время execute/executemany (для SELECT - до первой строки),
+    # время и строки последующей выборки (fetch*, итерация) добавляются в fetch_seconds и rows.
+    # Значения параметров не сохраняются: в них бывают хеши паролей и токены сеансов.
+    # Один объект можно разделить между соединениями разных потоков.
+    def __init__(self, slow_seconds=0.1, track_sites=True, slow_log_size=100, parent=None):
+        self.slow_seconds = slow_seconds
+        self.track_sites = track_sites
+        # Метрики, в которые записывается то же самое (внешний замер при вложенном velomagazin.profiling)
+        self.parent = parent
+        self.statements = {}
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self.progress_ticks = 0
+        self.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._lock = threading.Lock()
+
+    def record(self, sql, seconds, rows, site=None, error=False):
+        # Одно выполнение инструкции sql (уже нормализованной)
+        with self._lock:
+            stats = self.statements.get(sql)
+            if stats is None:
+                stats = self.statements[sql] = StatementStats(sql)
+            stats.calls += 1
+            stats.errors += error
+            stats.rows += rows
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            if site is not None:
+                stats.sites[site] = stats.sites.get(site, 0) + 1
+        if self.parent is not None:
+            self.parent.record(sql, seconds, rows, site, error)
+
+    def record_fetch(self, sql, seconds, rows):
+        with self._lock:
+            stats = self.statements.get(sql)
+            if stats is not None:
+                stats.fetch_seconds += seconds
+                stats.rows += rows
+        if self.parent is not None:
+            self.parent.record_fetch(sql, seconds, rows)
+
+    def record_slow(self, entry):
+        with self._lock:
+            self.slow_queries.append(entry)
+            stats = self.statements.get(entry.sql)
+            if stats is not None:
+                stats.slow += 1
+        if self.parent is not None:
+            self.parent.record_slow(entry)
+
+    def tick(self):
+        # Обработчик прогресса SQLite (velomagazin.instrument(progress_steps=...)); 0 - не прерывать
+        self.progress_ticks += 1
+        if self.parent is not None:
+            self.parent.tick()
+        return 0
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.slow_queries.clear()
+            self.progress_ticks = 0
+            self.started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def top(self, limit=20, by='seconds'):
+        # Самые затратные инструкции: by - seconds, calls, rows, max_seconds или fetch_seconds
+        if by not in ('seconds', 'calls', 'rows', 'max_seconds', 'fetch_seconds'):
+            raise ValueError(f"Неизвестный показатель: {by}")
+        with self._lock:
+            statements = list(self.statements.values())
+        return sorted(statements, key=lambda stats: getattr(stats, by), reverse=True)[:limit]
+
+    def as_dict(self, limit=None):
+        with self._lock:
+            slow_queries = [entry._asdict() for entry in self.slow_queries]
+        return {
+            'started_at': self.started_at,
+            'progress_ticks': self.progress_ticks,
+            'statements': [stats.as_dict() for stats in self.top(limit or len(self.statements))],
+            'slow_queries': slow_queries,
+        }
+
+    def report(self, limit=20):
+        # Текстовый отчёт: самые затратные инструкции с местами вызова и последние медленные
+        lines = [f"Метрики SQL с {self.started_at}",
+                 f"{'всего, мс':>10} {'вызовов':>8} {'p50, мс':>8} {'p99, мс':>8} {'макс, мс':>9} {'строк':>9}  инструкция"]
+        for stats in self.top(limit):
+            lines.append(f"{(stats.seconds + stats.fetch_seconds) * 1000:10.1f} {stats.calls:8} "
+                         f"{stats.quantile(0.5) * 1000:8.3f} {stats.quantile(0.99) * 1000:8.3f} "
+                         f"{stats.max_seconds * 1000:9.3f} {stats.rows:9}  {stats.sql[:200]}")
+            for site, count in sorted(stats.sites.items(), key=lambda site: -site[1])[:3]:
+                lines.append(f"{'':48}вызов: {site} ({count})")
+        if self.slow_queries:
+            lines.append(f"Медленные инструкции (от {self.slow_seconds * 1000:g} мс):")
+            for entry in list(self.slow_queries)[-limit:]:
+                lines.append(f"  {entry.at} {entry.seconds * 1000:9.1f} мс, строк {entry.rows}, {entry.site}: {entry.sql[:200]}")
+                lines += [f"      {step}" for step in entry.plan]
+        return '\n'.join(lines)
+
+    def prometheus(self):
+        # Текстовый формат экспозиции Prometheus (для textfile-коллектора node_exporter)
+        def label(sql):
+            return sql.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        statements = self.top(len(self.statements))
+        lines = ['# HELP velomagazin_sql_seconds Время выполнения инструкций SQL',
+                 '# TYPE velomagazin_sql_seconds histogram']
+        for stats in statements:
+            sql = label(stats.sql)
+            cumulative = 0
+            for bound, count in zip([*map(str, LATENCY_BUCKETS), '+Inf'], stats.buckets):
+                cumulative += count
+                lines.append(f'velomagazin_sql_seconds_bucket{{sql="{sql}",le="{bound}"}} {cumulative}')
+            lines.append(f'velomagazin_sql_seconds_sum{{sql="{sql}"}} {stats.seconds}')
+            lines.append(f'velomagazin_sql_seconds_count{{sql="{sql}"}} {stats.calls}')
+        for name, help_text, attribute in (
+                ('velomagazin_sql_fetch_seconds_total', 'Время выборки строк инструкций SQL', 'fetch_seconds'),
+                ('velomagazin_sql_rows_total', 'Строк выбрано или изменено инструкциями SQL', 'rows'),
+                ('velomagazin_sql_errors_total', 'Инструкций SQL, завершившихся ошибкой', 'errors'),
+                ('velomagazin_sql_slow_total', 'Медленных выполнений инструкций SQL', 'slow')):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{{sql="{label(stats.sql)}"}} {getattr(stats, attribute)}' for stats in statements]
+        lines += ['# HELP velomagazin_sql_progress_ticks_total Вызовов обработчика прогресса SQLite',
+                  '# TYPE velomagazin_sql_progress_ticks_total counter',
+                  f'velomagazin_sql_progress_ticks_total {self.progress_ticks}']
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path, file_format=None):
+        # Выгрузка метрик в файл: text, json или prometheus (по умолчанию - по расширению .json/.prom).
+        # Файл заменяется целиком, так что коллектор не прочитает его наполовину записанным
+        if file_format is None:
+            file_format = {'.json': 'json', '.prom': 'prometheus'}.get(os.path.splitext(path)[1].lower(), 'text')
+        if file_format == 'json':
+            content = json.dumps(self.as_dict(), ensure_ascii=False, indent=2)
+        elif file_format == 'prometheus':
+            content = self.prometheus()
+        elif file_format == 'text':
+            content = self.report(len(self.statements)) + '\n'
+        else:
+            raise ValueError(f"Неизвестный формат файла: {file_format}")
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(path + '.tmp', path)
+        return len(self.statements)
+
+
+def call_site(frame, depth=20):
+    # Место вызова инструкции: кадр, выполнивший её (_record <- _measure <- execute <- frame), и, если это
+    # код ядра, ближайший вызывающий за пределами velomagazin.py - 'velomagazin.py:120 insert < app.py:8 main'
+    site = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+    caller = frame
+    while caller is not None and caller.f_code.co_filename == __file__ and depth:
+        caller = caller.f_back
+        depth -= 1
+    if caller is not None and caller is not frame and caller.f_code.co_filename != __file__:
+        site += f" < {os.path.basename(caller.f_code.co_filename)}:{caller.f_lineno} {caller.f_code.co_name}"
+    return site
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Курсор, записывающий каждое выполнение и выборку в QueryMetrics своего соединения
+    _metrics = None
+    _statement = None
+
+    def execute(self, sql, parameters=()):
+        return self._measure(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._measure(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self._measure(super().executescript, sql_script)
+
+    def _measure(self, run, sql, *parameters):
+        metrics = self._metrics = self.connection.metrics
+        if metrics is None:
+            return run(sql, *parameters)
+        started = time.perf_counter()
+        try:
+            run(sql, *parameters)
+        except Exception:
+            self._record(metrics, sql, time.perf_counter() - started, True)
+            raise
+        self._record(metrics, sql, time.perf_counter() - started, False)
+        return self
+
+    def _record(self, metrics, sql, seconds, error):
+        statement = self._statement = normalize_sql(sql)
+        rows = max(self.rowcount, 0)
+        site = None
+        if metrics.track_sites:
+            site = call_site(sys._getframe(3))
+        metrics.record(statement, seconds, rows, site, error)
+        if seconds >= metrics.slow_seconds:
+            entry = SlowQuery(statement, seconds, rows, site, self._plan(sql),
+                              datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            metrics.record_slow(entry)
+            sql_logger.warning("Медленная инструкция %.1f мс, строк %d, %s: %s; план: %s",
+                               seconds * 1000, rows, site, statement, '; '.join(entry.plan) or '-')
+
+    def _plan(self, sql):
+        # План медленной инструкции отдельным курсором без замера
+        if not re.match(r'\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b', sql, re.IGNORECASE):
+            return []
+        try:
+            cursor = sqlite3.Cursor(self.connection)
+            return [row[-1] for row in cursor.execute(f'EXPLAIN QUERY PLAN {sql}', explain_params(sql))]
+        except sqlite3.Error:
+            return []
+
+    def _fetched(self, started, rows):
+        if self._statement is not None and self._metrics is not None:
+            self._metrics.record_fetch(self._statement, time.perf_counter() - started, rows)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        self._fetched(started, 1)
+        return row
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    # Соединение velomagazin: пока заданы metrics, его курсоры (и conn.execute) - InstrumentedCursor,
+    # иначе обычные курсоры sqlite3 без накладных расходов на выборку
+    metrics = None
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = sqlite3.Cursor if self.metrics is None else InstrumentedCursor
+        return super().cursor(factory)
+
+
+class velomagazin:
+    def __init__(self, db_path=None, page_size=50, profile=None, check_same_thread=True, cache=None, auth=None,
+                 **pragmas):
+        # Путь и профиль по умолчанию берутся из окружения (VELOMAGAZIN_DB, VELOMAGAZIN_PROFILE);
+        # VELOMAGAZIN_SLOW_MS включает метрики SQL с порогом медленной инструкции в миллисекундах
+        self.db_path = db_path or os.environ.get('VELOMAGAZIN_DB', 'bikeshop.db')
+        self.profile = profile or os.environ.get('VELOMAGAZIN_PROFILE', 'durable')
+        if self.profile not in PRAGMA_PROFILES:
+            raise ValueError(f"Неизвестный профиль соединения: {self.profile}")
+        self.read_only = self.profile == 'readonly-replica'
+
+        # Подключение к базе данных
+        if self.read_only:
+            self.conn = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=check_same_thread,
+                                        factory=InstrumentedConnection)
+        else:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=check_same_thread, factory=InstrumentedConnection)
+        # Свёртка регистра Unicode для поиска по LIKE (встроенные lower() и LIKE знают только ASCII)
+        self.conn.create_function('casefold', 1, lambda value: value.casefold() if isinstance(value, str) else value,
+                                  deterministic=True)
+        self.cursor = self.conn.cursor()
+        self.configure(**{**PRAGMA_PROFILES[self.profile], **pragmas})
+        # Размер страницы для постраничных выборок и меню
+        self.page_size = page_size
+        # Метаданные таблиц для проверки имён и кэша текстов SQL
+        self.tables = TableRegistry(self.conn)
+        # Кэш строк каталога для точечных запросов цены и остатка
+        self.cache = cache if cache is not None else InventoryCache()
+        # Хеширование и проверка паролей (кэш проверенных паролей, ограничение попыток)
+        self.auth = auth if auth is not None else Authenticator()
+        # Очередь отложенной записи (включается enable_write_behind)
+        self.write_behind = None
+        # Метрики инструкций SQL (включаются instrument)
+        self.metrics = None
+        if os.environ.get('VELOMAGAZIN_SLOW_MS'):
+            self.instrument(QueryMetrics(float(os.environ['VELOMAGAZIN_SLOW_MS']) / 1000))
+        # Создание таблиц при инициализации (реплика только читает готовую схему)
+        if not self.read_only:
+            self.create_tables()
+
+    def enable_write_behind(self, max_batch=256, max_delay=0.01):
+        # Включение отложенной записи с групповым commit для add_bike, add_bike_part, create_user,
+        # create_transaction, create_staff, rename_staff и операций insert_rows/update_rows/delete_rows
+        # (и методов поверх них): они возвращают PendingWrite вместо результата, ошибки операции
+        # приходят в PendingWrite.result() и колбэк
+        if self.write_behind is None:
+            self.write_behind = WriteBehindQueue(self.db_path, max_batch, max_delay, self.profile, self.metrics)
+        return self.write_behind
+
+    def instrument(self, metrics=None, trace=None, progress_steps=0):
+        # Включение метрик SQL (QueryMetrics) на соединении; возвращает их.
+        # trace - функция от текста каждой выполняемой инструкции, включая инструкции триггеров, или True
+        # для журнала velomagazin.sql на уровне DEBUG (в тексте могут быть значения параметров);
+        # progress_steps - вызывать обработчик прогресса каждые столько шагов виртуальной машины SQLite
+        # (QueryMetrics.progress_ticks - мера работы, которую не видно по числу инструкций)
+        if metrics is None:
+            metrics = QueryMetrics()
+        self.metrics = self.conn.metrics = metrics
+        self.cursor = self.conn.cursor()
+        if trace:
+            self.conn.set_trace_callback(sql_logger.debug if trace is True else trace)
+        if progress_steps:
+            self.conn.set_progress_handler(metrics.tick, progress_steps)
+        return metrics
+
+    def stop_instrumentation(self):
+        # Отключение метрик, трассировки и обработчика прогресса; возвращает накопленные метрики
+        metrics = self.metrics
+        self.metrics = self.conn.metrics = None
+        self.cursor = self.conn.cursor()
+        self.conn.set_trace_callback(None)
+        self.conn.set_progress_handler(None, 0)
+        return metrics
+
+    @contextmanager
+    def profiling(self, slow_seconds=None, track_sites=True):
+        # Отдельные метрики SQL только для блока with: with shop.profiling() as metrics: ...
+        # Включённые до блока метрики соединения продолжают получать те же записи
+        previous = self.metrics
+        if slow_seconds is None:
+            slow_seconds = previous.slow_seconds if previous is not None else 0.1
+        metrics = QueryMetrics(slow_seconds, track_sites, parent=previous)
+        self.metrics = self.conn.metrics = metrics
+        self.cursor = self.conn.cursor()
+        try:
+            yield metrics
+        finally:
+            self.metrics = self.conn.metrics = previous
+            self.cursor = self.conn.cursor()
+
+    def _write(self, operation, callback=None, stale=None):
+        # Выполнение записывающей операции - функции от курсора без commit: сразу в своей транзакции
+        # или через очередь отложенной записи. callback(result, error) - после фиксации на диске.
+        # stale - список ключей кэша каталога, который заполняет операция; они инвалидируются только
+        # после commit, иначе читатель другого соединения успел бы закэшировать ещё прежнюю строку
+        after_commit = (lambda: self.cache.invalidate(stale)) if stale is not None else None
+        if self.write_behind is not None:
+            return self.write_behind.submit(operation, callback, after_commit)
+        try:
+            try:
+                with self.conn:
+                    result = operation(self.conn.cursor())
+            finally:
+                if after_commit is not None:
+                    after_commit()
+        except Exception as e:
+            if callback is not None:
+                callback(None, e)
+            raise
+        if callback is not None:
+            callback(result, None)
+        return result
+
+    def configure(self, **pragmas):
+        # Применение PRAGMA к соединению; возвращает фактические значения после установки
+        allowed = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store', 'query_only')
+        applied = {}
+        for name, value in pragmas.items():
+            if name not in allowed:
+                raise ValueError(f"Неподдерживаемый параметр соединения: {name}")
+            if not (isinstance(value, int) or str(value).isalpha()):
+                raise ValueError(f"Недопустимое значение {name}: {value}")
+            row = self.conn.execute(f'PRAGMA {name} = {value}').fetchone()
+            applied[name] = row[0] if row else self.conn.execute(f'PRAGMA {name}').fetchone()[0]
+        return applied
+
+    def create_tables(self):
+        # Создание таблиц, если они не существуют
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Пользователи (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE,
+                password TEXT
+            )
+        ''')
+
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Велосипеды (
+                bike_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                model TEXT,
+                brand TEXT,
+                price REAL,
+                quantity INTEGER
+            )
+        ''')
+
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Запчасти (
+                part_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                category TEXT,
+                price REAL,
+                quantity INTEGER
+            )
+        ''')
+
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Заказы (
+                order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                order_date TEXT,
+                FOREIGN KEY (user_id) REFERENCES Пользователи(user_id)
+            )
+        ''')
+
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ДеталиЗаказа (
+                order_detail_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                order_id INTEGER,
+                item_id INTEGER,
+                item_type TEXT,  -- 'Велосипед' или 'Запчасть'
+                quantity INTEGER,
+                FOREIGN KEY (order_id) REFERENCES Заказы(order_id)
+            )
+        ''')
+
+        self.conn.commit()
+        # Доведение схемы до последней версии
+        self.migrate()
+
+    def migrate(self):
+        # Применение недостающих миграций; каждая версия - отдельная транзакция
+        cursor = self.conn.cursor()
+        current_version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        for version, steps in MIGRATIONS:
+            if version <= current_version:
+                continue
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                for step in steps:
+                    if callable(step):
+                        step(cursor)
+                    else:
+                        cursor.execute(step)
+                cursor.execute(f'PRAGMA user_version = {int(version)}')
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+            current_version = version
+            # Схема изменилась: метаданные таблиц перечитываются при следующем обращении
+            self.tables.forget()
+        return current_version
+
+    def table_columns(self, table):
+        # Столбцы таблицы и её первичный ключ по схеме (читаются один раз на таблицу)
+        meta = self.tables.table(table)
+        return list(meta.columns), meta.primary_key
+
+    def load_from_database(self, table, columns=None, batch_size=10000):
+        # Потоковая выгрузка таблицы каталога парами (id, запись) в порядке первичного ключа.
+        # Запись - BikeRecord/PartRecord со __slots__; columns ограничивает загружаемые столбцы.
+        table_columns, primary_key = self.table_columns(table)
+        record_class = RECORD_CLASSES[table]
+        columns = tuple(column for column in (columns or record_class.__slots__) if column != primary_key)
+        for column in columns:
+            if column not in table_columns or column not in record_class.__slots__:
+                raise ValueError(f"Неизвестный столбец {column} в таблице {table}")
+        build = record_builder(record_class, columns)
+
+        cursor = self.conn.cursor()
+        cursor.execute(self.tables.sql('scan', table, (primary_key,) + columns, (primary_key,)))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield row[0], build(row)
+
+    def load_columns(self, table, columns=('price', 'quantity'), batch_size=10000):
+        # Выгрузка выбранных столбцов таблицы в колоночном виде (ColumnBatch) в порядке первичного ключа
+        table_columns, primary_key = self.table_columns(table)
+        declared_types = self.tables.table(table).types
+        buffers = {}
+        for column in columns:
+            if column not in table_columns:
+                raise ValueError(f"Неизвестный столбец {column} в таблице {table}")
+            if 'INT' in declared_types[column]:
+                buffers[column] = array('q')
+            elif declared_types[column] in ('REAL', 'FLOAT', 'DOUBLE'):
+                buffers[column] = array('d')
+            else:
+                buffers[column] = []
+        ids = array('q')
+
+        cursor = self.conn.cursor()
+        cursor.execute(self.tables.sql('scan', table, (primary_key,) + tuple(columns), (primary_key,)))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            # Столбцы порции транспонируются целиком, без промежуточных объектов на строку
+            batch = list(zip(*rows))
+            ids.extend(batch[0])
+            for column, values in zip(columns, batch[1:]):
+                buffer = buffers[column]
+                if isinstance(buffer, array) and None in values:
+                    missing = 0 if buffer.typecode == 'q' else float('nan')
+                    values = [missing if value is None else value for value in values]
+                buffer.extend(values)
+        return ColumnBatch(ids, buffers)
+
+    def iter_pages(self, table, columns=None, filters=None, order_by=None, descending=False, page_size=None):
+        # Постраничная выборка с позиционной (keyset) пагинацией: каждая страница - отдельный запрос
+        # "после последней показанной строки" по (order_by, первичный ключ), без OFFSET и fetchall всей таблицы.
+        # filters: {столбец: значение} или {столбец: (оператор, значение)}.
+        table_columns, primary_key = self.table_columns(table)
+        page_size = page_size or self.page_size
+        columns = list(columns or table_columns)
+        for column in columns + list(filters or {}) + ([order_by] if order_by else []):
+            if column not in table_columns:
+                raise ValueError(f"Неизвестный столбец {column} в таблице {table}")
+
+        conditions, params = [], {}
+        for i, (column, condition) in enumerate((filters or {}).items()):
+            operator, value = condition if isinstance(condition, tuple) else ('=', condition)
+            if operator not in ('=', '!=', '<', '<=', '>', '>=', 'LIKE'):
+                raise ValueError(f"Недопустимый оператор фильтра: {operator}")
+            conditions.append(f"{column} {operator} :f{i}")
+            params[f'f{i}'] = value
+
+        # Служебные столбцы позиции добавляются в конец строки и отрезаются перед выдачей
+        keys = ([order_by] if order_by and order_by != primary_key else []) + [primary_key]
+        direction, compare = ('DESC', '<') if descending else ('ASC', '>')
+        if len(keys) == 1:
+            seek = f"{primary_key} {compare} :last_id"
+        elif descending:
+            # NULL при сортировке по убыванию идут последними
+            seek = (f"({order_by} < :last_key OR ({order_by} IS :last_key AND {primary_key} < :last_id)"
+                    f" OR ({order_by} IS NULL AND :last_key IS NOT NULL))")
+        else:
+            # NULL при сортировке по возрастанию идут первыми
+            seek = (f"({order_by} > :last_key OR ({order_by} IS :last_key AND {primary_key} > :last_id)"
+                    f" OR (:last_key IS NULL AND {order_by} IS NOT NULL))")
+
+        select = f"SELECT {', '.join(columns + keys)} FROM {table}"
+        order = f" ORDER BY {', '.join(f'{key} {direction}' for key in keys)} LIMIT {int(page_size)}"
+        first_query = select + (f" WHERE {' AND '.join(conditions)}" if conditions else '') + order
+        next_query = select + f" WHERE {' AND '.join(conditions + [seek])}" + order
+
+        cursor = self.conn.cursor()
+        cursor.execute(first_query, params)
+        while True:
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            yield [row[:len(columns)] for row in rows]
+            if len(rows) < page_size:
+                return
+            last = rows[-1][len(columns):]
+            params['last_id'] = last[-1]
+            params['last_key'] = last[0]
+            cursor.execute(next_query, params)
+
+    def check_query_plans(self, queries=LOOKUP_QUERIES):
+        # EXPLAIN QUERY PLAN для точечных запросов; возвращает [(запрос, шаг плана)] со сканированием таблицы
+        cursor = self.conn.cursor()
+        scans = []
+        for query in queries:
+            cursor.execute(f'EXPLAIN QUERY PLAN {query}', explain_params(query))
+            for row in cursor.fetchall():
+                detail = row[-1]
+                # Обход виртуальной FTS-таблицы по MATCH - это поиск по индексу, а не сканирование;
+                # SCAN CONSTANT ROW - строка SELECT без FROM (вставка по условию), а не таблица
+                if detail.startswith('SCAN') and 'VIRTUAL TABLE' not in detail and detail != 'SCAN CONSTANT ROW':
+                    scans.append((query, detail))
+        return scans
+
+    def create_user(self, username, password, callback=None):
+        # Регистрация пользователя; возвращает user_id
+        return self._insert_user(username, self._hash_new_password(username, password), callback)
+
+    def _hash_new_password(self, username, password):
+        # Проверка и хеширование данных нового пользователя без обращения к базе
+        if not username or not password:
+            raise ValidationError("Имя пользователя и пароль не могут быть пустыми")
+        return self.auth.hasher.hash(password)
+
+    def _insert_user(self, username, hashed_password, callback=None):
+        def insert(cursor):
+            try:
+                cursor.execute(USER_STATEMENTS['insert'], (username, hashed_password))
+            except sqlite3.IntegrityError:
+                raise AlreadyExistsError("Пользователь с таким именем уже существует") from None
+            return cursor.lastrowid
+        return self._write(insert, callback)
+
+    def authenticate(self, username, password):
+        # Проверка имени и пароля; возвращает user_id. Хеш устаревшего формата заменяется новым
+        user_id, stored_hash, new_hash = self._verify_login(username, password)
+        if new_hash and not self.read_only:
+            self.rehash_password(username, password, user_id, stored_hash, new_hash)
+        return user_id
+
+    def login(self, username, password):
+        # Вход с открытием сеанса; возвращает Session, токен которого передаётся в операции клиента
+        return self.auth.sessions.create(self.authenticate(username, password))
+
+    def logout(self, token):
+        self.auth.sessions.revoke(token)
+
+    def session_user(self, token):
+        # user_id действующего сеанса или AuthenticationError
+        return self.auth.sessions.get(token).user_id
+
+    def _verify_login(self, username, password):
+        # (user_id, хеш в базе, новый хеш или None) без записи в базу - годится и для реплики
+        cursor = self.conn.cursor()
+        cursor.execute(USER_STATEMENTS['by_name'], (username,))
+        row = cursor.fetchone()
+        user_id, new_hash = self.auth.verify(username, password, row)
+        return user_id, row[1], new_hash
+
+    def rehash_password(self, username, password, user_id, stored_hash, new_hash):
+        # Замена хеша после успешного входа, только если пароль не сменили параллельно
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute(USER_STATEMENTS['rehash'], (new_hash, user_id, stored_hash))
+        if cursor.rowcount:
+            self.auth.credentials.remember(username, password, new_hash)
+
+    def get_user(self, user_id):
+        cursor = self.conn.cursor()
+        cursor.execute(USER_STATEMENTS['get'], (user_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise NotFoundError("Пользователь с указанным ID не найден")
+        return User(*row)
+
+    def update_user(self, user_id, username, password):
+        if not username or not password:
+            raise ValidationError("Имя пользователя и пароль не могут быть пустыми")
+        hashed_password = self.auth.hasher.hash(password)
+        try:
+            with self.conn:
+                cursor = self.conn.cursor()
+                cursor.execute(USER_STATEMENTS['update'], (username, hashed_password, user_id))
+        except sqlite3.IntegrityError:
+            raise AlreadyExistsError("Пользователь с таким именем уже существует") from None
+        if cursor.rowcount == 0:
+            raise NotFoundError("Пользователь с указанным ID не найден")
+        # Открытые со старым паролем сеансы закрываются
+        self.auth.sessions.revoke_user(user_id)
+
+    def delete_user(self, user_id):
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute(USER_STATEMENTS['delete'], (user_id,))
+        if cursor.rowcount == 0:
+            raise NotFoundError("Пользователь с указанным ID не найден")
+        self.auth.sessions.revoke_user(user_id)
+
+    def _validate_item(self, title, price, quantity):
+        if not title:
+            raise ValidationError("Название товара не может быть пустым")
+        if not isinstance(price, int) or isinstance(price, bool):
+            raise ValidationError("Цена указывается целым числом копеек")
+        if price < 0:
+            raise ValidationError("Цена не может быть отрицательной")
+        if quantity is None or quantity < 0:
+            raise ValidationError("Количество не может быть отрицательным")
+
+    def add_bike(self, model, brand, price, quantity, callback=None):
+        # Добавление велосипеда в инвентарь; возвращает bike_id
+        self._validate_item(model, price, quantity)
+
+        return self.insert_rows('Велосипеды', [{'model': model, 'brand': brand, 'price': price, 'quantity': quantity}],
+                                callback)
+
+    def add_bike_part(self, name, category, price, quantity, callback=None):
+        # Добавление запчасти в инвентарь; возвращает part_id
+        self._validate_item(name, price, quantity)
+
+        return self.insert_rows('Запчасти', [{'name': name, 'category': category, 'price': price, 'quantity': quantity}],
+                                callback)
+
+    def import_bikes(self, rows, chunk_size=1000, upsert=False, progress=None):
+        # Пакетный импорт велосипедов: строки - словари или кортежи (model, brand, price, quantity), цена в копейках
+        return self._import_items('Велосипеды', rows, chunk_size, upsert, progress)
+
+    def import_parts(self, rows, chunk_size=1000, upsert=False, progress=None):
+        # Пакетный импорт запчастей: строки - словари или кортежи (name, category, price, quantity), цена в копейках
+        return self._import_items('Запчасти', rows, chunk_size, upsert, progress)
+
+    def import_catalogue_file(self, path, item_type, chunk_size=1000, upsert=False, progress=None, file_format=None):
+        # Потоковая загрузка каталога из CSV (с заголовком) или JSONL без чтения файла целиком.
+        # Цены в файле - рубли, как их вводит человек; в ядро они передаются копейками.
+        # Некорректная строка - ValidationError с номером строки файла; порции до неё уже записаны
+        import csv
+        table, _ = ITEM_TABLES[item_type]
+        if file_format is None:
+            file_format = 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+        with open(path, encoding='utf-8', newline='') as f:
+            if file_format == 'csv':
+                reader = csv.DictReader(f)
+                rows = ((reader.line_num, row) for row in reader)
+            elif file_format == 'jsonl':
+                rows = ((line_number, line) for line_number, line in enumerate(f, 1) if line.strip())
+            else:
+                raise ValueError(f"Неизвестный формат файла: {file_format}")
+            return self._import_items(table, self._parse_catalogue_rows(table, rows, file_format), chunk_size, upsert,
+                                      progress)
+
+    @staticmethod
+    def _parse_catalogue_rows(table, rows, file_format):
+        # Строки файла (номер строки, текст или словарь) -> (название, группа, цена в копейках, количество)
+        columns, _ = IMPORT_COLUMNS[table]
+        for line_number, row in rows:
+            try:
+                if file_format == 'jsonl':
+                    row = json.loads(row)
+                title, subtitle, price, quantity = [row[column] for column in columns]
+                yield title, subtitle, to_kopecks(price), int(quantity)
+            except (ShopError, KeyError, ValueError, TypeError) as e:
+                raise import_row_error(line_number, e) from None
+
+    def _import_items(self, table, rows, chunk_size, upsert, progress):
+        # Импорт порциями по chunk_size строк, каждая порция - одна транзакция
+        columns, _ = IMPORT_COLUMNS[table]
+        insert_sql, update_sql = import_sql(table, upsert)
+
+        imported = 0
+        chunk = []
+        for number, row in enumerate(rows, 1):
+            try:
+                if isinstance(row, dict):
+                    row = [row[column] for column in columns]
+                title, subtitle, price, quantity = row
+                chunk.append((title, subtitle, int(price), int(quantity)))
+            except (KeyError, ValueError, TypeError) as e:
+                raise import_row_error(number, e) from None
+            if len(chunk) >= chunk_size:
+                imported += self._import_chunk(table, chunk, insert_sql, update_sql)
+                chunk = []
+                if progress:
+                    progress(imported)
+        if chunk:
+            imported += self._import_chunk(table, chunk, insert_sql, update_sql)
+            if progress:
+                progress(imported)
+        return imported
+
+    def _import_chunk(self, table, chunk, insert_sql, update_sql):
+        columns, natural_key = IMPORT_COLUMNS[table]
+        with self.conn:
+            cursor = self.conn.cursor()
+            if update_sql is None:
+                cursor.executemany(insert_sql, chunk)
+                return len(chunk)
+
+            # Внутри порции побеждает последняя строка с тем же естественным ключом
+            key_positions = [columns.index(column) for column in natural_key]
+            other_positions = [i for i, column in enumerate(columns) if column not in natural_key]
+            latest = {}
+            for row in chunk:
+                latest[tuple(row[i] for i in key_positions)] = row
+            cursor.executemany(update_sql, [tuple(row[i] for i in other_positions) + key
+                                            for key, row in latest.items()])
+            cursor.executemany(insert_sql, [row + key for key, row in latest.items()])
+        # Обновлённые строки могли лежать в кэше, а их id заранее неизвестны
+        self.cache.invalidate_type(TABLE_ITEM_TYPES[table])
+        return len(chunk)
+
+    def place_order(self, user_id, items, hold_id=None):
+        # Оформление заказа; возвращает OrderResult, при нехватке товара поднимает OutOfStockError
+        result = self.checkout(user_id, items, hold_id)
+        if result.order_id is None:
+            raise OutOfStockError(result.failures)
+        return result
+
+    def close_connection(self):
+        # Закрытие соединения с базой данных; отложенные записи сначала фиксируются
+        if self.write_behind is not None:
+            self.write_behind.close()
+            self.write_behind = None
+        self.conn.close()
+
+    def save_to_database(self, data, table_name, callback=None):
+        # Общий метод для сохранения данных в базу данных: имена таблицы и столбцов проверяются по схеме
+        return self.insert_rows(table_name, [data], callback)
+
+    def insert_rows(self, table, rows, callback=None):
+        # Вставка строк-словарей; строки с одинаковым набором столбцов - один executemany.
+        # Возвращает id последней вставленной строки
+        groups = self._group_rows(table, rows)
+
+        def insert(cursor):
+            for columns, values in groups.items():
+                if len(values) == 1:
+                    cursor.execute(self.tables.sql('insert', table, columns), values[0])
+                else:
+                    cursor.executemany(self.tables.sql('insert', table, columns), values)
+            # После executemany lastrowid не заполняется
+            return cursor.lastrowid or cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+        return self._write(insert, callback)
+
+    def update_rows(self, table, rows, callback=None):
+        # Изменение строк по первичному ключу: словари со значением ключа и новыми значениями столбцов.
+        # Одна транзакция, по executemany на набор столбцов; возвращает список отсутствующих id
+        stale = []
+        return self._write(self._update_operation(table, rows, stale), callback, stale)
+
+    def delete_rows(self, table, ids, callback=None):
+        # Удаление строк по первичному ключу одним executemany; возвращает список отсутствующих id
+        stale = []
+        return self._write(self._delete_operation(table, ids, stale), callback, stale)
+
+    def _update_operation(self, table, rows, stale):
+        # Операция для _write; ключи кэша изменённых строк каталога добавляются в stale
+        primary_key = self.tables.table(table).primary_key
+        rows = list(rows)
+        for row in rows:
+            if primary_key not in row:
+                raise ValidationError(f"Не указан {primary_key} для изменения строки {table}")
+        ids = [row[primary_key] for row in rows]
+
+        def update(cursor):
+            existing = self._existing_ids(cursor, table, ids)
+            groups = self._group_rows(table, (row for row in rows if row[primary_key] in existing), primary_key)
+            for columns, values in groups.items():
+                cursor.executemany(self.tables.sql('update', table, columns, (primary_key,)), values)
+            stale.extend(self._cache_keys(table, existing))
+            return [item_id for item_id in ids if item_id not in existing]
+        return update
+
+    def _delete_operation(self, table, ids, stale):
+        primary_key = self.tables.table(table).primary_key
+        ids = list(ids)
+
+        def delete(cursor):
+            existing = self._existing_ids(cursor, table, ids)
+            cursor.executemany(self.tables.sql('delete', table, keys=(primary_key,)),
+                               [(item_id,) for item_id in existing])
+            stale.extend(self._cache_keys(table, existing))
+            return [item_id for item_id in ids if item_id not in existing]
+        return delete
+
+    def select_rows(self, table, columns=None, where=None):
+        # Строки таблицы по равенству столбцов where ({столбец: значение}); список кортежей
+        meta = self.tables.table(table)
+        where = where or {}
+        cursor = self.conn.cursor()
+        cursor.execute(self.tables.sql('select', table, columns or meta.columns, where), tuple(where.values()))
+        return cursor.fetchall()
+
+    def get_rows(self, table, ids, columns=None, chunk_size=500):
+        # Строки по списку первичных ключей запросами IN порциями по chunk_size; список кортежей
+        meta = self.tables.table(table)
+        ids = list(ids)
+        cursor = self.conn.cursor()
+        rows = []
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            cursor.execute(self.tables.sql('select-in', table, columns or meta.columns, (meta.primary_key,), len(chunk)),
+                           chunk)
+            rows += cursor.fetchall()
+        return rows
+
+    def _group_rows(self, table, rows, primary_key=None):
+        # Группировка строк-словарей по набору столбцов: {(столбцы...): [значения...]}.
+        # Ключ primary_key ставится в конец значений - для условия WHERE
+        groups = {}
+        for row in rows:
+            columns = tuple(column for column in row if column != primary_key)
+            values = tuple(row[column] for column in columns)
+            if primary_key is not None:
+                values += (row[primary_key],)
+            groups.setdefault(columns, []).append(values)
+        for columns in groups:
+            self.tables.check(table, columns)
+        return groups
+
+    def _existing_ids(self, cursor, table, ids, chunk_size=500):
+        # Какие из ids есть в таблице: запросы IN по первичному ключу порциями
+        primary_key = self.tables.table(table).primary_key
+        unique = list(set(ids))
+        existing = set()
+        for start in range(0, len(unique), chunk_size):
+            chunk = unique[start:start + chunk_size]
+            cursor.execute(self.tables.sql('select-in', table, (primary_key,), (primary_key,), len(chunk)), chunk)
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
+
+    def _cache_keys(self, table, ids):
+        # Ключи кэша каталога для строк table (для прочих таблиц - пусто)
+        if table not in TABLE_ITEM_TYPES:
+            return []
+        return [(TABLE_ITEM_TYPES[table], item_id) for item_id in ids]
+
+
+    def create_staff(self, staff_name, callback=None):
+        # Добавление сотрудника; возвращает staff_id
+        if not staff_name:
+            raise ValidationError("Имя сотрудника не может быть пустым")
+
+        def insert(cursor):
+            cursor.execute(STAFF_STATEMENTS['insert'], (staff_name,))
+            return cursor.lastrowid
+        return self._write(insert, callback)
+
+    def get_staff(self, staff_id):
+        cursor = self.conn.cursor()
+        cursor.execute(STAFF_STATEMENTS['get'], (staff_id,))
+        row = cursor.fetchone()
+        if row is None:
+            raise NotFoundError("Сотрудник с указанным ID не найден")
+        return Staff(*row)
+
+    def rename_staff(self, staff_id, staff_name, callback=None):
+        if not staff_name:
+            raise ValidationError("Имя сотрудника не может быть пустым")
+
+        def update(cursor):
+            cursor.execute(STAFF_STATEMENTS['rename'], (staff_name, staff_id))
+            if cursor.rowcount == 0:
+                raise NotFoundError("Сотрудник с указанным ID не найден")
+        return self._write(update, callback)
+
+    def remove_staff(self, staff_id):
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute(STAFF_STATEMENTS['delete'], (staff_id,))
+        if cursor.rowcount == 0:
+            raise NotFoundError("Сотрудник с указанным ID не найден")
+
+    def save_bike_to_database(self, model, brand, price, quantity):
+        # Метод для сохранения данных о велосипеде в базу данных; возвращает bike_id
+        return self.add_bike(model, brand, price, quantity)
+
+    def save_part_to_database(self, name, category, price, quantity):
+        # Метод для сохранения данных о запчасти в базу данных; возвращает part_id
+        return self.add_bike_part(name, category, price, quantity)
+
+    def modify_bike_in_database(self, bike_id, model, brand, price, quantity):
+        # Метод для изменения данных о велосипеде в базе данных
+        self._validate_item(model, price, quantity)
+        row = {'bike_id': int(bike_id), 'model': model, 'brand': brand, 'price': price, 'quantity': quantity}
+        stale = []
+        return self._require_rows(self._update_operation('Велосипеды', [row], stale),
+                                  "Велосипед с указанным ID не найден", stale)
+
+    def modify_part_in_database(self, part_id, name, category, price, quantity):
+        # Метод для изменения данных о запчасти в базе данных
+        self._validate_item(name, price, quantity)
+        row = {'part_id': int(part_id), 'name': name, 'category': category, 'price': price, 'quantity': quantity}
+        stale = []
+        return self._require_rows(self._update_operation('Запчасти', [row], stale),
+                                  "Запчасть с указанным ID не найдена", stale)
+
+    def delete_bike_from_database(self, bike_id):
+        # Метод для удаления данных о велосипеде из базы данных
+        stale = []
+        return self._require_rows(self._delete_operation('Велосипеды', [int(bike_id)], stale),
+                                  "Велосипед с указанным ID не найден", stale)
+
+    def delete_part_from_database(self, part_id):
+        # Метод для удаления данных о запчасти из базы данных
+        stale = []
+        return self._require_rows(self._delete_operation('Запчасти', [int(part_id)], stale),
+                                  "Запчасть с указанным ID не найдена", stale)
+
+    def modify_items(self, changes, callback=None):
+        # Пакетное изменение товаров: словари с item_type, item_id и новыми значениями полей каталога
+        # (model/brand или name/category, price, quantity). Одна транзакция, по executemany на таблицу
+        # и набор полей; возвращает список (item_type, item_id) отсутствующих товаров
+        rows_by_table = {}
+        for change in changes:
+            change = dict(change)
+            table, id_column = self._item_table(change.pop('item_type', None))
+            item_id = int(change.pop('item_id'))
+            if not change:
+                raise ValidationError(f"Нет полей для изменения товара {item_id}")
+            for column in change:
+                if column not in CATALOGUE_ROW_COLUMNS[table][1:]:
+                    raise ValidationError(f"Недопустимое поле товара: {column}")
+            self._validate_item(change.get(CATALOGUE_ROW_COLUMNS[table][1], True),
+                                change.get('price', 0), change.get('quantity', 0))
+            rows_by_table.setdefault(table, []).append({id_column: item_id, **change})
+        stale = []
+        return self._write(self._items_operation(
+            [(table, self._update_operation(table, rows, stale)) for table, rows in rows_by_table.items()]),
+            callback, stale)
+
+    def delete_items(self, items, callback=None):
+        # Пакетное удаление товаров по парам (item_type, item_id) одной транзакцией, по executemany
+        # на таблицу; возвращает список (item_type, item_id) отсутствующих товаров
+        ids_by_table = {}
+        for item_type, item_id in items:
+            ids_by_table.setdefault(self._item_table(item_type)[0], []).append(int(item_id))
+        stale = []
+        return self._write(self._items_operation(
+            [(table, self._delete_operation(table, ids, stale)) for table, ids in ids_by_table.items()]),
+            callback, stale)
+
+    def _item_table(self, item_type):
+        if item_type not in ITEM_TABLES:
+            raise ValidationError("Неверный тип товара. Допустимые значения: 'Велосипед' или 'Запчасть'.")
+        return ITEM_TABLES[item_type]
+
+    def _items_operation(self, operations):
+        # Объединение операций update/delete по таблицам каталога в одну; результат - отсутствующие товары
+        def run(cursor):
+            missing = []
+            for table, operation in operations:
+                missing += [(TABLE_ITEM_TYPES[table], item_id) for item_id in operation(cursor)]
+            return missing
+        return run
+
+    def reprice(self, percent=0, markup=0, item_type=None, brand=None, category=None, dry_run=False, callback=None):
+        # Переоценка одним UPDATE на таблицу каталога: цена * (100 + percent) / 100 + markup копеек
+        # (не ниже нуля). brand ограничивает велосипеды, category - запчасти; с фильтром только по одному
+        # из них другая таблица не меняется. dry_run - список PriceChange без записи; иначе - число
+        # изменённых товаров. percent - до сотых процента (-10 - уценка на 10%).
+        basis_points = int(round((100 + Decimal(str(percent))) * 100))
+        if basis_points < 0:
+            raise ValidationError("Уценка не может быть больше 100%")
+        if not isinstance(markup, int):
+            raise ValidationError("Надбавка указывается целым числом копеек")
+        filters = {'Велосипеды': brand, 'Запчасти': category}
+        targets = []
+        for table_type, (table, _) in ITEM_TABLES.items():
+            if item_type not in (None, table_type):
+                continue
+            value = filters[table]
+            if value is None and (brand is not None or category is not None):
+                continue
+            targets.append((table_type, table, value))
+        params = {'basis_points': basis_points, 'markup': markup}
+
+        if dry_run:
+            changes = []
+            cursor = self.conn.cursor()
+            for table_type, table, value in targets:
+                cursor.execute(reprice_sql(table, value is not None, dry_run=True), {**params, 'value': value})
+                changes += [PriceChange(table_type, *row) for row in cursor]
+            return changes
+
+        stale = []
+
+        def update(cursor):
+            changed = 0
+            for table_type, table, value in targets:
+                cursor.execute(reprice_sql(table, value is not None), {**params, 'value': value})
+                ids = [row[0] for row in cursor.fetchall()]
+                stale.extend((table_type, item_id) for item_id in ids)
+                changed += len(ids)
+            return changed
+        return self._write(update, callback, stale)
+
+    def set_reorder_level(self, item_type, item_id, level):
+        # Порог дозаказа товара: при остатке не больше level товар попадает в low_stock; None - не следить
+        table, rows = self._reorder_rows(item_type, {int(item_id): level})
+        stale = []
+        return self._require_rows(self._update_operation(table, rows, stale),
+                                  "Товар с указанным ID не найден", stale)
+
+    def set_reorder_levels(self, item_type, levels, callback=None):
+        # Пороги дозаказа {item_id: порог} одной транзакцией; возвращает список отсутствующих id
+        table, rows = self._reorder_rows(item_type, levels)
+        return self.update_rows(table, rows, callback)
+
+    def _reorder_rows(self, item_type, levels):
+        table, id_column = self._item_table(item_type)
+        for level in levels.values():
+            if level is not None and level < 0:
+                raise ValidationError("Порог дозаказа не может быть отрицательным")
+        return table, [{id_column: item_id, 'reorder_level': level} for item_id, level in levels.items()]
+
+    def low_stock(self, item_type=None):
+        # Товары с остатком не выше порога дозаказа (LowStockItem) - чтение НизкийОстаток по ключу
+        cursor = self.conn.cursor()
+        items = []
+        for current_type in ([item_type] if item_type else ITEM_TABLES):
+            cursor.execute(LOW_STOCK_SQL, (current_type,))
+            items += map(LowStockItem._make, cursor.fetchall())
+        return items
+
+    def _require_rows(self, operation, message, stale=None):
+        # Операция update/delete, в которой отсутствие строки - ошибка NotFoundError
+        def require(cursor):
+            if operation(cursor):
+                raise NotFoundError(message)
+        return self._write(require, stale=stale)
+
+    def search_bikes_in_database(self, search_attribute, search_value):
+        # Метод для поиска велосипедов по точному значению атрибута
+        return self._search_items_by_attribute('Велосипеды', search_attribute, search_value)
+
+    def search_parts_in_database(self, search_attribute, search_value):
+        # Метод для поиска запчастей по точному значению атрибута
+        return self._search_items_by_attribute('Запчасти', search_attribute, search_value)
+
+    def _search_items_by_attribute(self, table, search_attribute, search_value):
+        columns = CATALOGUE_ROW_COLUMNS[table]
+        if search_attribute not in columns:
+            raise ValidationError(f"Недопустимый атрибут для поиска: {search_attribute}")
+        return [CatalogueItem(*row) for row in self.select_rows(table, columns, {search_attribute: search_value})]
+
+    def check_availability_in_database(self, item_id, item_type, quantity, hold_id=None):
+        # Метод для проверки наличия выбранного товара в указанном количестве с учётом чужих броней
+        return self.available_quantities(item_type, [item_id], hold_id).get(item_id, 0) >= quantity
+
+    def held_quantities(self, item_type, item_ids, hold_id=None):
+        # Сумма активных броней по товарам (кроме корзины hold_id) одним запросом по индексу; {item_id: штук}
+        item_ids = list(set(item_ids))
+        placeholders = ', '.join('?' for _ in item_ids)
+        cursor = self.conn.cursor()
+        cursor.execute(HELD_QUANTITIES_SQL.format(placeholders=placeholders), [item_type, *item_ids, time.time(), hold_id])
+        return dict(cursor.fetchall())
+
+    def available_quantities(self, item_type, item_ids, hold_id=None):
+        # Доступный остаток: склад (через кэш каталога) минус активные брони других корзин; {item_id: штук}
+        items = self.get_items(item_type, item_ids)
+        held = self.held_quantities(item_type, items, hold_id) if items else {}
+        return {item_id: item.quantity - held.get(item_id, 0) for item_id, item in items.items()}
+
+    def new_hold(self):
+        # Идентификатор новой корзины для броней
+        return secrets.token_urlsafe(12)
+
+    def reserve(self, hold_id, item_id, item_type, quantity, ttl=HOLD_TTL):
+        # Бронь товара в корзину hold_id на ttl секунд; проверка остатка и вставка - одна инструкция,
+        # так что два кассира не забронируют одну и ту же единицу. Продлевает срок остальных броней корзины.
+        if item_type not in ITEM_TABLES:
+            raise ValidationError("Неверный тип товара. Допустимые значения: 'Велосипед' или 'Запчасть'.")
+        if quantity <= 0:
+            raise ValidationError("Количество должно быть положительным")
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute(ITEM_STATEMENTS[item_type]['reserve'],
+                           (hold_id, item_type, item_id, quantity, now + ttl, item_id, item_type, item_id, now, None, quantity))
+            reservation_id = cursor.lastrowid if cursor.rowcount else None
+            if reservation_id:
+                cursor.execute(HOLD_STATEMENTS['extend'], (now + ttl, hold_id))
+        if reservation_id is None:
+            available = self.available_quantities(item_type, [item_id]).get(item_id)
+            reason = 'товар не найден' if available is None else f'недостаточно на складе (доступно {available} шт.)'
+            raise OutOfStockError([LineFailure(item_id, item_type, quantity, reason)])
+        return reservation_id
+
+    def extend_hold(self, hold_id, ttl=HOLD_TTL):
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute(HOLD_STATEMENTS['extend'], (time.time() + ttl, hold_id))
+        return cursor.rowcount
+
+    def release_hold(self, hold_id):
+        # Снятие всех броней корзины (заказ отменён)
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute(HOLD_STATEMENTS['release'], (hold_id,))
+        return cursor.rowcount
+
+    def release_expired_holds(self, batch_size=500):
+        # Удаление одной пачки истёкших броней; возвращает число удалённых строк
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute(HOLD_STATEMENTS['expire'], (time.time(), batch_size))
+        return cursor.rowcount
+
+    def get_items(self, item_type, item_ids):
+        # Строки каталога из кэша, промахи - запросами IN по первичному ключу; {item_id: CatalogueItem}
+        table, _ = ITEM_TABLES[item_type]
+        rows, missing = {}, []
+        for item_id in set(item_ids):
+            row = self.cache.get((item_type, item_id))
+            if row is None:
+                missing.append(item_id)
+            else:
+                rows[item_id] = row
+        if missing:
+            generation = self.cache.generation
+            for row in map(CatalogueItem._make, self.get_rows(table, missing, CATALOGUE_ROW_COLUMNS[table])):
+                rows[row.item_id] = row
+                self.cache.put((item_type, row[0]), row, generation)
+        return rows
+
+    def get_item(self, item_type, item_id):
+        # Одна строка каталога (CatalogueItem) через кэш или None
+        return self.get_items(item_type, [item_id]).get(item_id)
+
+    def sku_id(self, item_type, item_id):
+        # sku_id товара в едином пространстве Товары или None
+        if item_type not in ITEM_TABLES:
+            raise ValidationError("Неверный тип товара. Допустимые значения: 'Велосипед' или 'Запчасть'.")
+        row = self.conn.execute(ITEM_STATEMENTS[item_type]['sku'], (item_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_skus(self, sku_ids, chunk_size=500):
+        # Строки каталога любого типа по sku_id запросами IN к представлению Каталог; {sku_id: SkuItem}.
+        # У удалённого товара sku_id остаётся, а название, цена и остаток - None
+        sku_ids = list(set(sku_ids))
+        cursor = self.conn.cursor()
+        rows = {}
+        for start in range(0, len(sku_ids), chunk_size):
+            chunk = sku_ids[start:start + chunk_size]
+            cursor.execute(CATALOGUE_SKUS_SQL.format(placeholders=', '.join('?' * len(chunk))), chunk)
+            for sku_id, type_code, *values in cursor:
+                rows[sku_id] = SkuItem(sku_id, TYPE_CODE_ITEM_TYPES[type_code], *values)
+        return rows
+
+    def checkout(self, user_id, items, hold_id=None):
+        # Атомарное оформление заказа: резервирование всех позиций, вставка заказа
+        # и его деталей выполняются в одной транзакции BEGIN IMMEDIATE с одним commit.
+        # Возвращает OrderResult; при любой неудачной позиции заказ целиком откатывается,
+        # order_id равен None, а failures содержит LineFailure по каждой проблемной строке.
+        # Брони других корзин остаток уменьшают; брони корзины hold_id снимаются вместе с заказом.
+        failures = [LineFailure(item_id, item_type, quantity, 'неизвестный тип товара')
+                    for item_id, item_type, quantity in items
+                    if item_type not in ITEM_TABLES]
+        failures += [LineFailure(item_id, item_type, quantity, 'некорректное количество')
+                     for item_id, item_type, quantity in items
+                     if item_type in ITEM_TABLES and quantity <= 0]
+        if failures or not items:
+            return OrderResult(None, 0, failures)
+
+        # Группировка строк по типам товара для пакетных запросов
+        lines_by_type = {}
+        for item_id, item_type, quantity in items:
+            lines_by_type.setdefault(item_type, []).append((item_id, quantity))
+
+        now = time.time()
+        cursor = self.conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            prices = {}
+            reserved = True
+            for item_type, lines in lines_by_type.items():
+                # Условное списание: строка обновляется, только если остатка за вычетом чужих броней хватает.
+                # Цена продажи читается той же инструкцией под блокировкой записи, а не из кэша каталога:
+                # цену могли изменить в другом соединении. executemany строки RETURNING не отдаёт
+                type_prices = prices[item_type] = {}
+                statement = ITEM_STATEMENTS[item_type]['decrement']
+                for item_id, quantity in lines:
+                    row = cursor.execute(statement, (quantity, item_id, item_type, item_id, now, hold_id, quantity)).fetchone()
+                    if row is None:
+                        reserved = False
+                        break
+                    type_prices[item_id] = row[0]
+                if not reserved:
+                    break
+
+            if not reserved:
+                self.conn.rollback()
+                failures = self._diagnose_order_lines(items, hold_id)
+                # Остаток мог измениться другим кассиром сразу после отката
+                return OrderResult(None, 0, failures or [
+                    LineFailure(item_id, item_type, quantity, 'остаток изменился, повторите заказ')
+                    for item_id, item_type, quantity in items])
+
+            order_total = 0
+            for item_id, item_type, quantity in items:
+                order_total += prices[item_type][item_id] * quantity
+
+            order_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            cursor.execute(ORDER_STATEMENTS['insert'], (user_id, order_date))
+            order_id = cursor.lastrowid
+            # Цена на момент продажи сохраняется в строке заказа (по ней считаются сводки продаж)
+            cursor.executemany(ORDER_LINE_INSERT_SQL,
+                               [(order_id, item_id, item_type, quantity, prices[item_type][item_id],
+                                 ITEM_TYPE_CODES[item_type], item_id)
+                                for item_id, item_type, quantity in items])
+            # Проводка по заказу в бухгалтерии - в той же транзакции, что и сам заказ
+            cursor.execute(TRANSACTION_STATEMENTS['posting'], (user_id, order_total, order_date, order_id))
+            if hold_id is not None:
+                cursor.execute(HOLD_STATEMENTS['release'], (hold_id,))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        finally:
+            # Остатки списанных позиций в кэше больше не актуальны
+            self.cache.invalidate({(item_type, item_id) for item_id, item_type, _ in items})
+
+        return OrderResult(order_id, order_total, [])
+
+    def _diagnose_order_lines(self, items, hold_id=None):
+        # Определение причин отказа по каждой строке заказа (вне транзакции списания)
+        demand = {}
+        for item_id, item_type, quantity in items:
+            demand[(item_type, item_id)] = demand.get((item_type, item_id), 0) + quantity
+
+        cursor = self.conn.cursor()
+        now = time.time()
+        failures = []
+        for item_id, item_type, quantity in items:
+            cursor.execute(ITEM_STATEMENTS[item_type]['available'], (item_type, item_id, now, hold_id, item_id))
+            row = cursor.fetchone()
+            if row is None:
+                failures.append(LineFailure(item_id, item_type, quantity, 'товар не найден'))
+            elif row[0] < demand[(item_type, item_id)]:
+                failures.append(LineFailure(item_id, item_type, quantity, f'недостаточно на складе (доступно {row[0]} шт.)'))
+        return failures
+
+    def create_transaction(self, user_id, amount, callback=None):
+        # Запись транзакции без диалога; возвращает transaction_id
+        transaction_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        def insert(cursor):
+            cursor.execute(TRANSACTION_STATEMENTS['insert'], (user_id, amount, transaction_date))
+            return cursor.lastrowid
+        return self._write(insert, callback)
+
+    def set_transaction_amount(self, transaction_id, amount):
+        # Изменение суммы транзакции
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute(TRANSACTION_STATEMENTS['set_amount'], (amount, transaction_id))
+        if cursor.rowcount == 0:
+            raise NotFoundError("Транзакция с указанным ID не найдена")
+
+    def remove_transaction(self, transaction_id):
+        # Удаление транзакции
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute(TRANSACTION_STATEMENTS['delete'], (transaction_id,))
+        if cursor.rowcount == 0:
+            raise NotFoundError("Транзакция с указанным ID не найдена")
+
+    def find_transactions(self, user_id):
+        # Транзакции пользователя
+        cursor = self.conn.cursor()
+        cursor.execute(TRANSACTION_STATEMENTS['by_user'], (user_id,))
+        return [Transaction(*row) for row in cursor.fetchall()]
+
+    def list_orders(self, user_id):
+        # Заказы пользователя
+        cursor = self.conn.cursor()
+        cursor.execute(ORDER_STATEMENTS['by_user'], (user_id,))
+        return [Order(*row) for row in cursor.fetchall()]
+
+    def order_history(self, user_id, start=None, end=None, cursor=None, limit=20):
+        # Страница истории заказов пользователя (новые первыми) со строками и суммами - два запроса:
+        # заказы страницы по индексу (user_id, order_date, order_id) и строки всех заказов страницы.
+        # start/end - даты 'YYYY-MM-DD' включительно, cursor - next_cursor предыдущей страницы.
+        last_date, last_id = cursor or ('9999', 0)
+        db_cursor = self.conn.cursor()
+        db_cursor.execute(ORDER_HISTORY_SQL, (user_id, start or '', (end or '9999') + ' 99', last_date, last_date, last_id,
+                                              limit + 1))
+        orders = db_cursor.fetchall()
+        has_more = len(orders) > limit
+        orders = orders[:limit]
+        if not orders:
+            return OrderHistoryPage([], None)
+
+        lines = {order_id: [] for order_id, _ in orders}
+        placeholders = ', '.join('?' for _ in orders)
+        db_cursor.execute(ORDER_LINES_SQL.format(placeholders=placeholders), list(lines))
+        for order_id, *line in db_cursor.fetchall():
+            lines[order_id].append(OrderLine(*line))
+
+        summaries = [OrderSummary(order_id, order_date,
+                                  sum(line.quantity * (line.unit_price or 0) for line in lines[order_id]), lines[order_id])
+                     for order_id, order_date in orders]
+        return OrderHistoryPage(summaries, (orders[-1][1], orders[-1][0]) if has_more else None)
+
+    def iter_order_history(self, user_id, start=None, end=None, page_size=None):
+        # Все страницы истории заказов подряд (для show_pages и выгрузок)
+        cursor = None
+        while True:
+            page = self.order_history(user_id, start, end, cursor, page_size or self.page_size)
+            if page.orders:
+                yield page.orders
+            if page.next_cursor is None:
+                return
+            cursor = page.next_cursor
+
+    def search_catalogue(self, term, page=1, page_size=20):
+        # Полнотекстовый поиск по велосипедам и запчастям, страница page (с 1) из page_size строк.
+        # Строки - SearchHit: title - модель/название, subtitle - бренд/категория
+        query = fts_prefix_query(term)
+        if not query:
+            return []
+        cursor = self.conn.cursor()
+        cursor.execute(CATALOGUE_SEARCH_SQL, (query, query, page_size, (page - 1) * page_size))
+        return [SearchHit(*row) for row in cursor.fetchall()]
+
+    def search_users(self, term, page=1, page_size=20):
+        # Поиск пользователей по подстроке имени без учёта регистра
+        cursor = self.conn.cursor()
+        if len(term) < 3:
+            # Триграммный индекс не находит подстроки короче трёх символов
+            cursor.execute(USER_SEARCH_SHORT_SQL, (like_pattern(term.casefold()), page_size, (page - 1) * page_size))
+        else:
+            cursor.execute(USER_SEARCH_SQL, ('"' + term.replace('"', '""') + '"', page_size, (page - 1) * page_size))
+        return [User(*row) for row in cursor.fetchall()]
+
+
+# Ошибки обработчиков отложенной записи: ядро не пишет в stdout
+write_logger = logging.getLogger('velomagazin.write')
+
+
+class PendingWrite:
+    # Операция в очереди WriteBehindQueue: результат (или ошибка) появляется после group commit пачки
+    __slots__ = ('operation', 'callback', 'after_commit', 'submitted', '_done', '_result', '_error')
+
+    def __init__(self, operation, callback, after_commit=None):
+        self.operation = operation
+        self.callback = callback
+        # Вызывается после commit (или отката) пачки до того, как результат станет доступен
+        self.after_commit = after_commit
+        self.submitted = time.monotonic()
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    def _finish(self, result, error):
+        if self.after_commit is not None:
+            self.after_commit()
+        self._result = result
+        self._error = error
+        self._done.set()
+        if self.callback is not None:
+            try:
+                self.callback(result, error)
+            except Exception:
+                write_logger.exception("Ошибка в обработчике отложенной записи")
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        # Ожидание фиксации; возвращает результат операции или поднимает её ошибку
+        if not self._done.wait(timeout):
+            raise TimeoutError("Запись ещё не зафиксирована")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class WriteBehindQueue:
+    # Отложенная запись с групповым commit. Операции (функции от курсора) копятся в очереди, фоновый
+    # поток выполняет их пачками - по max_batch штук или через max_delay секунд после первой в пачке -
+    # в одной транзакции на своём соединении, так что один fsync приходится на всю пачку.
+    # Каждая операция идёт в своей точке сохранения: ошибка одной (например, занятое имя) откатывает
+    # только её. callback(result, error) вызывается из фонового потока после фиксации пачки.
+    # Записи в очереди не видны чтениям, пока пачка не зафиксирована (см. flush).
+    def __init__(self, db_path=None, max_batch=256, max_delay=0.01, profile='durable', metrics=None):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.profile = profile
+        self.metrics = metrics
+        self.batches = 0
+        self._pending = []
+        self._submitted = 0
+        self._completed = 0
+        self._flushing = 0
+        self._closing = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='velomagazin-write-behind', daemon=True)
+        self._thread.start()
+
+    def submit(self, operation, callback=None, after_commit=None):
+        write = PendingWrite(operation, callback, after_commit)
+        with self._condition:
+            if self._closing:
+                raise ShopError("Очередь отложенной записи закрыта")
+            self._pending.append(write)
+            self._submitted += 1
+            self._condition.notify_all()
+        return write
+
+    def flush(self):
+        # Ожидание фиксации всего, что поставлено в очередь до вызова
+        with self._condition:
+            target = self._submitted
+            self._flushing += 1
+            self._condition.notify_all()
+            while self._completed < target:
+                self._condition.wait()
+            self._flushing -= 1
+
+    def close(self):
+        # Фиксация оставшихся записей и остановка потока
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending and not self._closing:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            deadline = self._pending[0].submitted + self.max_delay
+            while len(self._pending) < self.max_batch and not self._closing and not self._flushing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            return batch
+
+    def _run(self):
+        shop = velomagazin(self.db_path, profile=self.profile)
+        if self.metrics is not None:
+            shop.instrument(self.metrics)
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                self._commit(shop, batch)
+        finally:
+            shop.close_connection()
+
+    def _commit(self, shop, batch):
+        cursor = shop.conn.cursor()
+        outcomes = []
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            for write in batch:
+                cursor.execute('SAVEPOINT write_behind')
+                try:
+                    outcomes.append((write.operation(cursor), None))
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write_behind')
+                    outcomes.append((None, e))
+                cursor.execute('RELEASE write_behind')
+            shop.conn.commit()
+        except sqlite3.Error as e:
+            shop.conn.rollback()
+            outcomes = [(None, e)] * len(batch)
+        self.batches += 1
+        for write, (result, error) in zip(batch, outcomes):
+            write._finish(result, error)
+        with self._condition:
+            self._completed += len(batch)
+            self._condition.notify_all()
+
+
+class HoldExpiryScheduler:
+    # Фоновый поток, который каждые interval секунд удаляет истёкшие брони пачками по batch_size строк.
+    # У потока своё соединение, каждая пачка - короткая транзакция, чтобы не задерживать кассиров.
+    # Доступный остаток истёкшие брони не уменьшают и до удаления: поток только чистит таблицу.
+    def __init__(self, db_path=None, interval=5.0, batch_size=500):
+        self.db_path = db_path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.released = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='velomagazin-holds', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        shop = velomagazin(self.db_path, profile='fast')
+        try:
+            while not self._stop.wait(self.interval):
+                self.run_once(shop)
+        finally:
+            shop.close_connection()
+
+    def run_once(self, shop):
+        # Пачки удаляются, пока очередная не окажется неполной; возвращает число снятых броней
+        released = 0
+        while True:
+            batch = shop.release_expired_holds(self.batch_size)
+            released += batch
+            if batch < self.batch_size:
+                break
+        self.released += released
+        return released
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+class ConnectionPool:
+    # Пул соединений для многопоточной работы: у каждого потока своё соединение только для чтения,
+    # все записи идут через единственное соединение-писатель под блокировкой (SQLite допускает
+    # одного писателя, так что очередь в Python дешевле ожидания на busy_timeout).
+    # Пока пул открыт, HoldExpiryScheduler раз в hold_interval секунд удаляет истёкшие брони (None - не запускать).
+    def __init__(self, db_path=None, profile='fast', page_size=50, auth=None, hold_interval=5.0):
+        self.db_path = db_path
+        self.page_size = page_size
+        # Общий кэш каталога: записи писателя сразу инвалидируют его для всех читателей
+        self.cache = InventoryCache()
+        # Общие для всех соединений кэш проверенных паролей, счётчики попыток входа и сеансы
+        self.auth = auth if auth is not None else Authenticator()
+        # Писатель создаётся первым: он создаёт и мигрирует схему для читателей
+        self._writer = velomagazin(db_path, page_size, profile, check_same_thread=False, cache=self.cache, auth=self.auth)
+        self._writer_lock = threading.Lock()
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        # Общие метрики SQL писателя и читателей (включаются instrument или VELOMAGAZIN_SLOW_MS)
+        self.metrics = self._writer.metrics
+        self.holds = HoldExpiryScheduler(self._writer.db_path, hold_interval).start() if hold_interval else None
+
+    def instrument(self, metrics=None):
+        # Метрики SQL для всех соединений пула, в том числе читателей, созданных позже
+        with self._writer_lock:
+            self.metrics = self._writer.instrument(metrics)
+        with self._readers_lock:
+            for shop in self._readers:
+                shop.instrument(self.metrics)
+        return self.metrics
+
+    @contextmanager
+    def reader(self):
+        # Соединение текущего потока только для чтения (создаётся при первом обращении)
+        shop = getattr(self._local, 'shop', None)
+        if shop is None:
+            shop = velomagazin(self._writer.db_path, self.page_size, 'readonly-replica', check_same_thread=False,
+                               cache=self.cache, auth=self.auth)
+            self._local.shop = shop
+            with self._readers_lock:
+                if self.metrics is not None:
+                    shop.instrument(self.metrics)
+                self._readers.append(shop)
+        yield shop
+
+    @contextmanager
+    def writer(self):
+        # Монопольный доступ к соединению-писателю
+        with self._writer_lock:
+            yield self._writer
+
+    def close(self):
+        if self.holds is not None:
+            self.holds.stop()
+        self.auth.sessions.close()
+        with self._readers_lock:
+            for shop in self._readers:
+                shop.close_connection()
+            self._readers.clear()
+        with self._writer_lock:
+            self._writer.close_connection()
+
+
+class ShopService:
+    # Тонкий сервисный слой над velomagazin без ввода-вывода: безопасен для вызова из ThreadPoolExecutor
+    def __init__(self, pool):
+        self.pool = pool
+
+    # Операции клиента принимают токен сеанса (см. login_user), а не user_id: один процесс
+    # обслуживает любое число клиентов, и клиент не может действовать от чужого имени.
+    def complete_order(self, token, items, hold_id=None):
+        # OrderResult - см. velomagazin.checkout
+        user_id = self.pool.auth.sessions.get(token).user_id
+        with self.pool.writer() as shop:
+            return shop.checkout(user_id, items, hold_id)
+
+    def hold_item(self, hold_id, item_id, item_type, quantity):
+        # Бронь позиции в корзину hold_id (новая корзина - velomagazin.new_hold)
+        with self.pool.writer() as shop:
+            return shop.reserve(hold_id, item_id, item_type, quantity)
+
+    def release_hold(self, hold_id):
+        with self.pool.writer() as shop:
+            return shop.release_hold(hold_id)
+
+    def view_bikes(self, page_size=None):
+        # Первая страница велосипедов в наличии
+        with self.pool.reader() as shop:
+            pages = shop.iter_pages('Велосипеды', ('bike_id', 'model', 'brand', 'price', 'quantity'),
+                                    {'quantity': ('>', 0)}, page_size=page_size)
+            return next(pages, [])
+
+    def search_items(self, term, page=1, page_size=20):
+        with self.pool.reader() as shop:
+            return shop.search_catalogue(term, page, page_size)
+
+    def register_user(self, username, password):
+        # KDF считается до захвата писателя, под блокировкой - только вставка
+        with self.pool.reader() as shop:
+            hashed_password = shop._hash_new_password(username, password)
+        with self.pool.writer() as shop:
+            return shop._insert_user(username, hashed_password)
+
+    def login_user(self, username, password):
+        # Открытие сеанса; возвращает Session. Пароль проверяется на соединении-читателе
+        # (KDF не держит блокировку писателя), перехеширование - короткая запись через писателя
+        with self.pool.reader() as shop:
+            user_id, stored_hash, new_hash = shop._verify_login(username, password)
+        if new_hash:
+            with self.pool.writer() as shop:
+                shop.rehash_password(username, password, user_id, stored_hash, new_hash)
+        return self.pool.auth.sessions.create(user_id)
+
+    def logout_user(self, token):
+        self.pool.auth.sessions.revoke(token)
+
+    def view_orders(self, token):
+        user_id = self.pool.auth.sessions.get(token).user_id
+        with self.pool.reader() as shop:
+            return shop.list_orders(user_id)
+
+    def order_history(self, token, start=None, end=None, cursor=None, limit=20):
+        # OrderHistoryPage - см. velomagazin.order_history
+        user_id = self.pool.auth.sessions.get(token).user_id
+        with self.pool.reader() as shop:
+            return shop.order_history(user_id, start, end, cursor, limit)
+
+    def add_transaction(self, user_id, amount):
+        with self.pool.writer() as shop:
+            return shop.create_transaction(user_id, amount)
+
+    def update_transaction(self, transaction_id, amount):
+        with self.pool.writer() as shop:
+            return shop.set_transaction_amount(transaction_id, amount)
+
+    def delete_transaction(self, transaction_id):
+        with self.pool.writer() as shop:
+            return shop.remove_transaction(transaction_id)
+
+    def search_transaction(self, user_id):
+        with self.pool.reader() as shop:
+            return shop.find_transactions(user_id)
+
+
+class AsyncVelomagazin:
+    # Асинхронный фронтенд: операции ShopService выполняются в ограниченном пуле потоков.
+    # Не более max_pending операций одновременно стоят в очереди или выполняются - остальные
+    # корутины ждут на семафоре, и цикл событий не копит неограниченную очередь работы.
+    def __init__(self, pool, max_workers=8, max_pending=64):
+        # asyncio и пул потоков импортируются только при использовании асинхронного фронтенда,
+        # чтобы не замедлять запуск ядра (см. python bench.py startup)
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        self.service = ShopService(pool)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='velomagazin')
+        self._pending = asyncio.Semaphore(max_pending)
+
+    async def _run(self, method, *args):
+        import asyncio
+        async with self._pending:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(method, *args))
+
+    async def register_user(self, username, password):
+        return await self._run(self.service.register_user, username, password)
+
+    async def login_user(self, username, password):
+        return await self._run(self.service.login_user, username, password)
+
+    async def logout_user(self, token):
+        return await self._run(self.service.logout_user, token)
+
+    async def complete_order(self, token, items, hold_id=None):
+        return await self._run(self.service.complete_order, token, items, hold_id)
+
+    async def hold_item(self, hold_id, item_id, item_type, quantity):
+        return await self._run(self.service.hold_item, hold_id, item_id, item_type, quantity)
+
+    async def release_hold(self, hold_id):
+        return await self._run(self.service.release_hold, hold_id)
+
+    async def view_orders(self, token):
+        return await self._run(self.service.view_orders, token)
+
+    async def order_history(self, token, start=None, end=None, cursor=None, limit=20):
+        return await self._run(self.service.order_history, token, start, end, cursor, limit)
+
+    async def search_items(self, term, page=1, page_size=20):
+        return await self._run(self.service.search_items, term, page, page_size)
+
+    async def add_transaction(self, user_id, amount):
+        return await self._run(self.service.add_transaction, user_id, amount)
+
+    async def update_transaction(self, transaction_id, amount):
+        return await self._run(self.service.update_transaction, transaction_id, amount)
+
+    async def delete_transaction(self, transaction_id):
+        return await self._run(self.service.delete_transaction, transaction_id)
+
+    async def search_transaction(self, user_id):
+        return await self._run(self.service.search_transaction, user_id)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
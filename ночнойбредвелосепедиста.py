@@ -1,127 +1,66 @@
+# Интерактивный фронтенд магазина: меню ролей поверх ядра из velomagazin.py.
+# Здесь только ввод, вывод и обработка ошибок ядра; бизнес-логика и SQL живут в ядре.
 import sqlite3
-import hashlib
-from datetime import datetime
-
-class velomagazin:
-    def __init__(self):
-        # Подключение к базе данных
-        self.conn = sqlite3.connect('bikeshop.db')
-        self.cursor = self.conn.cursor()
-        # Создание таблиц при инициализации
-        self.create_tables()
-
-    def create_tables(self):
-        # Создание таблиц, если они не существуют
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Пользователи (
-                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE,
-                password TEXT
-            )
-        ''')
-
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Велосипеды (
-                bike_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                model TEXT,
-                brand TEXT,
-                price REAL,
-                quantity INTEGER
-            )
-        ''')
-
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Запчасти (
-                part_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                category TEXT,
-                price REAL,
-                quantity INTEGER
-            )
-        ''')
-
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS Заказы (
-                order_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                order_date TEXT,
-                FOREIGN KEY (user_id) REFERENCES Пользователи(user_id)
-            )
-        ''')
-
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ДеталиЗаказа (
-                order_detail_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                order_id INTEGER,
-                item_id INTEGER,
-                item_type TEXT,  -- 'Велосипед' или 'Запчасть'
-                quantity INTEGER,
-                FOREIGN KEY (order_id) REFERENCES Заказы(order_id)
-            )
-        ''')
-
-        self.conn.commit()
+
+import velomagazin as core
+from velomagazin import ITEM_TABLES, HoldExpiryScheduler, ShopError, NotFoundError, format_rubles, to_kopecks
+from analytics import SalesAnalytics
+from ledger import LedgerReconciler
+from replenishment import ReplenishmentReport
+
+def format_amount(kopecks):
+    # Сумма для вывода; None (нет проводки, цена не записана) - прочерк
+    return '-' if kopecks is None else format_rubles(kopecks)
+
+
+class velomagazin(core.velomagazin):
+    def show_pages(self, pages, format_row, page_size=None):
+        # Вывод страниц в меню: после каждой полной страницы - запрос на продолжение; возвращает число строк
+        page_size = page_size or self.page_size
+        shown = 0
+        for page in pages:
+            for row in page:
+                print(format_row(row))
+            shown += len(page)
+            if len(page) == page_size and input("Enter - следующая страница, 0 - закончить: ") == "0":
+                break
+        return shown
 
     def register_user(self, username, password):
         # Регистрация пользователя
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
         try:
-            self.cursor.execute('INSERT INTO Пользователи (username, password) VALUES (?, ?)', (username, hashed_password))
-            self.conn.commit()
+            self.create_user(username, password)
             print("Регистрация успешна")
-        except sqlite3.IntegrityError:
-            print("Пользователь с таким именем уже существует")
+        except ShopError as e:
+            print(e)
 
     def login_user(self, username, password):
-        # Авторизация пользователя
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        self.cursor.execute('SELECT * FROM Пользователи WHERE username=? AND password=?', (username, hashed_password))
-        user = self.cursor.fetchone()
-        if user:
+        # Авторизация пользователя; возвращает токен сеанса или None
+        try:
+            session = self.login(username, password)
             print("Вход выполнен успешно.")
-            self.current_user_id = user[0]
-        else:
-            print("Неверное имя пользователя или пароль.")
+            return session.token
+        except ShopError as e:
+            print(e)
 
-    def add_bike(self, model, brand, price, quantity):
-        # Добавление велосипеда в инвентарь
+    def prompt_add_bike(self, model, brand, price, quantity):
+        # Добавление велосипеда в инвентарь с сообщением об итоге
         try:
-            self.cursor.execute('INSERT INTO Велосипеды (model, brand, price, quantity) VALUES (?, ?, ?, ?)',
-                                (model, brand, price, quantity))
-            self.conn.commit()
+            bike_id = self.add_bike(model, brand, price, quantity)
             print("Велосипед успешно добавлен")
-        except sqlite3.Error as e:
+            return bike_id
+        except (ShopError, sqlite3.Error) as e:
             print(f"Ошибка при добавлении велосипеда: {e}")
 
-    def add_bike_part(self, name, category, price, quantity):
-        # Добавление запчасти в инвентарь
+    def prompt_add_bike_part(self, name, category, price, quantity):
+        # Добавление запчасти в инвентарь с сообщением об итоге
         try:
-            self.cursor.execute('INSERT INTO Запчасти (name, category, price, quantity) VALUES (?, ?, ?, ?)',
-                                (name, category, price, quantity))
-            self.conn.commit()
+            part_id = self.add_bike_part(name, category, price, quantity)
             print("Запчасть успешно добавлена")
-        except sqlite3.Error as e:
+            return part_id
+        except (ShopError, sqlite3.Error) as e:
             print(f"Ошибка при добавлении запчасти: {e}")
 
-    def place_order(self, user_id, items):
-        # Оформление заказа
-        try:
-            order_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            self.cursor.execute('INSERT INTO Заказы (user_id, order_date) VALUES (?, ?)', (user_id, order_date))
-            order_id = self.cursor.lastrowid
-
-            for item_id, item_type, quantity in items:
-                self.cursor.execute('INSERT INTO ДеталиЗаказа (order_id, item_id, item_type, quantity) VALUES (?, ?, ?, ?)',
-                                    (order_id, item_id, item_type, quantity))
-            
-            self.conn.commit()
-            print("Заказ успешно оформлен")
-        except sqlite3.Error as e:
-            print(f"Ошибка при оформлении заказа: {e}")
-
-    def close_connection(self):
-        # Закрытие соединения с базой данных
-        self.conn.close()
 
 # Пример использования
 # if __name__ == "__main__":
@@ -210,7 +149,6 @@ class velomagazin:
 #         else:
 #             print("Неверный выбор. Пожалуйста, выберите существующий пункт меню.")
 
-
     def manage_users(self):
         while True:
             print("\n--- Меню администратора ---")
@@ -219,19 +157,15 @@ class velomagazin:
             print("3. Изменить пользователя")
             print("4. Удалить пользователя")
             print("5. Поиск пользователя")
+            print("6. Статистика запросов SQL")
             print("0. Вернуться в главное меню")
 
             choice = input("Выберите действие: ")
 
             if choice == "1":
                 print("Список пользователей:")
-                with self.conn:
-                    cursor = self.conn.cursor()
-                    cursor.execute("SELECT * FROM Пользователи")
-                    users = cursor.fetchall()
-
-                    for user_id, username, password in users:
-                        print(f"{user_id}. {username}")
+                self.show_pages(self.iter_pages('Пользователи', ('user_id', 'username')),
+                                lambda user: f"{user[0]}. {user[1]}")
 
                 input("Нажмите Enter для продолжения...")
 
@@ -239,88 +173,72 @@ class velomagazin:
                 username = input("Введите имя пользователя: ")
                 password = input("Введите пароль: ")
 
-                with self.conn:
-                    cursor = self.conn.cursor()
-                    cursor.execute("SELECT MAX(user_id) FROM Пользователи")
-                    max_user_id = cursor.fetchone()[0]
-                    user_id = max_user_id + 1 if max_user_id is not None else 1
-
-                    # Вставка данных в таблицу Пользователи
-                    cursor.execute("INSERT INTO Пользователи (user_id, username, password) VALUES (?, ?, ?)", (user_id, username, password))
-
-                print("Пользователь успешно добавлен")
+                try:
+                    self.create_user(username, password)
+                    print("Пользователь успешно добавлен")
+                except ShopError as e:
+                    print(e)
 
             elif choice == "3":
                 user_id = input("Введите ID пользователя для изменения: ")
-                with self.conn:
-                    cursor = self.conn.cursor()
-                    cursor.execute("SELECT * FROM Пользователи WHERE user_id=?", (user_id,))
-                    existing_user = cursor.fetchone()
-
-                if existing_user:
+                try:
+                    self.get_user(user_id)
                     new_username = input("Введите новое имя пользователя: ")
                     new_password = input("Введите новый пароль: ")
 
                     # Изменение данных пользователя
-                    with self.conn:
-                        cursor = self.conn.cursor()
-                        cursor.execute("UPDATE Пользователи SET username=?, password=? WHERE user_id=?", (new_username, new_password, user_id))
-
+                    self.update_user(user_id, new_username, new_password)
                     print("Пользователь успешно изменен")
-                else:
-                    print("Пользователь с указанным ID не найден")
+                except ShopError as e:
+                    print(e)
 
             elif choice == "4":
                 user_id = input("Введите ID пользователя для удаления: ")
 
-                with self.conn:
-                    cursor = self.conn.cursor()
-                    cursor.execute("SELECT * FROM Пользователи WHERE user_id=?", (user_id,))
-                    existing_user = cursor.fetchone()
-
-                if existing_user:
-                    # Удаление пользователя
-                    with self.conn:
-                        cursor = self.conn.cursor()
-                        cursor.execute("DELETE FROM Пользователи WHERE user_id=?", (user_id,))
-
+                try:
+                    self.delete_user(user_id)
                     print("Пользователь успешно удален")
-                else:
-                    print("Пользователь с указанным ID не найден")
+                except NotFoundError as e:
+                    print(e)
 
             elif choice == "5":
-                search_attribute = input("Выберите атрибут для поиска (username, password): ")
-                search_value = input(f"Введите значение {search_attribute} для поиска: ")
+                search_value = input("Введите часть имени пользователя для поиска: ")
 
-                # Поиск пользователя
-                with self.conn:
-                    cursor = self.conn.cursor()
-                    cursor.execute(f"SELECT * FROM Пользователи WHERE {search_attribute} LIKE ?", ('%' + search_value + '%',))
-                    found_users = cursor.fetchall()
+                # Поиск пользователя по полнотекстовому индексу имён
+                found_users = self.search_users(search_value, page_size=100)
 
                 if found_users:
                     print("Найденные пользователи:")
-                    for user_id, username, password in found_users:
+                    for user_id, username in found_users:
                         print(f"{user_id}. {username}")
                 else:
                     print("Пользователи по указанным критериям не найдены")
 
+            elif choice == "6":
+                self.show_query_metrics()
+
             elif choice == "0":
                 break
 
             else:
                 print("Неверный выбор. Пожалуйста, выберите существующий пункт меню.")
-    def save_to_database(self, data, table_name):
-        # Общий метод для сохранения данных в базу данных
-        columns = ', '.join(data.keys())
-        placeholders = ', '.join('?' for _ in data.values())
-        values = tuple(data.values())
 
-        query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+    def show_query_metrics(self):
+        # Самые затратные запросы и медленные инструкции; метрики включаются при первом обращении,
+        # если не включены переменной окружения VELOMAGAZIN_SLOW_MS
+        if self.metrics is None:
+            self.instrument()
+            print("Сбор метрик SQL включён, статистика появится по мере работы")
+            return
+        print(self.metrics.report())
+        path = input("Файл для выгрузки (.txt, .json или .prom; Enter - не выгружать): ")
+        if path:
+            try:
+                count = self.metrics.export(path)
+                print(f"Выгружено инструкций: {count}")
+            except OSError as e:
+                print(f"Не удалось записать файл: {e}")
 
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute(query, values)
     def manage_staff(self):
             while True:
                 print("\n--- Меню менеджера персонала ---")
@@ -347,65 +265,40 @@ class velomagazin:
 
     def view_all_staff(self):
             print("Список сотрудников:")
-            with self.conn:
-                cursor = self.conn.cursor()
-                cursor.execute("SELECT * FROM Сотрудники")
-                staff = cursor.fetchall()
-
-                for staff_id, staff_name in staff:
-                    print(f"{staff_id}. {staff_name}")
+            self.show_pages(self.iter_pages('Сотрудники', ('staff_id', 'staff_name'), order_by='staff_name'),
+                            lambda staff: f"{staff[0]}. {staff[1]}")
 
             input("Нажмите Enter для продолжения...")
 
     def add_staff(self):
             staff_name = input("Введите имя сотрудника: ")
 
-            with self.conn:
-                cursor = self.conn.cursor()
-                cursor.execute("SELECT MAX(staff_id) FROM Сотрудники")
-                max_staff_id = cursor.fetchone()[0]
-                staff_id = max_staff_id + 1 if max_staff_id is not None else 1
-
-                # Вставка данных в таблицу Сотрудники
-                cursor.execute("INSERT INTO Сотрудники (staff_id, staff_name) VALUES (?, ?)", (staff_id, staff_name))
-
-            print("Сотрудник успешно добавлен")
+            try:
+                self.create_staff(staff_name)
+                print("Сотрудник успешно добавлен")
+            except ShopError as e:
+                print(e)
 
     def modify_staff(self):
             staff_id = input("Введите ID сотрудника для изменения: ")
-            with self.conn:
-                cursor = self.conn.cursor()
-                cursor.execute("SELECT * FROM Сотрудники WHERE staff_id=?", (staff_id,))
-                existing_staff = cursor.fetchone()
-
-            if existing_staff:
+            try:
+                self.get_staff(staff_id)
                 new_staff_name = input("Введите новое имя сотрудника: ")
 
                 # Изменение данных сотрудника
-                with self.conn:
-                    cursor = self.conn.cursor()
-                    cursor.execute("UPDATE Сотрудники SET staff_name=? WHERE staff_id=?", (new_staff_name, staff_id))
-
+                self.rename_staff(staff_id, new_staff_name)
                 print("Сотрудник успешно изменен")
-            else:
-                print("Сотрудник с указанным ID не найден")
+            except ShopError as e:
+                print(e)
+
     def delete_staff(self):
             staff_id = input("Введите ID сотрудника для удаления: ")
 
-            with self.conn:
-                cursor = self.conn.cursor()
-                cursor.execute("SELECT * FROM Сотрудники WHERE staff_id=?", (staff_id,))
-                existing_staff = cursor.fetchone()
-
-            if existing_staff:
-                # Удаление сотрудника
-                with self.conn:
-                    cursor = self.conn.cursor()
-                    cursor.execute("DELETE FROM Сотрудники WHERE staff_id=?", (staff_id,))
-
+            try:
+                self.remove_staff(staff_id)
                 print("Сотрудник успешно удален")
-            else:
-                print("Сотрудник с указанным ID не найден")
+            except NotFoundError as e:
+                print(e)
 
     def manage_inventory(self):
         while True:
@@ -417,19 +310,23 @@ class velomagazin:
             print("5. Изменить товар")
             print("6. Удалить товар")
             print("7. Поиск товара")
+            print("8. Товары на дозаказ")
+            print("9. Установить порог дозаказа")
+            print("10. Отчёт о пополнении (CSV/JSONL)")
+            print("11. Переоценка")
             print("0. Вернуться в главное меню")
 
             choice = input("Выберите действие: ")
 
             if choice == "1":
-                bikes = self.load_from_database('Велосипеды')
+                bikes = self.load_from_database('Велосипеды', ('brand', 'model', 'price', 'quantity'))
                 print("Список велосипедов:")
                 for bike_id, bike_data in bikes:
-                    print(f"{bike_id}. {bike_data['brand']} {bike_data['model']} ({bike_data['price']} руб.) - В наличии: {bike_data['quantity']} шт.")
+                    print(f"{bike_id}. {bike_data['brand']} {bike_data['model']} ({format_rubles(bike_data['price'])} руб.) - В наличии: {bike_data['quantity']} шт.")
                 input("Нажмите Enter для продолжения...")
 
             elif choice == "2":
-                parts = self.load_from_database('Запчасти')
+                parts = self.load_from_database('Запчасти', ('name', 'category', 'quantity'))
                 print("Список запчастей:")
                 for part_id, part_data in parts:
                     print(f"{part_id}. {part_data['name']} ({part_data['category']}) - В наличии: {part_data['quantity']} шт.")
@@ -438,18 +335,24 @@ class velomagazin:
             elif choice == "3":
                 model = input("Введите модель велосипеда: ")
                 brand = input("Введите бренд велосипеда: ")
-                price = float(input("Введите цену велосипеда: "))
+                price = to_kopecks(input("Введите цену велосипеда: "))
                 quantity = int(input("Введите количество: "))
-                self.save_bike_to_database(model, brand, price, quantity)
-                print("Велосипед успешно добавлен")
+                try:
+                    self.save_bike_to_database(model, brand, price, quantity)
+                    print("Велосипед успешно добавлен")
+                except ShopError as e:
+                    print(e)
 
             elif choice == "4":
                 name = input("Введите название запчасти: ")
                 category = input("Введите категорию: ")
-                price = float(input("Введите цену запчасти: "))
+                price = to_kopecks(input("Введите цену запчасти: "))
                 quantity = int(input("Введите количество: "))
-                self.save_part_to_database(name, category, price, quantity)
-                print("Запчасть успешно добавлена")
+                try:
+                    self.save_part_to_database(name, category, price, quantity)
+                    print("Запчасть успешно добавлена")
+                except ShopError as e:
+                    print(e)
 
             elif choice == "5":
                 self.modify_item()
@@ -460,93 +363,69 @@ class velomagazin:
             elif choice == "7":
                 self.search_item()
 
+            elif choice == "8":
+                self.show_low_stock()
+
+            elif choice == "9":
+                self.set_item_reorder_level()
+
+            elif choice == "10":
+                self.export_replenishment()
+
+            elif choice == "11":
+                self.reprice_items()
+
             elif choice == "0":
                 break
 
             else:
                 print("Неверный выбор. Пожалуйста, выберите существующий пункт меню.")
 
-    def save_bike_to_database(self, model, brand, price, quantity):
-        # Метод для сохранения данных о велосипеде в базу данных
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                INSERT INTO Велосипеды (model, brand, price, quantity)
-                VALUES (?, ?, ?, ?)
-            """, (model, brand, price, quantity))
-
-    def save_part_to_database(self, name, category, price, quantity):
-        # Метод для сохранения данных о запчасти в базу данных
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                INSERT INTO Запчасти (name, category, price, quantity)
-                VALUES (?, ?, ?, ?)
-            """, (name, category, price, quantity))
-
-        def modify_item(self):
-            item_id = input("Введите ID товара для изменения: ")
-            item_type = input("Введите тип товара (Велосипед/Запчасть): ").capitalize()
-            
-            if item_type == "Велосипед":
-                bikes = self.load_from_database('Велосипеды')
-                if any(item[0] == item_id for item in bikes):
-                    self.modify_bike_in_database(item_id)
-                else:
-                    print("Велосипед с указанным ID не найден")
-            elif item_type == "Запчасть":
-                parts = self.load_from_database('Запчасти')
-                if any(item[0] == item_id for item in parts):
-                    self.modify_part_in_database(item_id)
-                else:
-                    print("Запчасть с указанным ID не найдена")
-            else:
-                print("Неверный тип товара. Допустимые значения: 'Велосипед' или 'Запчасть'.")
+    def modify_item(self):
+        item_id = int(input("Введите ID товара для изменения: "))
+        item_type = input("Введите тип товара (Велосипед/Запчасть): ").capitalize()
 
-    def modify_bike_in_database(self, bike_id):
-        # Метод для изменения данных о велосипеде в базе данных
-        with self.conn:
-            cursor = self.conn.cursor()
-            new_model = input("Введите новую модель велосипеда: ")
-            new_brand = input("Введите новый бренд велосипеда: ")
-            new_price = float(input("Введите новую цену велосипеда: "))
-            new_quantity = int(input("Введите новое количество: "))
-            cursor.execute("""
-                UPDATE Велосипеды
-                SET model=?, brand=?, price=?, quantity=?
-                WHERE bike_id=?
-            """, (new_model, new_brand, new_price, new_quantity, bike_id))
-        print("Велосипед успешно изменен")
-
-    def modify_part_in_database(self, part_id):
-        # Метод для изменения данных о запчасти в базе данных
-        with self.conn:
-            cursor = self.conn.cursor()
-            new_name = input("Введите новое название запчасти: ")
-            new_category = input("Введите новую категорию: ")
-            new_price = float(input("Введите новую цену запчасти: "))
-            new_quantity = int(input("Введите новое количество: "))
-            cursor.execute("""
-                UPDATE Запчасти
-                SET name=?, category=?, price=?, quantity=?
-                WHERE part_id=?
-            """, (new_name, new_category, new_price, new_quantity, part_id))
-        print("Запчасть успешно изменена")
+        if item_type == "Велосипед":
+            if self.get_item('Велосипед', item_id) is not None:
+                new_model = input("Введите новую модель велосипеда: ")
+                new_brand = input("Введите новый бренд велосипеда: ")
+                new_price = to_kopecks(input("Введите новую цену велосипеда: "))
+                new_quantity = int(input("Введите новое количество: "))
+                try:
+                    self.modify_bike_in_database(item_id, new_model, new_brand, new_price, new_quantity)
+                    print("Велосипед успешно изменен")
+                except ShopError as e:
+                    print(e)
+            else:
+                print("Велосипед с указанным ID не найден")
+        elif item_type == "Запчасть":
+            if self.get_item('Запчасть', item_id) is not None:
+                new_name = input("Введите новое название запчасти: ")
+                new_category = input("Введите новую категорию: ")
+                new_price = to_kopecks(input("Введите новую цену запчасти: "))
+                new_quantity = int(input("Введите новое количество: "))
+                try:
+                    self.modify_part_in_database(item_id, new_name, new_category, new_price, new_quantity)
+                    print("Запчасть успешно изменена")
+                except ShopError as e:
+                    print(e)
+            else:
+                print("Запчасть с указанным ID не найдена")
+        else:
+            print("Неверный тип товара. Допустимые значения: 'Велосипед' или 'Запчасть'.")
 
     def delete_item(self):
-        item_id = input("Введите ID товара для удаления: ")
+        item_id = int(input("Введите ID товара для удаления: "))
         item_type = input("Введите тип товара (Велосипед/Запчасть): ").capitalize()
 
         if item_type == "Велосипед":
-            bikes = self.load_from_database('Велосипеды')
-            if any(item[0] == item_id for item in bikes):
+            if self.get_item('Велосипед', item_id) is not None:
                 self.delete_bike_from_database(item_id)
                 print("Велосипед успешно удален")
             else:
                 print("Велосипед с указанным ID не найден")
         elif item_type == "Запчасть":
-            parts = self.load_from_database('Запчасти')
-            if any(item[0] == item_id for item in parts):
+            if self.get_item('Запчасть', item_id) is not None:
                 self.delete_part_from_database(item_id)
                 print("Запчасть успешно удалена")
             else:
@@ -554,52 +433,30 @@ class velomagazin:
         else:
             print("Неверный тип товара. Допустимые значения: 'Велосипед' или 'Запчасть'.")
 
-    def delete_bike_from_database(self, bike_id):
-        # Метод для удаления данных о велосипеде из базы данных
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM Велосипеды WHERE bike_id=?", (bike_id,))
-
-    def delete_part_from_database(self, part_id):
-        # Метод для удаления данных о запчасти из базы данных
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM Запчасти WHERE part_id=?", (part_id,))
-
     def search_item(self):
         search_attribute = input("Выберите атрибут для поиска (model, brand, name): ")
         search_value = input(f"Введите значение {search_attribute} для поиска: ")
         item_type = input("Введите тип товара (Велосипед/Запчасть): ").capitalize()
 
-        if item_type == "Велосипед":
-            found_items = self.search_bikes_in_database(search_attribute, search_value)
-        elif item_type == "Запчасть":
-            found_items = self.search_parts_in_database(search_attribute, search_value)
-        else:
-            print("Неверный тип товара. Допустимые значения: 'Велосипед' или 'Запчасть'.")
+        try:
+            if item_type == "Велосипед":
+                found_items = self.search_bikes_in_database(search_attribute, search_value)
+            elif item_type == "Запчасть":
+                found_items = self.search_parts_in_database(search_attribute, search_value)
+            else:
+                print("Неверный тип товара. Допустимые значения: 'Велосипед' или 'Запчасть'.")
+                return
+        except ShopError as e:
+            print(e)
             return
 
         if found_items:
             print(f"Найденные товары ({item_type}):")
-            for item_id, item_data in found_items:
-                print(f"{item_id}. {item_data['brand']} {item_data['model']} ({item_data['name']}) - В наличии: {item_data['quantity']} шт.")
+            for item in found_items:
+                print(f"{item.item_id}. {item.title} ({item.subtitle}) - В наличии: {item.quantity} шт.")
         else:
             print(f"Товары ({item_type}) по указанным критериям не найдены")
 
-    def search_bikes_in_database(self, search_attribute, search_value):
-        # Метод для поиска велосипедов в базе данных
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute(f"SELECT * FROM Велосипеды WHERE {search_attribute}=?", (search_value,))
-            return cursor.fetchall()
-
-    def search_parts_in_database(self, search_attribute, search_value):
-        # Метод для поиска запчастей в базе данных
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute(f"SELECT * FROM Запчасти WHERE {search_attribute}=?", (search_value,))
-            return cursor.fetchall()
-        
     def cashier_operations(self):
         while True:
             print("\n--- Меню кассира ---")
@@ -622,64 +479,59 @@ class velomagazin:
                 print("Неверный выбор. Пожалуйста, выберите существующий пункт меню.")
 
     def view_inventory(self):
-            with self.conn:
-                cursor = self.conn.cursor()
-
-                # Получаем список велосипедов на складе
-                cursor.execute("SELECT * FROM Велосипеды")
-                bikes = cursor.fetchall()
+            # Список велосипедов на складе, постранично
+            print("Список велосипедов на складе:")
+            self.show_pages(self.iter_pages('Велосипеды', ('bike_id', 'brand', 'model', 'price', 'quantity')),
+                            lambda bike: f"{bike[0]}. {bike[1]} {bike[2]} ({format_rubles(bike[3])} руб.) - В наличии: {bike[4]} шт.")
 
-                print("Список велосипедов на складе:")
-                for bike_id, brand, model, price, quantity in bikes:
-                    print(f"{bike_id}. {brand} {model} ({price} руб.) - В наличии: {quantity} шт.")
-
-                # Получаем список запчастей на складе
-                cursor.execute("SELECT * FROM Запчасти")
-                parts = cursor.fetchall()
-
-                print("\nСписок запчастей на складе:")
-                for part_id, name, category, price, quantity in parts:
-                    print(f"{part_id}. {name} ({category}) - В наличии: {quantity} шт.")
+            # Список запчастей на складе, постранично
+            print("\nСписок запчастей на складе:")
+            self.show_pages(self.iter_pages('Запчасти', ('part_id', 'name', 'category', 'quantity')),
+                            lambda part: f"{part[0]}. {part[1]} ({part[2]}) - В наличии: {part[3]} шт.")
 
     def process_order(self):
         user_id = int(input("Введите ID пользователя: "))
         items = []
+        # Набранные позиции бронируются, пока кассир вводит заказ, и не уйдут другому кассиру
+        hold_id = self.new_hold()
 
-        while True:
-            item_type = input("Введите тип товара (Велосипед/Запчасть) или 'done' для завершения: ").capitalize()
-            if item_type == 'Done':
-                break
-
-            inventory_type = 'Велосипеды' if item_type == 'Велосипед' else 'Запчасти'
-            self.view_inventory()
+        try:
+            while True:
+                item_type = input("Введите тип товара (Велосипед/Запчасть) или 'done' для завершения: ").capitalize()
+                if item_type == 'Done':
+                    break
 
-            item_id = int(input("Введите ID товара: "))
-            quantity = int(input("Введите количество: "))
+                if item_type not in ITEM_TABLES:
+                    print("Неверный тип товара. Допустимые значения: 'Велосипед' или 'Запчасть'.")
+                    continue
+
+                # Карточка товара берётся из кэша каталога, а не перечитыванием всего склада
+                item_id = int(input("Введите ID товара: "))
+                item = self.get_item(item_type, item_id)
+                if item is None:
+                    print("Товар с указанным ID не найден.")
+                    continue
+                available = self.available_quantities(item_type, [item_id], hold_id)[item_id]
+                print(f"{item[1]} ({item[2]}), цена: {format_rubles(item[3])} руб., доступно: {available} шт.")
+                quantity = int(input("Введите количество: "))
 
-            if self.check_availability_in_database(item_id, item_type, quantity):
-                items.append((item_id, item_type, quantity))
-            else:
-                print("Выбранного товара в указанном количестве нет на складе. Попробуйте снова.")
+                try:
+                    self.reserve(hold_id, item_id, item_type, quantity)
+                    items.append((item_id, item_type, quantity))
+                except ShopError as e:
+                    print(f"{e}. Попробуйте снова.")
 
             # Оформление заказа с использованием данных из базы данных
-            self.complete_order(user_id, items)
-        # Можете вызвать соответствующий метод для сохранения заказа в базе данных
-
-    def check_availability_in_database(self, item_id, item_type, quantity):
-        # Метод для проверки наличия выбранного товара в указанном количестве в базе данных
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute(f"SELECT quantity FROM {item_type} WHERE {item_type[:-1]}_id=?", (item_id,))
-            available_quantity = cursor.fetchone()[0]
-            return available_quantity >= quantity
-            self.complete_order(user_id, items)
+            if items:
+                self.complete_order(user_id, items, hold_id)
+        finally:
+            # Брони неоформленного заказа снимаются сразу, не дожидаясь истечения срока
+            self.release_hold(hold_id)
 
     def view_items(self, inventory_type):
         # Метод для просмотра товаров на складе из базы данных
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute(f"SELECT * FROM {inventory_type}")
-            items = cursor.fetchall()
+        columns = ('brand', 'model', 'quantity') if inventory_type == 'Велосипеды' else ('name', 'quantity')
+        items = self.load_from_database(inventory_type, columns)
 
         print(f"\n--- {inventory_type.capitalize()} на складе ---")
         for item_id, item_data in items:
@@ -688,50 +540,19 @@ class velomagazin:
             elif inventory_type == 'Запчасти':
                 print(f"{item_id}. {item_data['name']} - В наличии: {item_data['quantity']} шт.")
 
-        def check_availability(self, item_id, item_type, quantity):
-            inventory_type = 'Велосипеды' if item_type == 'Велосипед' else 'Запчасти'
+    def complete_order(self, user_id, items, hold_id=None):
+        order_id, order_total, failures = self.checkout(user_id, items, hold_id)
 
-            with self.conn:
-                cursor = self.conn.cursor()
-                cursor.execute(f"SELECT quantity FROM {inventory_type} WHERE {inventory_type[:-1]}_id=?", (item_id,))
-                result = cursor.fetchone()
-
-            if result and result[0] >= quantity:
-                return True
-            else:
-                return False
-
-    def complete_order(self, user_id, items):
-        order_total = 0
-
-        for item_id, item_type, quantity in items:
-            inventory_type = 'Велосипеды' if item_type == 'Велосипед' else 'Запчасти'
-
-            with self.conn:
-                cursor = self.conn.cursor()
-                cursor.execute(f"SELECT price, quantity FROM {inventory_type} WHERE {inventory_type[:-1]}_id=?", (item_id,))
-                result = cursor.fetchone()
-
-            if result:
-                item_price, available_quantity = result
-                item_total = item_price * quantity
-                order_total += item_total
-
-                with self.conn:
-                    cursor = self.conn.cursor()
-                    cursor.execute(f"UPDATE {inventory_type} SET quantity=? WHERE {inventory_type[:-1]}_id=?", (available_quantity - quantity, item_id))
-
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("INSERT INTO Заказы (user_id, order_date) VALUES (?, ?)", (user_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-            order_id = cursor.lastrowid
-
-            for item_id, item_type, quantity in items:
-                inventory_type = 'Велосипеды' if item_type == 'Велосипед' else 'Запчасти'
-                cursor.execute("INSERT INTO ДеталиЗаказа (order_id, item_id, item_type, quantity) VALUES (?, ?, ?, ?)", (order_id, item_id, item_type, quantity))
+        if order_id is None:
+            print("Заказ не оформлен:" if failures else "Заказ не оформлен: нет позиций.")
+            for item_id, item_type, quantity, reason in failures:
+                print(f"  {item_type} {item_id} x {quantity}: {reason}")
+            return None
 
         print("Заказ успешно оформлен")
-        print(f"Общая сумма заказа: {order_total} руб.")
+        print(f"Общая сумма заказа: {format_rubles(order_total)} руб.")
+        return order_id
+
     def accountant_operations(self):
         while True:
             print("\n--- Меню бухгалтера ---")
@@ -740,6 +561,8 @@ class velomagazin:
             print("3. Изменить транзакцию")
             print("4. Удалить транзакцию")
             print("5. Поиск транзакции")
+            print("6. Отчёт о продажах")
+            print("7. Сверка заказов и проводок")
             print("0. Вернуться в главное меню")
 
             choice = input("Выберите действие: ")
@@ -759,6 +582,12 @@ class velomagazin:
             elif choice == "5":
                 self.search_transaction()
 
+            elif choice == "6":
+                self.sales_report()
+
+            elif choice == "7":
+                self.reconcile_ledger()
+
             elif choice == "0":
                 break
 
@@ -766,63 +595,144 @@ class velomagazin:
                 print("Неверный выбор. Пожалуйста, выберите существующий пункт меню.")
 
     def view_transactions(self):
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM Транзакции")
-            transactions = cursor.fetchall()
-
         print("\n--- Все транзакции ---")
-        for transaction_id, user_id, amount, transaction_date in transactions:
-            print(f"{transaction_id}. Пользователь {user_id}, Сумма: {amount} руб., Дата: {transaction_date}")
+        self.show_pages(self.iter_pages('Транзакции', ('transaction_id', 'user_id', 'amount', 'transaction_date')),
+                        lambda t: f"{t[0]}. Пользователь {t[1]}, Сумма: {format_rubles(t[2])} руб., Дата: {t[3]}")
+
+    def show_low_stock(self):
+        # Список на дозаказ: товары с остатком не выше порога
+        items = self.low_stock()
+        if not items:
+            print("Товаров с низким остатком нет.")
+            return
+        for item_type in ITEM_TABLES:
+            titles = self.get_items(item_type, [item.item_id for item in items if item.item_type == item_type])
+            for item in items:
+                if item.item_type == item_type:
+                    title = titles[item.item_id].title if item.item_id in titles else '?'
+                    print(f"{item.item_type} {item.item_id}. {title} - В наличии: {item.quantity} шт., "
+                          f"порог {item.reorder_level} шт. (с {item.since})")
+        input("Нажмите Enter для продолжения...")
+
+    def set_item_reorder_level(self):
+        item_type = input("Введите тип товара (Велосипед/Запчасть): ")
+        item_id = int(input("Введите ID товара: "))
+        level = input("Введите порог дозаказа (пусто - не следить): ")
+        try:
+            self.set_reorder_level(item_type, item_id, int(level) if level else None)
+            print("Порог дозаказа установлен")
+        except ShopError as e:
+            print(e)
+
+    def reprice_items(self):
+        # Переоценка по правилу: сначала список изменений, запись - после подтверждения
+        percent = float(input("Изменение цены, % (например -10 для уценки): ") or 0)
+        markup = to_kopecks(input("Надбавка, руб. (пусто - 0): ") or 0)
+        brand = input("Только бренд велосипедов (пусто - без фильтра): ") or None
+        category = input("Только категория запчастей (пусто - без фильтра): ") or None
+        try:
+            changes = self.reprice(percent, markup, brand=brand, category=category, dry_run=True)
+        except ShopError as e:
+            print(e)
+            return
+        if not changes:
+            print("Цены не изменятся.")
+            return
+        for change in changes[:self.page_size]:
+            print(f"{change.item_type} {change.item_id}. {change.title}: "
+                  f"{format_rubles(change.old_price)} -> {format_rubles(change.new_price)} руб.")
+        if len(changes) > self.page_size:
+            print(f"... и ещё {len(changes) - self.page_size}")
+        if input(f"Изменить цены {len(changes)} товаров? (да/нет): ").lower() == 'да':
+            changed = self.reprice(percent, markup, brand=brand, category=category)
+            print(f"Цены изменены: {changed}")
+
+    def export_replenishment(self):
+        # Выгрузка отчёта о пополнении в файл; формат - по расширению
+        path = input("Файл отчёта (.csv или .jsonl): ")
+        window_days = int(input("Окно продаж, дней (пусто - 30): ") or 30)
+        written = ReplenishmentReport(self).export(path, window_days=window_days)
+        print(f"Записано строк: {written}")
+
+    def sales_report(self):
+        # Отчёт по сводкам продаж за период месяцев
+        start = input("Начальный месяц (ГГГГ-ММ, пусто - с начала): ") or None
+        end = input("Конечный месяц (ГГГГ-ММ, пусто - по сей день): ") or None
+        analytics = SalesAnalytics(self)
+        print("\n--- Продажи по месяцам ---")
+        for month in analytics.monthly(start, end):
+            print(f"{month.period}: заказов {month.orders}, товаров {month.units} шт., выручка {format_rubles(month.revenue)} руб.")
+        print("\n--- Лучшие товары ---")
+        for item in analytics.top_items(start, end):
+            print(f"{item.item_type} {item.item_id}: {item.units} шт., выручка {format_rubles(item.revenue)} руб.")
+        print("\n--- Лучшие покупатели ---")
+        for customer in analytics.top_customers(start, end):
+            print(f"Пользователь {customer.user_id}: заказов {customer.orders}, сумма {format_rubles(customer.revenue)} руб.")
+
+    def reconcile_ledger(self):
+        # Сверка проводок с заказами; уже сверенные месяцы без изменений пропускаются
+        force = input("Пересверить все месяцы заново? (да/нет): ").lower() == 'да'
+        report = LedgerReconciler(self).reconcile(force=force)
+        print(f"Сверено месяцев: {len(report.checked)}, пропущено без изменений: {len(report.skipped)}, "
+              f"заказов: {report.orders}")
+        for mismatch in report.mismatches:
+            print(f"{mismatch.period}, заказ {mismatch.order_id}: {mismatch.reason} "
+                  f"(по заказу {format_amount(mismatch.expected)} руб., проведено {format_amount(mismatch.posted)} руб.)")
+        if not report.mismatches:
+            print("Расхождений нет.")
 
     def add_transaction(self):
         user_id = int(input("Введите ID пользователя: "))
-        amount = float(input("Введите сумму транзакции: "))
+        amount = to_kopecks(input("Введите сумму транзакции: "))
 
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("INSERT INTO Транзакции (user_id, amount, transaction_date) VALUES (?, ?, ?)",
-                        (user_id, amount, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-            print("Транзакция успешно добавлена")
+        self.create_transaction(user_id, amount)
+        print("Транзакция успешно добавлена")
 
     def update_transaction(self):
         transaction_id = int(input("Введите ID транзакции для изменения: "))
-        new_amount = float(input("Введите новую сумму транзакции: "))
+        new_amount = to_kopecks(input("Введите новую сумму транзакции: "))
 
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("UPDATE Транзакции SET amount=? WHERE transaction_id=?", (new_amount, transaction_id))
+        try:
+            self.set_transaction_amount(transaction_id, new_amount)
             print("Транзакция успешно изменена")
+        except NotFoundError as e:
+            print(e)
 
     def delete_transaction(self):
         transaction_id = int(input("Введите ID транзакции для удаления: "))
 
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("DELETE FROM Транзакции WHERE transaction_id=?", (transaction_id,))
+        try:
+            self.remove_transaction(transaction_id)
             print("Транзакция успешно удалена")
+        except NotFoundError as e:
+            print(e)
 
     def search_transaction(self):
         search_user_id = int(input("Введите ID пользователя для поиска транзакции: "))
 
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM Транзакции WHERE user_id=?", (search_user_id,))
-            transactions = cursor.fetchall()
+        transactions = self.find_transactions(search_user_id)
 
         if transactions:
             print(f"\n--- Транзакции пользователя {search_user_id} ---")
             for transaction_id, user_id, amount, transaction_date in transactions:
-                print(f"{transaction_id}. Сумма: {amount} руб., Дата: {transaction_date}")
+                print(f"{transaction_id}. Сумма: {format_rubles(amount)} руб., Дата: {transaction_date}")
         else:
             print(f"Транзакции пользователя {search_user_id} не найдены")
+
     def user_menu(self):
+        # Сеанс клиента живёт только в этом меню: токен передаётся в операции явно
+        token = None
         while True:
             print("\n--- Меню пользователя ---")
             print("1. Просмотреть велосипеды в наличии")
             print("2. Просмотреть запчасти в наличии")
             print("3. Просмотреть свои заказы")
             print("4. Поиск товара")
+            if token is None:
+                print("5. Войти")
+                print("6. Зарегистрироваться")
+            else:
+                print("5. Выйти из учётной записи")
             print("0. Вернуться в главное меню")
 
             choice = input("Выберите действие: ")
@@ -832,103 +742,100 @@ class velomagazin:
             elif choice == "2":
                 self.view_parts()
             elif choice == "3":
-                self.view_orders()
+                self.view_orders(token)
             elif choice == "4":
                 self.search_items()
+            elif choice == "5" and token is None:
+                token = self.login_user(input("Имя пользователя: "), input("Пароль: "))
+            elif choice == "5":
+                self.logout(token)
+                token = None
+                print("Вы вышли из учётной записи.")
+            elif choice == "6" and token is None:
+                self.register_user(input("Имя пользователя: "), input("Пароль: "))
             elif choice == "0":
+                if token is not None:
+                    self.logout(token)
                 break
             else:
                 print("Некорректный выбор. Пожалуйста, введите корректный номер действия.")
 
     def view_bikes(self):
         print("\n--- Просмотр велосипедов в наличии ---")
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM Велосипеды WHERE quantity > 0")
-            available_bikes = cursor.fetchall()
-
-            if available_bikes:
-                print("Велосипеды в наличии:")
-                for bike_id, model, brand, price, quantity in available_bikes:
-                    print(f"{bike_id}. Модель: {model}, Бренд: {brand}, Цена: {price}, Количество: {quantity}")
-            else:
-                print("Велосипедов в наличии нет.")
+        print("Велосипеды в наличии:")
+        shown = self.show_pages(
+            self.iter_pages('Велосипеды', ('bike_id', 'model', 'brand', 'price', 'quantity'), {'quantity': ('>', 0)}),
+            lambda bike: f"{bike[0]}. Модель: {bike[1]}, Бренд: {bike[2]}, Цена: {format_rubles(bike[3])} руб., Количество: {bike[4]}")
+        if not shown:
+            print("Велосипедов в наличии нет.")
 
         input("Нажмите Enter для продолжения...")
-        pass
 
     def view_parts(self):
         print("\n--- Просмотр запчастей в наличии ---")
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM Запчасти WHERE quantity > 0")
-            available_parts = cursor.fetchall()
-
-            if available_parts:
-                print("Запчасти в наличии:")
-                for part_id, name, category, price, quantity in available_parts:
-                    print(f"{part_id}. Название: {name}, Категория: {category}, Цена: {price}, Количество: {quantity}")
-            else:
-                print("Запчастей в наличии нет.")
+        print("Запчасти в наличии:")
+        shown = self.show_pages(
+            self.iter_pages('Запчасти', ('part_id', 'name', 'category', 'price', 'quantity'), {'quantity': ('>', 0)}),
+            lambda part: f"{part[0]}. Название: {part[1]}, Категория: {part[2]}, Цена: {format_rubles(part[3])} руб., Количество: {part[4]}")
+        if not shown:
+            print("Запчастей в наличии нет.")
 
         input("Нажмите Enter для продолжения...")
-        pass
 
-    def view_orders(self):
-        if not self.current_user_id:
+    def format_order(self, order):
+        # Заказ со строками для вывода в меню
+        lines = [f"{order.order_id}. Дата заказа: {order.order_date}, сумма: {format_rubles(order.total)} руб."]
+        for line in order.lines:
+            lines.append(f"    {line.item_type} {line.item_id} {line.title or '(снят с продажи)'}: "
+                         f"{line.quantity} шт. x {format_amount(line.unit_price)} руб.")
+        return "\n".join(lines)
+
+    def view_orders(self, token):
+        if token is None:
             print("Пользователь не авторизован.")
             return
+        try:
+            user_id = self.session_user(token)
+        except ShopError as e:
+            print(e)
+            return
 
         print("\n--- Просмотр своих заказов ---")
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM Заказы WHERE user_id=?", (self.current_user_id,))
-            user_orders = cursor.fetchall()
-
-            if user_orders:
-                print("Ваши заказы:")
-                for order_id, _, order_date in user_orders:
-                    print(f"{order_id}. Дата заказа: {order_date}")
-            else:
-                print("У вас пока нет заказов.")
+        start = input("С даты (ГГГГ-ММ-ДД, пусто - за всё время): ") or None
+        end = input("По дату (ГГГГ-ММ-ДД, пусто - по сегодня): ") or None
+        shown = self.show_pages(self.iter_order_history(user_id, start, end), self.format_order)
+        if not shown:
+            print("У вас пока нет заказов.")
 
         input("Нажмите Enter для продолжения...")
 
-
-    def search_items(self):
+    def search_items(self, page_size=20):
         search_term = input("Введите ключевое слово для поиска товара: ")
 
         print("\n--- Поиск товара ---")
-        with self.conn:
-            cursor = self.conn.cursor()
-
-            # Поиск велосипедов
-            cursor.execute("SELECT * FROM Велосипеды WHERE model LIKE ? OR brand LIKE ?", ('%' + search_term + '%', '%' + search_term + '%'))
-            bikes = cursor.fetchall()
-
-            if bikes:
-                print("Найденные велосипеды:")
-                for bike_id, model, brand, price, quantity in bikes:
-                    print(f"{bike_id}. Модель: {model}, Бренд: {brand}, Цена: {price}, Количество: {quantity}")
-            else:
-                print("Велосипеды не найдены.")
+        page = 1
+        while True:
+            found_items = self.search_catalogue(search_term, page, page_size)
+            if not found_items:
+                print("Товары не найдены." if page == 1 else "Больше товаров не найдено.")
+                break
 
-            # Поиск запчастей
-            cursor.execute("SELECT * FROM Запчасти WHERE name LIKE ? OR category LIKE ?", ('%' + search_term + '%', '%' + search_term + '%'))
-            parts = cursor.fetchall()
+            for item_type, item_id, title, subtitle, price, quantity, _ in found_items:
+                if item_type == 'Велосипед':
+                    print(f"Велосипед {item_id}. Модель: {title}, Бренд: {subtitle}, Цена: {format_rubles(price)} руб., Количество: {quantity}")
+                else:
+                    print(f"Запчасть {item_id}. Название: {title}, Категория: {subtitle}, Цена: {format_rubles(price)} руб., Количество: {quantity}")
 
-            if parts:
-                print("Найденные запчасти:")
-                for part_id, name, category, price, quantity in parts:
-                    print(f"{part_id}. Название: {name}, Категория: {category}, Цена: {price}, Количество: {quantity}")
-            else:
-                print("Запчасти не найдены.")
+            if len(found_items) < page_size or input("Enter - следующая страница, 0 - закончить: ") == "0":
+                break
+            page += 1
 
         input("Нажмите Enter для продолжения...")
-        pass
 
 if __name__ == "__main__":
     velomagazin = velomagazin()
+    # Истёкшие брони кассиров удаляются в фоне, пока программа работает
+    holds = HoldExpiryScheduler(velomagazin.db_path).start()
     while True:
         print("\nВыберите роль:")
         print("1. Администратор")
@@ -954,6 +861,7 @@ if __name__ == "__main__":
         elif role_choice == "6":
             velomagazin.user_menu()  
         elif role_choice == "0":
+            holds.stop()
             velomagazin.close_connection()
             print("Выход из программы.")
             break